@@ -1,25 +1,108 @@
+from src.startup import startup_phase, mark_ready, mark_failed, get_startup_report # Primeiro import: marco zero do relatório de inicialização
 from fastapi import FastAPI
-from src.logger import configure_logging
-from routes import routes  # Importa o roteador definido em routes/routes.py
-from src.model_predict import load_model_for_api, load_scaler_for_api
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
+from src.logger import configure_logging, get_logging_stats
+with startup_phase('import:routes'):
+    from routes import routes  # Importa o roteador definido em routes/routes.py
+from src.model_predict import load_model_for_api, load_scaler_for_api, warm_up
+from src.prediction_batcher import get_prediction_batcher
+from src.data_fetcher import close_data_fetcher
+from src.prediction_cache import get_prediction_cache
+from src.forecast_store import get_forecast_store
+from src.model_registry import get_model_registry
+from src.profiler import get_slow_request_profiler
+from src import metrics, price_cache
+import asyncio
 import logging
+import os
+import time
+
+# Se '1', o servidor aceita conexões enquanto o modelo é carregado em segundo plano;
+# /ready responde 503 até o aquecimento terminar. Se '0' (padrão), a inicialização só termina com o modelo pronto.
+WARMUP_IN_BACKGROUND = os.getenv('WARMUP_IN_BACKGROUND', '0') == '1'
 
 app = FastAPI(title="Stock Price Forecaster API", description="API para prever preços de ações usando modelo LSTM")
 
 # Inclui as rotas definidas em routes/routes.py
 app.include_router(routes.router)
 
+_warmup_task = None
+
+# True quando o modelo foi carregado pelo processo principal antes de criar os workers (ver `src/server.py`)
+PRELOADED = False
+
+
+@app.middleware("http")
+async def metrics_middleware(request, call_next):
+    """Mede a duração de cada requisição por rota, método e status e, se PROFILE_SLOW_REQUESTS_MS
+    estiver configurado, grava o perfil de amostragem das requisições lentas.
+    """
+    profiler = get_slow_request_profiler()
+    started = profiler.begin() if profiler is not None else None
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        path = route.path if route is not None else 'desconhecida' # Rota, não a URL: evita uma série por parâmetro
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - start, path=path, method=request.method, status=status)
+        if profiler is not None:
+            await run_in_threadpool(profiler.end, started, f'{request.method} {path}')
+
+
+def load_and_warm_up():
+    """Carrega o scaler e o modelo e executa o aquecimento, registrando a duração de cada fase."""
+    try:
+        with startup_phase('load:scaler'):
+            load_scaler_for_api() # Carrega o scaler
+        with startup_phase('load:model'):
+            load_model_for_api() # Carrega o modelo
+        logging.info("Modelo e Scaler carregados com sucesso!")
+        with startup_phase('warmup'):
+            warm_up() # Primeira predição (fictícia) fora do caminho das requisições
+    except RuntimeError as e:
+        mark_failed(e)
+        raise
+    mark_ready()
+
+
+def preload():
+    """Carrega e aquece o modelo no processo atual antes de criar os workers (ver `src/server.py`).
+
+    Os workers criados depois por fork herdam o modelo já carregado e compartilham suas páginas de
+    memória com o processo principal, em vez de cada um carregar a sua cópia no startup.
+    """
+    global PRELOADED
+    load_and_warm_up()
+    PRELOADED = True
+
+
 @app.on_event("startup")
 async def startup_event():
     """Evento de inicialização da aplicação FastAPI.
     Carrega o modelo LSTM e o scaler ao iniciar a API.
     """
+    global _warmup_task
+
     configure_logging() # Configura o logging ao iniciar a aplicação
     logging.info("Iniciando a API...")
+
+    if PRELOADED:
+        logging.info("Modelo pré-carregado pelo processo principal; API pronta para receber requisições.")
+        return
+
+    if WARMUP_IN_BACKGROUND:
+        # O erro fica registrado no relatório de inicialização e /ready continua respondendo 503
+        _warmup_task = asyncio.get_running_loop().run_in_executor(None, load_and_warm_up)
+        logging.info("Carregando o modelo em segundo plano. Acompanhe o estado em /ready.")
+        return
+
     try:
-        load_scaler_for_api() # Carrega o scaler
-        load_model_for_api() # Carrega o modelo
-        logging.info("Modelo e Scaler carregados com sucesso!")
+        await run_in_threadpool(load_and_warm_up)
     except RuntimeError as e:
         logging.error(f"Erro durante a inicialização da API: {e}")
         # Em um cenário de produção, você poderia querer tratar esse erro de forma mais robusta,
@@ -29,6 +112,74 @@ async def startup_event():
     logging.info("API iniciada e pronta para receber requisições.")
 
 
+@app.get("/ready")
+async def readiness_endpoint():
+    """Endpoint de prontidão.
+    Responde 200 quando o modelo está carregado e aquecido e 503 enquanto isso não acontece,
+    junto com o relatório de inicialização (duração de cada fase).
+    """
+    report = get_startup_report()
+    return JSONResponse(status_code=200 if report['ready'] else 503, content=report)
+
+
+def collect_metrics():
+    """Lê os contadores mantidos pelos caches, pelo batcher e pelo registro de modelos para o /metrics."""
+    collected = {}
+
+    def add(name, kind, stats, fields, **labels):
+        samples = collected.setdefault(name, (kind, []))[1]
+        for field in fields:
+            samples.append((dict(labels, event=field) if len(fields) > 1 else labels, stats[field]))
+
+    cache = get_prediction_cache()
+    if cache is not None:
+        stats = cache.get_stats()
+        add('prediction_cache_events_total', 'counter', stats, ['hits', 'store_hits', 'coalesced', 'misses', 'evictions', 'invalidations'])
+        add('prediction_cache_hit_ratio', 'gauge', stats, ['hit_rate'])
+        add('prediction_cache_entries', 'gauge', stats, ['entries'])
+
+    store = get_forecast_store()
+    if store is not None:
+        stats = store.get_stats()
+        add('forecast_store_events_total', 'counter', stats, ['hits', 'stale', 'model_mismatches', 'misses', 'reloads'])
+        add('forecast_store_symbols', 'gauge', stats, ['symbols'])
+
+    stats = price_cache.get_cache_stats()
+    add('price_cache_events_total', 'counter', stats, ['hits', 'partial_hits', 'misses', 'network_fetches'])
+    add('price_cache_hit_ratio', 'gauge', stats, ['hit_rate'])
+
+    stats = get_prediction_batcher().stats
+    add('batcher_requests_total', 'counter', stats, ['requests'])
+    add('batcher_batches_total', 'counter', stats, ['batches'])
+
+    stats = get_model_registry().stats
+    add('model_registry_events_total', 'counter', stats, ['hits', 'loads', 'evictions', 'fallbacks', 'load_failures'])
+
+    stats = get_logging_stats()
+    add('logging_queue_size', 'gauge', stats, ['queued'])
+    add('logging_dropped_total', 'counter', stats, ['dropped'])
+    return collected
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Endpoint de métricas no formato de exposição do Prometheus.
+    Inclui os histogramas de latência por etapa (download, fetch, scale, model, inverse_transform) e
+    por rota, os contadores de retentativas e fallbacks dos provedores e os contadores dos caches.
+    """
+    return PlainTextResponse(metrics.render_prometheus(collect_metrics()), media_type='text/plain; version=0.0.4')
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Evento de encerramento da aplicação FastAPI.
+    Encerra o worker do batcher de predição e as conexões da camada de download.
+    """
+    await get_prediction_batcher().stop()
+    await run_in_threadpool(close_data_fetcher)
+    logging.info("API encerrada.")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True) # Pass "app:app" as import string
\ No newline at end of file
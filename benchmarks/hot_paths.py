@@ -0,0 +1,158 @@
+"""Micro-benchmarks dos caminhos críticos de dados e inferência, offline e reprodutíveis.
+
+O download é substituído por séries sintéticas (`src.data_fetcher.stub_history`) e os caches de
+preços e de predições ficam desligados, para medir só o código do projeto. Cada execução grava um
+JSON em `benchmarks/results/` com as latências (p50/p99), o pico de memória alocada de cada caso e
+o commit medido; `--compare` compara com uma execução anterior e aponta regressões.
+
+Uso:
+    python benchmarks/hot_paths.py [--backend numpy|keras] [--repeat 200]
+    python benchmarks/hot_paths.py --compare benchmarks/results/<anterior>.json [--threshold 0.10]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+SERIES_LENGTH = 5000 # ~20 anos de pregões
+BATCH_SYMBOLS = 64
+
+# Os benchmarks medem o código, não os caches nem a rede
+os.environ['PRICE_CACHE_ENABLED'] = '0'
+os.environ['PREDICTION_CACHE_ENABLED'] = '0'
+os.environ['USE_MODEL_REGISTRY'] = '0'
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+sys.path.insert(0, ROOT_DIR)
+
+
+def _measure(fn, repeat):
+    """Executa `fn` uma vez para aquecer, mede `repeat` execuções e o pico de memória alocada de uma execução."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'mean_ms': float(np.mean(samples)),
+        'peak_alloc_kb': peak / 1024,
+    }
+
+
+def run(backend, repeat):
+    """Executa todos os casos e retorna {nome do caso: métricas}."""
+    from src.data_fetcher import stub_history
+    from src.data_handler import build_windows, preprocess_data, standardize_data
+    from src import model_predict
+
+    history = stub_history('BENCH', '2000-01-01', '2025-01-01')[-SERIES_LENGTH:]
+    histories = {f'S{i:03d}': stub_history(f'S{i:03d}', '2024-01-01', '2025-01-01') for i in range(BATCH_SYMBOLS)}
+    histories['BENCH'] = history
+    model_predict.download_stock_data = lambda symbol, start_date=None, end_date=None, **kwargs: histories[symbol] # Stub do download
+
+    model_predict.load_scaler_for_api(os.path.join(ROOT_DIR, 'models'))
+    model_predict.load_model_for_api(os.path.join(ROOT_DIR, 'models'), backend=backend)
+    scaler = model_predict.SCALER
+    scaled = standardize_data(history, scaler_path=None)
+    window = scaler.transform(history.values[-60:])
+    windows = scaler.transform(np.stack([frame.values[-60:, 0] for frame in histories.values()][:BATCH_SYMBOLS]).reshape(-1, 1))
+    X_single = window.reshape(1, 60, 1).astype(np.float32)
+    X_batch = windows.reshape(BATCH_SYMBOLS, 60, 1).astype(np.float32)
+    symbols = list(histories)[:BATCH_SYMBOLS]
+
+    cases = {
+        'build_windows': lambda: build_windows(scaled.values, 60),
+        'build_windows_materialized': lambda: build_windows(scaled.values, 60, materialize=True),
+        'preprocess_data': lambda: preprocess_data(scaled),
+        'standardize_data': lambda: standardize_data(history, scaler_path=None),
+        'scaler_round_trip_60': lambda: scaler.inverse_transform(scaler.transform(history.values[-60:])),
+        f'scaler_round_trip_{BATCH_SYMBOLS}x60': lambda: scaler.inverse_transform(scaler.transform(windows)),
+        'forecast_batch_1': lambda: model_predict.forecast_scaled_windows(X_single),
+        f'forecast_batch_{BATCH_SYMBOLS}': lambda: model_predict.forecast_scaled_windows(X_batch),
+        'forecast_batch_1_horizon_10': lambda: model_predict.forecast_scaled_windows(X_single, horizon=10),
+        'predict_price_for_api': lambda: model_predict.predict_price_for_api('BENCH', '2000-01-01', '2025-01-01'),
+        f'predict_prices_batch_for_api_{BATCH_SYMBOLS}': lambda: model_predict.predict_prices_batch_for_api(symbols, '2024-01-01', '2025-01-01'),
+    }
+    results = {}
+    for name, fn in cases.items():
+        results[name] = _measure(fn, repeat)
+        print(f"{name:<36}{results[name]['p50_ms']:>10.3f}{results[name]['p99_ms']:>10.3f}{results[name]['peak_alloc_kb']:>14.1f}", flush=True)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'desconhecido'
+
+
+def compare(current, baseline, threshold):
+    """Imprime a variação do p50 de cada caso e retorna os casos que ficaram mais lentos que `threshold`."""
+    regressions = []
+    print(f"\n{'caso':<36}{'p50 antes':>12}{'p50 agora':>12}{'variação':>10}")
+    for name, metrics in current['cases'].items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            continue
+        change = metrics['p50_ms'] / before['p50_ms'] - 1
+        flag = '  <-- regressão' if change > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36}{before['p50_ms']:>12.3f}{metrics['p50_ms']:>12.3f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['numpy', 'keras'], default='numpy')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída. Padrão: benchmarks/results/<data>_<commit>_<motor>.json')
+    parser.add_argument('--compare', default=None, help='JSON de uma execução anterior para comparar.')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Piora relativa do p50 considerada regressão.')
+    args = parser.parse_args()
+
+    print(f"{'caso':<36}{'p50 (ms)':>10}{'p99 (ms)':>10}{'pico (KB)':>14}")
+    cases = run(args.backend, args.repeat)
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'backend': args.backend,
+        'repeat': args.repeat,
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'cases': cases,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{commit}_{args.backend}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\npico RSS: {report['peak_rss_mb']:.1f} MB; resultados em {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Compara latência e memória do motor Keras com o motor NumPy (`src/numpy_lstm.py`).
+
+Cada motor roda em um subprocesso próprio, para que o tempo de importação e o pico de
+memória (RSS) de um não contaminem o outro.
+
+Uso:
+    python benchmarks/inference_backends.py [--model-dir models] [--repeat 50]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_SIZES = (1, 64)
+
+
+def _worker(backend, model_dir, repeat):
+    """Carrega o motor pedido, mede as latências e imprime o resultado em JSON."""
+    started = time.perf_counter()
+    if backend == 'numpy':
+        from src.numpy_lstm import load_numpy_model
+        model = load_numpy_model(model_dir)
+    else:
+        from tensorflow.keras.models import load_model
+        model = load_model(os.path.join(model_dir, 'lstm_model.keras'), compile=False)
+    load_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(0)
+    latencies = {}
+    for batch_size in BATCH_SIZES:
+        X = rng.random((batch_size, 60, 1), dtype=np.float32)
+        model.predict_on_batch(X) # Aquecimento
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.predict_on_batch(X)
+            samples.append((time.perf_counter() - start) * 1000)
+        latencies[f'batch_{batch_size}'] = {
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p99_ms': float(np.percentile(samples, 99)),
+        }
+
+    print(json.dumps({
+        'backend': backend,
+        'import_and_load_s': load_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'latency': latencies,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-dir', default=os.path.join(ROOT_DIR, 'models'))
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--worker', choices=['keras', 'numpy'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker, args.model_dir, args.repeat)
+        return
+
+    results = []
+    for backend in ('keras', 'numpy'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', backend, '--model-dir', args.model_dir, '--repeat', str(args.repeat)],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+            env=dict(os.environ, PYTHONPATH=ROOT_DIR, TF_CPP_MIN_LOG_LEVEL='2'),
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    header = f"{'motor':<8}{'import+carga (s)':>18}{'pico RSS (MB)':>16}" + ''.join(f'{f"p50 lote {b} (ms)":>20}' for b in BATCH_SIZES)
+    print(header)
+    for result in results:
+        row = f"{result['backend']:<8}{result['import_and_load_s']:>18.2f}{result['peak_rss_mb']:>16.1f}"
+        row += ''.join(f"{result['latency'][f'batch_{b}']['p50_ms']:>20.2f}" for b in BATCH_SIZES)
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
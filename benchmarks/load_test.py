@@ -0,0 +1,421 @@
+"""Teste de carga de ponta a ponta do `/predict`, sem rede.
+
+Sobe a API com `src/server.py` (um ou mais workers) usando o provedor local (`DATA_PROVIDERS=stub`)
+no lugar do Yahoo Finance e do Alpha Vantage em `download_stock_data`. Em seguida envia requisições
+com clientes assíncronos concorrentes, em um ou mais níveis de concorrência (ex: 1,4,16,64, para
+encontrar o ponto de saturação), com uma mistura configurável de símbolos e horizontes.
+
+Para cada nível reporta vazão, percentis de latência, taxa de erros por tipo, e CPU e memória
+(RSS e PSS) do processo principal e de cada worker, lidos de `/proc`. Cada execução grava um JSON em
+`benchmarks/results/`, e `--compare` mostra várias execuções lado a lado (ex: antes e depois de uma
+mudança).
+
+Uso:
+    python benchmarks/load_test.py --workers 2 --concurrency 1,8,32 --duration 20
+    python benchmarks/load_test.py --symbols AAPL=5,MSFT=3,GOOG --synthetic 500 --horizons 1=9,5=1
+    python benchmarks/load_test.py --env INFERENCE_BACKEND=numpy --env LOG_ASYNC=0 --label sem-log-assincrono
+    python benchmarks/load_test.py --compare benchmarks/results/*_load_test.json
+
+O gerador de carga roda na mesma máquina: o CPU que ele usa também é reportado, já que disputa com
+os workers. Caches com estado em disco (histórico de preços, previsões pré-calculadas) apontam para
+um diretório temporário, para que execuções de builds diferentes partam do mesmo estado.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _parse_mix(text, cast=str):
+    """Converte 'A=5,B=3,C' em ([A, B, C], [5, 3, 1]) (peso 1 quando omitido)."""
+    values, weights = [], []
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        value, _, weight = item.partition('=')
+        values.append(cast(value.strip()))
+        weights.append(float(weight) if weight else 1.0)
+    return values, weights
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'desconhecido'
+
+
+class ProcessSampler:
+    """Lê CPU, RSS e PSS do servidor e dos seus workers em `/proc` (Linux).
+
+    Workers são os filhos diretos do processo principal; workers substituídos (ex: após uma falha)
+    aparecem com o seu próprio pid.
+    """
+
+    def __init__(self, root_pid):
+        self.root_pid = root_pid
+        self.peaks = {} # pid -> {'rss_mb', 'pss_mb'}
+        self.available = root_pid is not None and os.path.isdir(f'/proc/{root_pid}')
+
+    def _pids(self):
+        children = []
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                try:
+                    with open(f'/proc/{name}/stat') as f:
+                        if int(f.read().rsplit(')', 1)[1].split()[1]) == self.root_pid:
+                            children.append(int(name))
+                except (OSError, IndexError, ValueError):
+                    continue
+        return [self.root_pid] + sorted(children)
+
+    @staticmethod
+    def _cpu_seconds(pid):
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS # utime + stime
+
+    @staticmethod
+    def _memory_mb(pid):
+        with open(f'/proc/{pid}/statm') as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE / 2 ** 20
+        pss = None
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Pss:'):
+                        pss = int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            pass
+        return rss, pss
+
+    def snapshot(self):
+        """Retorna {pid: segundos de CPU} e atualiza os picos de memória."""
+        if not self.available:
+            return {}
+        cpu = {}
+        for pid in self._pids():
+            try:
+                cpu[pid] = self._cpu_seconds(pid)
+                rss, pss = self._memory_mb(pid)
+            except OSError:
+                continue # Processo encerrado entre a listagem e a leitura
+            peak = self.peaks.setdefault(pid, {'rss_mb': 0.0, 'pss_mb': None})
+            peak['rss_mb'] = max(peak['rss_mb'], rss)
+            if pss is not None:
+                peak['pss_mb'] = max(peak['pss_mb'] or 0.0, pss)
+        return cpu
+
+    def report(self, before, after, seconds):
+        """CPU (% de um núcleo) e picos de memória de cada processo no intervalo entre dois snapshots."""
+        processes = []
+        for pid in after:
+            processes.append({
+                'pid': pid,
+                'role': 'principal' if pid == self.root_pid else 'worker',
+                'cpu_percent': 100 * (after[pid] - before.get(pid, after[pid])) / seconds if pid in before else None,
+                **self.peaks.get(pid, {}),
+            })
+        return processes
+
+
+async def run_stage(client, url, concurrency, duration, warmup, choose_request, sampler, sample_interval, seed):
+    """Executa um nível de concorrência: `concurrency` clientes enviam requisições em sequência por `warmup + duration` segundos.
+
+    Só as requisições iniciadas depois do aquecimento entram nas métricas.
+    """
+    loop_started = time.perf_counter()
+    measure_from = loop_started + warmup
+    stop_at = measure_from + duration
+    latencies, outcomes = [], {}
+    finished_at = measure_from
+    marks = {}
+
+    async def user(index):
+        nonlocal finished_at
+        rng = random.Random(seed * 100003 + index)
+        while True:
+            started = time.perf_counter()
+            if started >= stop_at:
+                return
+            body = choose_request(rng)
+            try:
+                response = await client.request('GET', f'{url}/predict', json=body)
+                outcome = 'ok' if response.status_code == 200 else f'http_{response.status_code}'
+            except Exception as e:
+                outcome = type(e).__name__
+            ended = time.perf_counter()
+            if started >= measure_from:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                finished_at = max(finished_at, ended)
+                if outcome == 'ok':
+                    latencies.append(ended - started)
+
+    async def sample():
+        await asyncio.sleep(max(0.0, measure_from - time.perf_counter()))
+        marks['before'], marks['client_before'] = sampler.snapshot(), os.times()
+        while time.perf_counter() < stop_at:
+            await asyncio.sleep(sample_interval)
+            marks['after'] = sampler.snapshot()
+        marks['after'], marks['client_after'] = sampler.snapshot(), os.times()
+
+    await asyncio.gather(sample(), *(user(index) for index in range(concurrency)))
+
+    elapsed = max(finished_at - measure_from, 1e-9)
+    total = sum(outcomes.values())
+    errors = {name: count for name, count in outcomes.items() if name != 'ok'}
+    latencies_ms = np.asarray(latencies) * 1000
+    latency = {name: float(np.percentile(latencies_ms, q)) if len(latencies_ms) else None
+               for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100))}
+    latency['mean'] = float(latencies_ms.mean()) if len(latencies_ms) else None
+    client_cpu = sum(marks['client_after'][:2]) - sum(marks['client_before'][:2])
+    return {
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests': total,
+        'ok': outcomes.get('ok', 0),
+        'throughput_rps': outcomes.get('ok', 0) / elapsed,
+        'error_rate': sum(errors.values()) / total if total else 0.0,
+        'errors': errors,
+        'latency_ms': latency,
+        'processes': sampler.report(marks['before'], marks['after'], elapsed),
+        'load_generator_cpu_percent': 100 * client_cpu / elapsed,
+    }
+
+
+def start_server(workers, env_overrides, state_dir, startup_timeout):
+    """Sobe `src/server.py` em uma porta livre, com o provedor local, e espera /ready responder 200.
+
+    Returns:
+        tuple: (processo, url, segundos até ficar pronto, arquivo de log).
+    """
+    import httpx
+
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        'DATA_PROVIDERS': 'stub', # Provedor local no lugar do Yahoo Finance / Alpha Vantage
+        'PRICE_CACHE_DIR': os.path.join(state_dir, 'price_cache'),
+        'FORECAST_STORE_PATH': os.path.join(state_dir, 'forecasts.npz'),
+        'PYTHONPATH': ROOT_DIR,
+        'TF_CPP_MIN_LOG_LEVEL': '2',
+    })
+    env.update(env_overrides)
+    log_path = os.path.join(state_dir, 'server.log')
+    with open(log_path, 'wb') as log_file:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'src.server', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)],
+            cwd=ROOT_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+        )
+    url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    while time.perf_counter() - started < startup_timeout:
+        if process.poll() is not None:
+            break
+        try:
+            if httpx.get(f'{url}/ready', timeout=2).status_code == 200:
+                return process, url, time.perf_counter() - started, log_path
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    with open(log_path, encoding='utf-8', errors='replace') as f:
+        tail = ''.join(f.readlines()[-20:])
+    raise RuntimeError(f'O servidor não ficou pronto em {startup_timeout:.0f}s. Últimas linhas do log:\n{tail}')
+
+
+def stop_server(process, timeout=60):
+    """Encerra o servidor (SIGTERM, que drena os workers) e, se ele não terminar a tempo, o mata."""
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def print_stage(stage):
+    latency = stage['latency_ms']
+    fmt = lambda value: f'{value:>9.1f}' if value is not None else f"{'-':>9}"
+    processes = stage['processes']
+    server_cpu = sum(p['cpu_percent'] or 0 for p in processes)
+    print(f"{stage['concurrency']:>6}{stage['throughput_rps']:>10.1f}{fmt(latency['p50'])}{fmt(latency['p90'])}{fmt(latency['p99'])}{fmt(latency['max'])}"
+          f"{100 * stage['error_rate']:>9.2f}{server_cpu:>11.0f}{stage['load_generator_cpu_percent']:>10.0f}")
+    for p in processes:
+        pss = f"{p['pss_mb']:.0f}" if p.get('pss_mb') is not None else '-'
+        cpu = f"{p['cpu_percent']:.0f}%" if p['cpu_percent'] is not None else '-'
+        print(f"{'':>6}  {p['role']:<9} pid {p['pid']:<8} CPU {cpu:>5}  RSS {p.get('rss_mb', 0):.0f} MB  PSS {pss} MB")
+    if stage['errors']:
+        print(f"{'':>6}  erros: {stage['errors']}")
+
+
+STAGE_HEADER = (f"{'conc.':>6}{'req/s':>10}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'máx ms':>9}{'erros %':>9}"
+                f"{'CPU serv.%':>11}{'CPU ger.%':>10}")
+
+
+def saturation_point(stages, min_gain=0.05):
+    """Primeiro nível de concorrência a partir do qual a vazão para de crescer (ganho < `min_gain`)."""
+    for previous, stage in zip(stages, stages[1:]):
+        if stage['throughput_rps'] < previous['throughput_rps'] * (1 + min_gain):
+            return previous['concurrency']
+    return None
+
+
+def compare(paths):
+    """Mostra execuções salvas lado a lado, por nível de concorrência."""
+    runs = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            runs.append((path, json.load(f)))
+    for index, (path, run) in enumerate(runs):
+        print(f"[{index}] {run['commit']} {run['created_at']} {run.get('label') or ''} "
+              f"(workers={run['config']['workers']}, env={run['config']['env']}) {os.path.basename(path)}")
+    print(f"\n{'conc.':>6}{'exec.':>6}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'erros %':>9}{'RSS workers MB':>16}")
+    levels = sorted({stage['concurrency'] for _, run in runs for stage in run['stages']})
+    for level in levels:
+        for index, (_, run) in enumerate(runs):
+            stage = next((stage for stage in run['stages'] if stage['concurrency'] == level), None)
+            if stage is None:
+                continue
+            rss = sum(p.get('rss_mb', 0) for p in stage['processes'] if p['role'] == 'worker')
+            latency = stage['latency_ms']
+            print(f"{level:>6}{index:>6}{stage['throughput_rps']:>10.1f}{latency['p50'] or 0:>9.1f}{latency['p99'] or 0:>9.1f}"
+                  f"{100 * stage['error_rate']:>9.2f}{rss:>16.0f}")
+
+
+async def run_load(args, url, sampler):
+    import httpx
+
+    symbols, symbol_weights = _parse_mix(args.symbols)
+    synthetic = [f'S{index:04d}' for index in range(args.synthetic)]
+    symbols += synthetic
+    symbol_weights += [args.synthetic_weight / max(1, args.synthetic)] * len(synthetic) # O grupo sintético inteiro tem peso `synthetic_weight`
+    horizons, horizon_weights = _parse_mix(args.horizons, int)
+
+    def choose_request(rng):
+        return {
+            'symbol': rng.choices(symbols, symbol_weights)[0],
+            'start_date': args.start_date,
+            'end_date': args.end_date,
+            'horizon': rng.choices(horizons, horizon_weights)[0],
+        }
+
+    stages = []
+    print(STAGE_HEADER)
+    for index, concurrency in enumerate(args.concurrency):
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            stage = await run_stage(client, url, concurrency, args.duration, args.warmup, choose_request,
+                                    sampler, args.sample_interval, args.seed + index)
+        print_stage(stage)
+        stages.append(stage)
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=1, help='Workers de src/server.py')
+    parser.add_argument('--concurrency', default='1,4,16', help='Níveis de concorrência, separados por vírgula')
+    parser.add_argument('--duration', type=float, default=15, help='Segundos medidos por nível')
+    parser.add_argument('--warmup', type=float, default=3, help='Segundos de aquecimento por nível (não medidos)')
+    parser.add_argument('--symbols', default='AAPL=5,MSFT=3,GOOG=2', help='Símbolos com peso opcional (ex: AAPL=5,MSFT)')
+    parser.add_argument('--synthetic', type=int, default=0, help='Símbolos sintéticos extras (S0000, S0001, ...), para exercitar caches frios')
+    parser.add_argument('--synthetic-weight', type=float, default=1.0, help='Peso total do grupo de símbolos sintéticos')
+    parser.add_argument('--horizons', default='1', help='Horizontes com peso opcional (ex: 1=9,5=1)')
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--end-date', default='2025-02-19')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='Latência simulada do provedor local, em segundos')
+    parser.add_argument('--env', action='append', default=[], metavar='CHAVE=VALOR', help='Variável de ambiente do servidor (repetível)')
+    parser.add_argument('--url', help='Usa um servidor já em execução em vez de subir um')
+    parser.add_argument('--server-pid', type=int, help='Com --url: pid do processo principal, para medir CPU e memória')
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--timeout', type=float, default=30, help='Tempo máximo de cada requisição')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='Intervalo entre leituras de memória')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', default=None, help='Rótulo da execução (ex: nome da mudança testada)')
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída. Padrão: benchmarks/results/<data>_<commit>_load_test.json')
+    parser.add_argument('--compare', nargs='+', metavar='JSON', help='Compara execuções salvas e sai')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    args.concurrency = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    env_overrides = dict(item.split('=', 1) for item in args.env)
+    if args.stub_latency:
+        env_overrides['DATA_STUB_LATENCY_SECONDS'] = str(args.stub_latency)
+
+    with tempfile.TemporaryDirectory(prefix='load_test_') as state_dir:
+        process, startup_seconds = None, None
+        if args.url:
+            url, root_pid = args.url.rstrip('/'), args.server_pid
+        else:
+            process, url, startup_seconds, log_path = start_server(args.workers, env_overrides, state_dir, args.startup_timeout)
+            root_pid = process.pid
+            print(f'Servidor pronto em {startup_seconds:.1f}s ({args.workers} worker(s), {url}, log em {log_path})')
+        sampler = ProcessSampler(root_pid)
+        try:
+            stages = asyncio.run(run_load(args, url, sampler))
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    saturation = saturation_point(stages)
+    if saturation is not None:
+        print(f'\nA vazão para de crescer a partir de {saturation} cliente(s) simultâneo(s).')
+
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'label': args.label,
+        'config': {
+            'workers': args.workers if not args.url else None,
+            'url': args.url,
+            'cpu_count': os.cpu_count(),
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'symbols': args.symbols,
+            'synthetic': args.synthetic,
+            'synthetic_weight': args.synthetic_weight,
+            'horizons': args.horizons,
+            'start_date': args.start_date,
+            'end_date': args.end_date,
+            'env': env_overrides,
+        },
+        'startup_seconds': startup_seconds,
+        'saturation_concurrency': saturation,
+        'stages': stages,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{commit}_load_test.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResultados em {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Compara o modelo em float32 com os pesos em precisão reduzida (float16 e int8) do motor NumPy.
+
+A API serve apenas o float32: este harness mede o que a quantização custaria em acurácia e ganharia
+em tamanho de artefato (os pesos reduzidos são convertidos para float32 ao carregar, então a
+latência e a memória residente são as do float32).
+
+Para cada variante (Keras, NumPy float32, NumPy float16 e NumPy int8) mede, em um subprocesso
+próprio: tamanho do artefato, memória dos pesos residentes, pico de memória (RSS), tempo de
+carga e latência (p50/p99) com lotes de 1 e 64 janelas. A perda de acurácia é medida nas janelas
+de teste (os 20% finais da série, como na divisão do treino): erro em preço contra o fechamento
+real e diferença para as previsões do modelo Keras em float32. Cada execução grava um JSON em
+`benchmarks/results/`.
+
+Uso:
+    python -m src.numpy_lstm export models float16 int8   # exporta os pesos em precisão reduzida
+    python benchmarks/quantization.py [--symbol MSFT] [--model-dir models] [--repeat 50]
+
+Sem rede, use `DATA_PROVIDERS=stub` (séries sintéticas).
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+BATCH_SIZES = (1, 64)
+VARIANTS = ('keras', 'float32', 'float16', 'int8') # 'keras' é a referência; as demais usam o motor NumPy
+sys.path.insert(0, ROOT_DIR)
+
+
+def _worker(variant, model_dir, windows_path, repeat):
+    """Carrega a variante pedida, mede memória e latência, prevê as janelas de teste e imprime o resultado em JSON."""
+    started = time.perf_counter()
+    if variant == 'keras':
+        from tensorflow.keras.models import load_model
+        artifact = os.path.join(model_dir, 'lstm_model.keras')
+        model = load_model(artifact, compile=False)
+    else:
+        from src.numpy_lstm import load_numpy_model, weights_filename
+        artifact = os.path.join(model_dir, weights_filename(variant))
+        model = load_numpy_model(model_dir, variant)
+    load_seconds = time.perf_counter() - started
+
+    with np.load(windows_path) as data:
+        X_test = data['X']
+    predictions = np.concatenate([np.asarray(model.predict_on_batch(X_test[start:start + 256])).reshape(-1)
+                                  for start in range(0, len(X_test), 256)])
+
+    latencies = {}
+    for batch_size in BATCH_SIZES:
+        X = np.ascontiguousarray(X_test[-batch_size:])
+        model.predict_on_batch(X) # Aquecimento
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.predict_on_batch(X)
+            samples.append((time.perf_counter() - start) * 1000)
+        latencies[f'batch_{batch_size}'] = {
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p99_ms': float(np.percentile(samples, 99)),
+        }
+
+    print(json.dumps({
+        'variant': variant,
+        'artifact_kb': os.path.getsize(artifact) / 1024,
+        'weights_kb': sum(weight.nbytes for weight in model.get_weights()) / 1024,
+        'import_and_load_s': load_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'latency': latencies,
+        'predictions': predictions.tolist(),
+    }))
+
+
+def _test_windows(symbol, start_date, end_date, model_dir, time_steps):
+    """Janelas de teste (20% finais da série, padronizadas com o scaler do modelo) e os fechamentos reais."""
+    import joblib
+    from src.data_handler import build_windows, download_stock_data
+
+    data = download_stock_data(stock_symbol=symbol, start_date=start_date, end_date=end_date)
+    scaler = joblib.load(os.path.join(model_dir, 'Scaler_model.pkl'))
+    scaled = scaler.transform(data.values)
+    train_size = int(len(scaled) * 0.8)
+    X, _ = build_windows(scaled[train_size:], time_steps, materialize=True)
+    actual = data.values[train_size + time_steps:, 0]
+    return X, actual, scaler
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'desconhecido'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--symbol', default='MSFT')
+    parser.add_argument('--start-date', default='2020-01-01')
+    parser.add_argument('--end-date', default='2025-02-19')
+    parser.add_argument('--model-dir', default=os.path.join(ROOT_DIR, 'models'))
+    parser.add_argument('--time-steps', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', default=None, help='Arquivo JSON de saída. Padrão: benchmarks/results/<data>_<commit>_quantization.json')
+    parser.add_argument('--worker', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--windows', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker, args.model_dir, args.windows, args.repeat)
+        return
+
+    X_test, actual, scaler = _test_windows(args.symbol, args.start_date, args.end_date, args.model_dir, args.time_steps)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        windows_path = os.path.join(tmp_dir, 'windows.npz')
+        np.savez(windows_path, X=X_test)
+        for variant in VARIANTS:
+            output = subprocess.run(
+                [sys.executable, __file__, '--worker', variant, '--model-dir', args.model_dir, '--windows', windows_path, '--repeat', str(args.repeat)],
+                cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+                env=dict(os.environ, PYTHONPATH=ROOT_DIR, TF_CPP_MIN_LOG_LEVEL='2'),
+            ).stdout
+            results[variant] = json.loads(output.strip().splitlines()[-1])
+
+    reference = np.asarray(results['keras'].pop('predictions'))
+    for variant in VARIANTS[1:]:
+        predictions = np.asarray(results[variant].pop('predictions'))
+        prices = scaler.inverse_transform(predictions.reshape(-1, 1))[:, 0]
+        results[variant]['accuracy'] = {
+            'mae': float(np.mean(np.abs(prices - actual))),
+            'rmse': float(np.sqrt(np.mean((prices - actual) ** 2))),
+            'max_abs_diff_scaled': float(np.max(np.abs(predictions - reference))), # Contra o Keras em float32
+            'mean_abs_diff_price': float(np.mean(np.abs(prices - scaler.inverse_transform(reference.reshape(-1, 1))[:, 0]))),
+        }
+    reference_prices = scaler.inverse_transform(reference.reshape(-1, 1))[:, 0]
+    results['keras']['accuracy'] = {
+        'mae': float(np.mean(np.abs(reference_prices - actual))),
+        'rmse': float(np.sqrt(np.mean((reference_prices - actual) ** 2))),
+        'max_abs_diff_scaled': 0.0,
+        'mean_abs_diff_price': 0.0,
+    }
+
+    header = (f"{'variante':<9}{'artefato (KB)':>14}{'pesos (KB)':>12}{'RSS (MB)':>10}" + ''.join(f'{f"p50 lote {b} (ms)":>18}' for b in BATCH_SIZES)
+              + f"{'MAE':>10}{'dif. máx.':>12}{'dif. média ($)':>16}")
+    print(f'{len(X_test)} janelas de teste de {args.symbol}\n{header}')
+    for variant, result in results.items():
+        row = f"{variant:<9}{result['artifact_kb']:>14.1f}{result['weights_kb']:>12.1f}{result['peak_rss_mb']:>10.1f}"
+        row += ''.join(f"{result['latency'][f'batch_{b}']['p50_ms']:>18.2f}" for b in BATCH_SIZES)
+        row += f"{result['accuracy']['mae']:>10.3f}{result['accuracy']['max_abs_diff_scaled']:>12.2e}{result['accuracy']['mean_abs_diff_price']:>16.4f}"
+        print(row)
+
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'symbol': args.symbol,
+        'test_windows': len(X_test),
+        'repeat': args.repeat,
+        'variants': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{commit}_quantization.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResultados em {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Compara memória e vazão do treino com janelas materializadas e com o dataset de streaming.
+
+Cada modo roda em um subprocesso próprio sobre uma série sintética, treinando o modelo
+de `src/lstm_model.py` por uma época, para que o pico de memória (RSS) de um não
+contamine o outro.
+
+Uso:
+    python benchmarks/training_input.py [--length 200000] [--epochs 1]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('materialized', 'streaming', 'memmap')
+
+
+def _worker(mode, length, epochs):
+    """Treina no modo pedido e imprime o resultado em JSON."""
+    from src.data_handler import preprocess_data, preprocess_data_streaming
+    from src.lstm_model import create_model
+
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({'Close': np.cumsum(rng.normal(size=length)).astype(np.float32)})
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if mode == 'materialized':
+            X_train, y_train, X_test, y_test = preprocess_data(data, materialize=True)
+        else:
+            memmap_path = os.path.join(tmp_dir, 'series.npy') if mode == 'memmap' else None
+            X_train, X_test = preprocess_data_streaming(data, memmap_path=memmap_path)
+            y_train = y_test = None
+
+        started = time.perf_counter()
+        create_model(X_train, y_train, X_test, y_test, epochs=epochs, model_dir=tmp_dir)
+        train_seconds = time.perf_counter() - started
+
+    windows = (int(length * 0.8) - 60) * epochs
+    print(json.dumps({
+        'mode': mode,
+        'train_s': train_seconds,
+        'windows_per_s': windows / train_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--length', type=int, default=200_000, help='Tamanho da série sintética.')
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker, args.length, args.epochs)
+        return
+
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', mode, '--length', str(args.length), '--epochs', str(args.epochs)],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+            env=dict(os.environ, PYTHONPATH=ROOT_DIR, TF_CPP_MIN_LOG_LEVEL='2'),
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'modo':<14}{'treino (s)':>12}{'janelas/s':>12}{'pico RSS (MB)':>16}")
+    for result in results:
+        print(f"{result['mode']:<14}{result['train_s']:>12.1f}{result['windows_per_s']:>12.0f}{result['peak_rss_mb']:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,54 @@
 from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
-from src.model_predict import predict_price_for_api
-from pydantic import BaseModel, validator
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from src.model_predict import prepare_input_window, predict_prices_batch_for_api, format_forecast, resolve_model
+from src.prediction_batcher import get_prediction_batcher
+from src.prediction_cache import get_prediction_cache, prediction_key
+from src.forecast_store import get_forecast_store
+from src.streaming import get_streaming_forecaster
+from src import price_cache
+from src.startup import is_ready
+from src.logger import log_request
+from pydantic import BaseModel, Field, validator
 from datetime import datetime
+import json
 import logging
 
 router = APIRouter()
 
+# Maior horizonte de previsão aceito pela API (aproximadamente um ano de pregões)
+MAX_HORIZON = 252
+
+# Tamanho da janela de entrada do modelo (em pregões)
+TIME_STEPS = 60
+
+def _ensure_ready():
+    """Responde 503 enquanto o modelo ainda estiver sendo carregado (ver /ready)."""
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="A API ainda está carregando o modelo. Tente novamente em instantes.")
+
+
 class PredictionRequest(BaseModel):
     symbol: str = Query(..., description="Símbolo da ação para prever (ex: AAPL)")
     start_date: str = Query(..., description="Data de início para buscar dados (YYYY-MM-DD)")
     end_date: str = Query(..., description="Data de fim para buscar dados (YYYY-MM-DD)")
+    horizon: int = Query(1, ge=1, le=MAX_HORIZON, description="Número de dias à frente a prever")
+
+    @validator('start_date', 'end_date')
+    def validate_date_format(cls, v):
+        try:
+            datetime.strptime(v, '%Y-%m-%d')
+            return v
+        except ValueError:
+            raise ValueError("Data deve estar no formato YYYY-MM-DD")
+
+
+class BatchPredictionRequest(BaseModel):
+    symbols: List[str] = Field(..., min_length=1, max_length=1000, description="Símbolos das ações para prever (ex: [\"AAPL\", \"MSFT\"])")
+    start_date: str = Field(..., description="Data de início para buscar dados (YYYY-MM-DD)")
+    end_date: str = Field(..., description="Data de fim para buscar dados (YYYY-MM-DD)")
+    horizon: int = Field(1, ge=1, le=MAX_HORIZON, description="Número de dias à frente a prever")
 
     @validator('start_date', 'end_date')
     def validate_date_format(cls, v):
@@ -21,27 +59,204 @@ class PredictionRequest(BaseModel):
             raise ValueError("Data deve estar no formato YYYY-MM-DD")
 
 
+class StreamSubscribeRequest(BaseModel):
+    symbols: List[str] = Field(..., min_length=1, max_length=10000, description="Símbolos a acompanhar (ex: [\"AAPL\", \"MSFT\"])")
+    end_date: Optional[str] = Field(None, description="Fim do download da janela inicial (YYYY-MM-DD). Padrão é hoje.")
+
+    @validator('end_date')
+    def validate_date_format(cls, v):
+        if v is None:
+            return v
+        try:
+            datetime.strptime(v, '%Y-%m-%d')
+            return v
+        except ValueError:
+            raise ValueError("Data deve estar no formato YYYY-MM-DD")
+
+
+class StreamBar(BaseModel):
+    symbol: str = Field(..., description="Símbolo da ação")
+    date: str = Field(..., description="Data do pregão (YYYY-MM-DD)")
+    close: float = Field(..., gt=0, description="Preço de fechamento")
+
+    @validator('date')
+    def validate_date_format(cls, v):
+        try:
+            datetime.strptime(v, '%Y-%m-%d')
+            return v
+        except ValueError:
+            raise ValueError("Data deve estar no formato YYYY-MM-DD")
+
+
+class StreamBarsRequest(BaseModel):
+    bars: List[StreamBar] = Field(..., min_length=1, description="Novos pregões dos símbolos acompanhados")
+
+
 @router.get("/predict", response_model=dict)
 async def predict_endpoint(request: PredictionRequest):
     """
     Endpoint para prever o preço de fechamento de uma ação.
-    Retorna um JSON com o preço previsto.
+    Retorna um JSON com o preço previsto e, se `horizon` > 1, a previsão de cada dia.
+
+    O download e a normalização rodam no threadpool, e o forward pass é agrupado com o de outras
+    requisições concorrentes pelo batcher de predição, sem bloquear o event loop. Previsões
+    calculadas pelo job diário (ver `src/precompute.py`) para o mesmo último pregão e modelo são
+    respondidas direto do armazenamento; as demais já calculadas vêm do cache de predições.
     """
+    _ensure_ready()
     try:
-        prediction_result = predict_price_for_api(
-            symbol=request.symbol,
-            start_date=request.start_date,
-            end_date=request.end_date
-        )
+        entry = await run_in_threadpool(resolve_model, request.symbol) # Modelo do símbolo (carregado sob demanda) ou o padrão
+
+        store = get_forecast_store()
+        if store is not None:
+            stored = store.lookup(request.symbol, request.start_date, request.end_date, request.horizon, entry, TIME_STEPS)
+            if stored is not None:
+                return format_forecast(stored)
 
-        if prediction_result is None:
-            raise HTTPException(status_code=400, detail="Não foi possível obter a predição. Verifique se há dados disponíveis para o período e símbolo especificados.")
+        async def predict():
+            window = await run_in_threadpool(
+                prepare_input_window,
+                symbol=request.symbol,
+                start_date=request.start_date,
+                end_date=request.end_date,
+                time_steps=TIME_STEPS,
+                entry=entry
+            )
 
-        return prediction_result # Retorna o dicionário com a predição (FastAPI converte para JSON)
+            if window is None:
+                raise HTTPException(status_code=400, detail="Não foi possível obter a predição. Verifique se há dados disponíveis para o período e símbolo especificados.")
 
+            predicted_prices = await get_prediction_batcher().submit(window, horizon=request.horizon, entry=entry)
+            log_request('Predição para %s realizada com sucesso (API). Preço previsto: %s', request.symbol, predicted_prices[0])
+            return format_forecast(predicted_prices)
+
+        cache = get_prediction_cache()
+        if cache is None:
+            return await predict()
+        key, live = prediction_key(request.symbol, request.end_date, TIME_STEPS, entry, request.horizon)
+        return await cache.get_or_compute(key, predict, live=live) # Retorna o dicionário com a predição (FastAPI converte para JSON)
+
+    except HTTPException:
+        raise
     except RuntimeError as e:
         logging.error(f"Erro interno ao processar predição: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor ao realizar a predição.")
     except Exception as e:
         logging.error(f"Erro inesperado ao processar predição: {e}")
-        raise HTTPException(status_code=500, detail="Erro inesperado no servidor.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Erro inesperado no servidor.")
+
+
+@router.post("/predict/batch", response_model=dict)
+async def predict_batch_endpoint(request: BatchPredictionRequest):
+    """
+    Endpoint para prever o preço de fechamento de várias ações em uma única chamada.
+    Retorna um JSON com o resultado (preço previsto ou erro) de cada símbolo.
+    """
+    _ensure_ready()
+    try:
+        results = await run_in_threadpool(
+            predict_prices_batch_for_api,
+            symbols=request.symbols,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            horizon=request.horizon
+        )
+        return {'results': results}
+
+    except RuntimeError as e:
+        logging.error(f"Erro interno ao processar predição em lote: {e}")
+        raise HTTPException(status_code=500, detail="Erro interno do servidor ao realizar a predição em lote.")
+    except Exception as e:
+        logging.error(f"Erro inesperado ao processar predição em lote: {e}")
+        raise HTTPException(status_code=500, detail="Erro inesperado no servidor.")
+
+
+@router.get("/cache/stats", response_model=dict)
+async def cache_stats_endpoint():
+    """
+    Endpoint com os contadores dos caches: resultados de predição, previsões pré-calculadas e histórico de preços.
+    """
+    cache = get_prediction_cache()
+    store = get_forecast_store()
+    return {
+        'predictions': cache.get_stats() if cache is not None else None,
+        'precomputed': store.get_stats() if store is not None else None,
+        'prices': price_cache.get_cache_stats(),
+    }
+
+
+@router.post("/stream/subscribe", response_model=dict)
+async def stream_subscribe_endpoint(request: StreamSubscribeRequest):
+    """
+    Passa a acompanhar os símbolos no modo incremental (ver `src/streaming.py`).
+    Retorna a previsão inicial de cada símbolo (ou o erro, se não foi possível acompanhá-lo).
+    """
+    _ensure_ready()
+    try:
+        results = await run_in_threadpool(get_streaming_forecaster().subscribe, request.symbols, end_date=request.end_date)
+        return {'results': results}
+    except Exception as e:
+        logging.error(f"Erro inesperado ao iniciar o acompanhamento: {e}")
+        raise HTTPException(status_code=500, detail="Erro inesperado no servidor.")
+
+
+@router.post("/stream/unsubscribe", response_model=dict)
+async def stream_unsubscribe_endpoint(request: StreamSubscribeRequest):
+    """
+    Deixa de acompanhar os símbolos.
+    """
+    return {'removed': get_streaming_forecaster().unsubscribe(request.symbols)}
+
+
+@router.post("/stream/bars", response_model=dict)
+async def stream_bars_endpoint(request: StreamBarsRequest):
+    """
+    Recebe novos pregões dos símbolos acompanhados. Cada pregão avança o estado do símbolo em um
+    único passo, e a nova previsão é publicada em /stream/forecasts.
+    """
+    _ensure_ready()
+    try:
+        results = await run_in_threadpool(get_streaming_forecaster().push_bars, [(bar.symbol, bar.date, bar.close) for bar in request.bars])
+        return {'results': results}
+    except Exception as e:
+        logging.error(f"Erro inesperado ao processar os pregões recebidos: {e}")
+        raise HTTPException(status_code=500, detail="Erro inesperado no servidor.")
+
+
+@router.post("/stream/refresh", response_model=dict)
+async def stream_refresh_endpoint():
+    """
+    Baixa os pregões ainda não recebidos de todos os símbolos acompanhados e os aplica.
+    """
+    _ensure_ready()
+    try:
+        return {'results': await run_in_threadpool(get_streaming_forecaster().refresh)}
+    except Exception as e:
+        logging.error(f"Erro inesperado ao atualizar os símbolos acompanhados: {e}")
+        raise HTTPException(status_code=500, detail="Erro inesperado no servidor.")
+
+
+@router.get("/stream/forecasts")
+async def stream_forecasts_endpoint(symbols: Optional[str] = Query(None, description="Símbolos separados por vírgula (padrão: todos)")):
+    """
+    Server-Sent Events com as previsões do modo incremental: começa pela última previsão de cada
+    símbolo e envia um evento `forecast` a cada pregão recebido.
+    """
+    wanted = [symbol.strip() for symbol in symbols.split(',') if symbol.strip()] if symbols else None
+
+    async def events():
+        async for event in get_streaming_forecaster().listen(wanted):
+            if event is None:
+                yield ': keepalive\n\n' # Comentário SSE: mantém a conexão aberta em proxies
+            else:
+                yield f"event: forecast\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@router.get("/stream/stats", response_model=dict)
+async def stream_stats_endpoint():
+    """
+    Endpoint com os contadores do modo incremental (pregões, passos, recálculos, clientes conectados).
+    """
+    return get_streaming_forecaster().get_stats()
@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from src.logger import log_request
+from src.metrics import increment
+
+# Cadeia de provedores, em ordem de preferência (ex: DATA_PROVIDERS=stub para testes sem rede)
+DATA_PROVIDERS = os.getenv('DATA_PROVIDERS', 'yahoo,alphavantage')
+
+# Limite de requisições simultâneas em todos os provedores e tempo máximo de cada requisição HTTP
+MAX_CONCURRENCY = int(os.getenv('DATA_FETCH_CONCURRENCY', '8'))
+HTTP_TIMEOUT_SECONDS = float(os.getenv('DATA_FETCH_TIMEOUT_SECONDS', '15'))
+
+# Espera inicial do backoff exponencial após um rate limit (dobra a cada nova tentativa)
+BACKOFF_BASE_SECONDS = float(os.getenv('DATA_FETCH_BACKOFF_BASE_SECONDS', '1'))
+
+# Comportamento padrão do provedor local (stub): latência simulada por requisição e probabilidade de rate limit
+STUB_LATENCY_SECONDS = float(os.getenv('DATA_STUB_LATENCY_SECONDS', '0'))
+STUB_RATE_LIMIT_PROBABILITY = float(os.getenv('DATA_STUB_RATE_LIMIT_PROBABILITY', '0'))
+
+
+class RateLimitError(Exception):
+    """O provedor recusou a requisição por excesso de chamadas; vale a pena tentar de novo mais tarde."""
+
+
+class ProviderError(Exception):
+    """O provedor não pode atender o pedido (configuração ausente, símbolo inválido, resposta inesperada)."""
+
+
+class TokenBucket:
+    """Limitador de taxa (token bucket) compartilhado por todas as requisições a um provedor.
+
+    Args:
+        rate (float): Tokens repostos por segundo. Se <= 0, não há limite.
+        capacity (float): Máximo de tokens acumulados (rajada permitida).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Aguarda, sem bloquear o event loop, até haver um token disponível e o consome."""
+        if self.rate <= 0:
+            return
+        async with self._lock: # Quem chegou primeiro é atendido primeiro
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class YahooProvider:
+    """Históricos diários da API de gráficos do Yahoo Finance (fechamentos ajustados)."""
+
+    name = 'yahoo'
+    rate = 2.0
+    burst = 5
+
+    def __init__(self, base_url='https://query1.finance.yahoo.com'):
+        self.base_url = base_url
+
+    async def fetch(self, client, symbol, start_date, end_date):
+        import pandas as pd # Importado sob demanda, como em `data_handler`
+        start_ts = int(pd.Timestamp(start_date, tz='UTC').timestamp())
+        end_ts = int(pd.Timestamp(end_date, tz='UTC').timestamp())
+        response = await client.get(f'{self.base_url}/v8/finance/chart/{symbol}',
+                                    params={'period1': start_ts, 'period2': end_ts, 'interval': '1d', 'events': 'history'},
+                                    headers={'User-Agent': 'Mozilla/5.0'})
+        if response.status_code == 429:
+            raise RateLimitError('Yahoo Finance: limite de requisições atingido.')
+        if response.status_code == 404:
+            return pd.DataFrame()
+        if response.status_code != 200:
+            raise ProviderError(f'Yahoo Finance respondeu HTTP {response.status_code}.')
+
+        chart = response.json().get('chart') or {}
+        if chart.get('error'):
+            raise ProviderError(f"Yahoo Finance: {chart['error'].get('description', chart['error'])}")
+        result = (chart.get('result') or [None])[0]
+        if not result or not result.get('timestamp'):
+            return pd.DataFrame()
+
+        indicators = result['indicators']
+        closes = (indicators.get('adjclose') or indicators['quote'])[0]
+        closes = closes.get('adjclose', closes.get('close'))
+        offset = result.get('meta', {}).get('gmtoffset', 0) # Datas no fuso da bolsa
+        index = pd.to_datetime(np.asarray(result['timestamp']) + offset, unit='s').normalize()
+        data = pd.DataFrame({'Close': pd.to_numeric(pd.Series(closes, index=index), errors='coerce')}).dropna()
+        data.index.name = 'Date'
+        return data[(data.index >= pd.Timestamp(start_date)) & (data.index < pd.Timestamp(end_date))]
+
+
+class AlphaVantageProvider:
+    """Históricos diários da Alpha Vantage (requer a variável de ambiente ALPHA_KEY)."""
+
+    name = 'alphavantage'
+    rate = 5 / 60 # Plano gratuito: 5 requisições por minuto
+    burst = 5
+
+    def __init__(self, api_key=None, base_url='https://www.alphavantage.co'):
+        self.api_key = api_key or os.getenv('ALPHA_KEY')
+        self.base_url = base_url
+
+    async def fetch(self, client, symbol, start_date, end_date):
+        import pandas as pd
+        if not self.api_key:
+            raise ProviderError('Variável de ambiente ALPHA_KEY não configurada.')
+        response = await client.get(f'{self.base_url}/query', params={
+            'function': 'TIME_SERIES_DAILY', 'symbol': symbol, 'outputsize': 'full', 'apikey': self.api_key,
+        })
+        if response.status_code == 429:
+            raise RateLimitError('Alpha Vantage: limite de requisições atingido.')
+        if response.status_code != 200:
+            raise ProviderError(f'Alpha Vantage respondeu HTTP {response.status_code}.')
+
+        payload = response.json()
+        if 'Note' in payload or 'Information' in payload: # A Alpha Vantage sinaliza o rate limit no corpo da resposta
+            raise RateLimitError(f"Alpha Vantage: {payload.get('Note') or payload.get('Information')}")
+        if 'Error Message' in payload:
+            raise ProviderError(f"Alpha Vantage: {payload['Error Message']}")
+
+        series = payload.get('Time Series (Daily)') or {}
+        if not series:
+            return pd.DataFrame()
+        data = pd.DataFrame({'Close': [float(bar['4. close']) for bar in series.values()]},
+                            index=pd.to_datetime(list(series.keys())))
+        data.index.name = 'Date'
+        data = data.sort_index(ascending=True)
+        return data[(data.index >= pd.Timestamp(start_date)) & (data.index <= pd.Timestamp(end_date))]
+
+
+class StubProvider:
+    """Provedor local e determinístico, sem rede, para testes e benchmarks.
+
+    Gera um passeio aleatório de fechamentos em dias úteis, sempre o mesmo para cada símbolo.
+
+    Args:
+        latency (float, optional): Tempo simulado de cada requisição, em segundos. Padrão é DATA_STUB_LATENCY_SECONDS.
+        rate_limit_probability (float, optional): Probabilidade de simular um rate limit. Padrão é DATA_STUB_RATE_LIMIT_PROBABILITY.
+        rate (float, optional): Taxa do token bucket deste provedor (<= 0: sem limite).
+    """
+
+    name = 'stub'
+    rate = 0
+    burst = 1
+
+    def __init__(self, latency=None, rate_limit_probability=None, rate=None):
+        self.latency = STUB_LATENCY_SECONDS if latency is None else latency
+        self.rate_limit_probability = STUB_RATE_LIMIT_PROBABILITY if rate_limit_probability is None else rate_limit_probability
+        if rate is not None:
+            self.rate = rate
+        self.calls = 0
+
+    async def fetch(self, client, symbol, start_date, end_date):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.rate_limit_probability:
+            raise RateLimitError('Stub: limite de requisições simulado.')
+        return stub_history(symbol, start_date, end_date)
+
+
+def stub_history(symbol, start_date, end_date):
+    """Histórico sintético e determinístico de fechamentos em dias úteis no intervalo [start_date, end_date)."""
+    import pandas as pd
+    days = np.arange(np.datetime64('1990-01-01'), np.datetime64(end_date, 'D'))
+    days = days[np.is_busday(days)]
+    rng = np.random.default_rng(zlib.crc32(symbol.upper().encode()))
+    closes = 100 + np.abs(np.cumsum(rng.normal(0, 2, len(days)))) # Sempre a partir de 1990: mesmo fechamento para a mesma data em qualquer intervalo
+    first = np.searchsorted(days, np.datetime64(start_date, 'D'))
+    return pd.DataFrame({'Close': closes[first:]}, index=pd.DatetimeIndex(days[first:].astype('datetime64[ns]'), name='Date'))
+
+
+PROVIDERS = {provider.name: provider for provider in (YahooProvider, AlphaVantageProvider, StubProvider)}
+
+
+class AsyncDataFetcher:
+    """Camada assíncrona de acesso a dados com cadeia de provedores, sessões HTTP reaproveitadas,
+    limite de taxa por provedor, concorrência limitada e backoff exponencial.
+
+    Args:
+        providers (list, optional): Provedores em ordem de preferência. Padrão é `DATA_PROVIDERS`.
+        max_concurrency (int, optional): Requisições simultâneas no total. Padrão é `MAX_CONCURRENCY`.
+        max_retries (int, optional): Tentativas por provedor em caso de rate limit. Padrão é 3.
+        backoff_base (float, optional): Espera antes da 2ª tentativa (dobra a cada tentativa).
+        backoff_max (float, optional): Espera máxima entre tentativas. Padrão é 60 segundos.
+    """
+
+    def __init__(self, providers=None, max_concurrency=None, max_retries=3, backoff_base=None, backoff_max=60.0):
+        if providers is None:
+            providers = [PROVIDERS[name.strip()]() for name in DATA_PROVIDERS.split(',') if name.strip()]
+        self.providers = providers
+        self.max_concurrency = max_concurrency or MAX_CONCURRENCY
+        self.max_retries = max_retries
+        self.backoff_base = BACKOFF_BASE_SECONDS if backoff_base is None else backoff_base
+        self.backoff_max = backoff_max
+        self._buckets = {provider.name: TokenBucket(self._rate_for(provider), provider.burst) for provider in providers}
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = None
+        self.stats = {'requests': 0, 'rate_limited': 0, 'retries': 0, 'fallbacks': 0, 'failures': 0}
+
+    @staticmethod
+    def _rate_for(provider):
+        return float(os.getenv(f'DATA_FETCH_RATE_{provider.name.upper()}', provider.rate)) # Ex: DATA_FETCH_RATE_YAHOO=5
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx # Importado sob demanda, como os demais clientes de rede
+            self._client = httpx.AsyncClient(
+                timeout=HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            )
+        return self._client
+
+    async def _fetch_from(self, provider, symbol, start_date, end_date, max_retries, backoff_max):
+        """Busca em um provedor, respeitando o limite de taxa e retentando rate limits com backoff."""
+        bucket = self._buckets[provider.name]
+        for attempt in range(max_retries):
+            await bucket.acquire()
+            try:
+                async with self._semaphore:
+                    self.stats['requests'] += 1
+                    increment('fetch_requests_total', provider=provider.name)
+                    return await provider.fetch(self._get_client(), symbol, start_date, end_date)
+            except RateLimitError as e:
+                self.stats['rate_limited'] += 1
+                increment('fetch_rate_limited_total', provider=provider.name)
+                if attempt + 1 == max_retries:
+                    raise
+                delay = min(backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0) # Jitter evita retentativas em sincronia
+                logging.warning('%s (%s, tentativa %d/%d). Nova tentativa em %.1f s.', e, symbol, attempt + 1, max_retries, delay)
+                self.stats['retries'] += 1
+                increment('fetch_retries_total', provider=provider.name)
+                await asyncio.sleep(delay)
+
+    async def fetch(self, symbol, start_date, end_date, max_retries=None, backoff_max=None):
+        """
+        Baixa o histórico de fechamentos de uma ação, percorrendo a cadeia de provedores.
+
+        Um provedor que falha ou não tem dados para o período passa a vez ao próximo.
+
+        Args:
+            symbol (str): O símbolo da ação (ex: "AAPL").
+            start_date (str): Data inicial (YYYY-MM-DD).
+            end_date (str): Data final (YYYY-MM-DD).
+            max_retries (int, optional): Tentativas por provedor. Padrão é o do fetcher.
+            backoff_max (float, optional): Espera máxima entre tentativas. Padrão é a do fetcher.
+
+        Raises:
+            RuntimeError: Se todos os provedores falharem.
+
+        Returns:
+            pandas.DataFrame: DataFrame com a coluna 'Close', vazio se nenhum provedor tiver dados para o período.
+        """
+        import pandas as pd
+        errors = []
+        for position, provider in enumerate(self.providers):
+            if position > 0:
+                self.stats['fallbacks'] += 1
+                increment('fetch_fallbacks_total', provider=provider.name)
+                logging.info('Tentando baixar dados de %s com %s como fallback.', symbol, provider.name)
+            try:
+                data = await self._fetch_from(provider, symbol, start_date, end_date,
+                                              max_retries or self.max_retries, self.backoff_max if backoff_max is None else backoff_max)
+            except Exception as e:
+                logging.error('Erro ao baixar dados de %s com %s: %s', symbol, provider.name, e)
+                errors.append(f'{provider.name}: {e}')
+                continue
+            if data is not None and not data.empty:
+                log_request('Dados de %s baixados com sucesso de %s.', symbol, provider.name)
+                return data
+            logging.warning('%s retornou dados vazios para %s no período %s - %s.', provider.name, symbol, start_date, end_date)
+
+        if errors and len(errors) == len(self.providers):
+            self.stats['failures'] += 1
+            increment('fetch_failures_total')
+            raise RuntimeError(f'Falha ao baixar dados para {symbol}: {"; ".join(errors)}')
+        return pd.DataFrame()
+
+    async def fetch_many(self, symbols, start_date, end_date):
+        """Baixa os históricos de vários símbolos concorrentemente, dentro dos limites de taxa e concorrência.
+
+        Returns:
+            dict: símbolo -> DataFrame, ou a exceção levantada para aquele símbolo.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        results = await asyncio.gather(*(self.fetch(symbol, start_date, end_date) for symbol in symbols), return_exceptions=True)
+        return dict(zip(symbols, results))
+
+    async def close(self):
+        """Fecha as conexões HTTP reaproveitadas."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_FETCHER = None
+_FETCHER_LOOP = None
+_FETCHER_LOCK = threading.Lock()
+
+
+def get_data_fetcher():
+    """Retorna o fetcher do processo e o event loop (em uma thread própria) onde ele roda.
+
+    Um único loop concentra as conexões, o limite de taxa e a concorrência de todas as chamadas
+    síncronas (threadpool da API, download em lote), que apenas aguardam o resultado.
+    """
+    global _FETCHER, _FETCHER_LOOP
+    with _FETCHER_LOCK:
+        if _FETCHER is None:
+            _FETCHER_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_FETCHER_LOOP.run_forever, name='data-fetcher', daemon=True).start()
+            _FETCHER = asyncio.run_coroutine_threadsafe(_create_fetcher(), _FETCHER_LOOP).result()
+        return _FETCHER, _FETCHER_LOOP
+
+
+async def _create_fetcher():
+    return AsyncDataFetcher() # Criado dentro do loop do fetcher, dono do semáforo e dos token buckets
+
+
+def close_data_fetcher():
+    """Fecha as conexões do fetcher do processo e encerra seu event loop (no shutdown da API)."""
+    global _FETCHER, _FETCHER_LOOP
+    with _FETCHER_LOCK:
+        if _FETCHER is None:
+            return
+        asyncio.run_coroutine_threadsafe(_FETCHER.close(), _FETCHER_LOOP).result(timeout=5)
+        _FETCHER_LOOP.call_soon_threadsafe(_FETCHER_LOOP.stop)
+        _FETCHER, _FETCHER_LOOP = None, None
+
+
+def fetch_with_async_providers(stock_symbol, start_date, end_date, retry_delay=60, max_retries=3):
+    """
+    Versão síncrona de `AsyncDataFetcher.fetch`, com a mesma assinatura de `data_handler.fetch_from_providers`.
+
+    A espera por rate limit acontece no loop do fetcher: a thread chamadora apenas aguarda o resultado,
+    e as demais requisições continuam sendo atendidas.
+
+    Args:
+        retry_delay (int): Espera máxima entre tentativas após um rate limit, em segundos.
+        max_retries (int): Número máximo de tentativas por provedor.
+    """
+    fetcher, loop = get_data_fetcher()
+    coroutine = fetcher.fetch(stock_symbol, start_date, end_date, max_retries=max_retries, backoff_max=retry_delay)
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+async def _run_demo(args):
+    import pandas as pd
+    fetcher = AsyncDataFetcher(providers=[StubProvider(latency=args.latency, rate=args.rate)], max_concurrency=args.concurrency)
+    symbols = [f'SYM{i:04d}' for i in range(args.symbols)]
+    started = time.perf_counter()
+    results = await fetcher.fetch_many(symbols, '2020-01-01', '2025-01-01')
+    elapsed = time.perf_counter() - started
+    await fetcher.close()
+    ok = sum(isinstance(result, pd.DataFrame) for result in results.values())
+    print(f'{ok}/{len(symbols)} símbolos em {elapsed:.2f} s ({len(symbols) / elapsed:.1f} req/s; cota {args.rate} req/s).')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download em lote contra o provedor local (stub), sem rede.')
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=50.0, help='Cota do provedor, em requisições por segundo.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latência simulada de cada requisição, em segundos.')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY)
+    asyncio.run(_run_demo(parser.parse_args()))
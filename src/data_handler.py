@@ -1,15 +1,21 @@
 import time
-import yfinance as yf
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import logging
-from src.logger import configure_logging
+from src.logger import configure_logging, log_request
 import joblib
-from alpha_vantage.timeseries import TimeSeries
 from dotenv import load_dotenv
 import os
 from datetime import datetime
+from src import price_cache
+from src.metrics import increment, timed
+from src.data_fetcher import fetch_with_async_providers
+
+# Permite desligar o cache local de históricos (ex: PRICE_CACHE_ENABLED=0)
+PRICE_CACHE_ENABLED = os.getenv('PRICE_CACHE_ENABLED', '1') != '0'
+
+# Camada de download: 'async' (padrão, ver src/data_fetcher.py) ou 'legacy' (yfinance/alpha_vantage síncronos)
+DATA_FETCHER = os.getenv('DATA_FETCHER', 'async')
 
 def save_scaler(scaler_model, path):
     """Salva o modelo do scaler no caminho especificado.
@@ -28,29 +34,112 @@ def save_scaler(scaler_model, path):
         logging.error(f'Erro ao salvar o modelo scaler em {path}: {e}')
         raise RuntimeError(f'Erro ao salvar o modelo scaler: {e}')
 
-def standardize_data(data):
+def standardize_data(data, scaler_path='models/Scaler_model.pkl', return_scaler=False):
     """
     Padroniza os dados usando MinMaxScaler.
 
     Args:
         data (pandas.DataFrame): DataFrame com os dados a serem padronizados.
+        scaler_path (str, optional): Caminho onde o scaler ajustado é salvo. Se None, o scaler não é salvo
+                                     (ex: quando ele será gravado no registro de modelos por símbolo).
+                                     Padrão é 'models/Scaler_model.pkl'.
+        return_scaler (bool, optional): Se True, retorna também o scaler ajustado. Padrão é False.
 
     Returns:
-        pandas.DataFrame: DataFrame com os dados padronizados.
+        pandas.DataFrame: DataFrame com os dados padronizados (e o scaler, se `return_scaler=True`).
     """
+    import pandas as pd # Importado sob demanda: a API só carrega o pandas quando precisa baixar ou padronizar dados
+    from sklearn.preprocessing import MinMaxScaler # Importado sob demanda: só o treino precisa do sklearn
+
     try:
         logging.info('Padronizando os dados.')
         scaler = MinMaxScaler()
         data_scaled = scaler.fit_transform(data.values)
-        scaler_path = 'models/Scaler_model.pkl' # Caminho relativo
-        save_scaler(scaler, path=scaler_path)
+        if scaler_path is not None:
+            save_scaler(scaler, path=scaler_path)
         data_scaled = pd.DataFrame(data_scaled, columns=data.columns, index=data.index)
+        if return_scaler:
+            return data_scaled, scaler
         return data_scaled
     except Exception as e:
         logging.error(f"Erro ao padronizar os dados: {e}")
         raise RuntimeError(f"Erro ao padronizar os dados: {e}")
-        
-def preprocess_data(data, sequence_lenght=60):
+
+
+def expand_scaler_range(scaler, values, margin=0.1):
+    """
+    Verifica se novos valores saem da faixa do MinMaxScaler e, se saírem, retorna um scaler com a faixa ampliada.
+
+    A nova faixa cobre os novos valores com uma folga de `margin` vezes a faixa, para que pequenas
+    variações dos dias seguintes não exijam um novo ajuste. O scaler original não é alterado.
+
+    Args:
+        scaler (MinMaxScaler): Scaler ajustado.
+        values (numpy.ndarray): Novos valores, no formato aceito por `scaler.transform`.
+        margin (float, optional): Folga relativa à faixa atual. Padrão é 0.1.
+
+    Returns:
+        tuple: (scaler, drift), onde `drift` descreve a faixa anterior, a dos novos valores e se houve ampliação.
+    """
+    import copy
+
+    values = np.asarray(values, dtype=np.float64).reshape(-1, scaler.n_features_in_)
+    old_min, old_max = scaler.data_min_.copy(), scaler.data_max_.copy()
+    new_min, new_max = values.min(axis=0), values.max(axis=0)
+    drift = {
+        'data_min': old_min.tolist(), 'data_max': old_max.tolist(),
+        'new_min': new_min.tolist(), 'new_max': new_max.tolist(),
+        'expanded': bool((new_min < old_min).any() or (new_max > old_max).any()),
+    }
+    if not drift['expanded']:
+        return scaler, drift
+
+    slack = margin * (old_max - old_min)
+    expanded = copy.deepcopy(scaler)
+    expanded.data_min_ = np.where(new_min < old_min, new_min - slack, old_min)
+    expanded.data_max_ = np.where(new_max > old_max, new_max + slack, old_max)
+    expanded.data_range_ = expanded.data_max_ - expanded.data_min_
+    low, high = expanded.feature_range
+    expanded.scale_ = (high - low) / expanded.data_range_
+    expanded.min_ = low - expanded.data_min_ * expanded.scale_
+    drift.update({'scaled_min': expanded.data_min_.tolist(), 'scaled_max': expanded.data_max_.tolist()})
+    return expanded, drift
+
+
+def build_windows(series, time_steps=60, dtype=np.float32, materialize=False):
+    """
+    Constrói as janelas de entrada (X) e os alvos (y) de forma vetorizada, sem laço em Python.
+
+    As janelas são visões (strided views) sobre a série, de modo que nenhuma cópia do tamanho
+    `time_steps` vezes a série é criada, a menos que `materialize=True`.
+
+    Args:
+        series (numpy.ndarray): Série de valores (1D ou 2D com a primeira coluna usada).
+        time_steps (int, optional): Tamanho da janela. Padrão é 60.
+        dtype (numpy.dtype, optional): Tipo de dados de saída. Padrão é float32.
+        materialize (bool, optional): Se True, retorna cópias contíguas em vez de visões. Padrão é False.
+
+    Returns:
+        tuple: (X, y) com formatos (N, time_steps, 1) e (N,), onde N = len(series) - time_steps.
+    """
+    values = np.asarray(series)
+    if values.ndim > 1:
+        values = values[:, 0]
+    values = np.ascontiguousarray(values, dtype=dtype) # Única cópia: a série compacta no dtype de saída
+
+    if len(values) <= time_steps:
+        X = np.empty((0, time_steps, 1), dtype=dtype)
+        y = np.empty((0,), dtype=dtype)
+        return X, y
+
+    X = sliding_window_view(values[:-1], time_steps)[:, :, np.newaxis]
+    y = values[time_steps:]
+    if materialize:
+        X = np.ascontiguousarray(X)
+    return X, y
+
+
+def preprocess_data(data, sequence_lenght=60, materialize=False):
     """
     Pré-processar os dados para uso em modelos de aprendizado de máquina,
     particularmente no caso de previsão de séries temporais.
@@ -59,17 +148,12 @@ def preprocess_data(data, sequence_lenght=60):
         data (pandas.DataFrame): Dados a serem processados.
         sequence_lenght (int, optional):  Número de dias a serem usados para formar a
         sequência de entrada para o modelo. Defaults to 60.
+        materialize (bool, optional): Se True, retorna arrays contíguos em vez de visões sobre a
+        série (ver `build_windows`). Defaults to False.
 
     Returns:
         X_train, y_train, X_test, y_test
     """
-
-    def create_sequences(data, time_steps):
-        X, y = [], []
-        for i in range(time_steps, len(data)):
-            X.append(data[i-time_steps:i, 0])
-            y.append(data[i, 0])
-        return np.array(X), np.array(y)
     try:
         logging.info('Preprocessando os dados!')
         train_size = int(len(data) * 0.8)
@@ -79,27 +163,129 @@ def preprocess_data(data, sequence_lenght=60):
         logging.info(f"Tamanho dos dados de treino: {len(train_data)}")
         logging.info(f"Tamanho dos dados de teste: {len(test_data)}")
 
-        X_train, y_train = create_sequences(train_data.values, sequence_lenght)
-        X_test, y_test = create_sequences(test_data.values, sequence_lenght)
+        X_train, y_train = build_windows(train_data.values, sequence_lenght, materialize=materialize)
+        X_test, y_test = build_windows(test_data.values, sequence_lenght, materialize=materialize)
 
-        X_train = np.reshape(X_train, (X_train.shape[0], X_train.shape[1], 1))
-        X_test = np.reshape(X_test, (X_test.shape[0], X_test.shape[1], 1))
-
-        logging.info("Formato X_train:", X_train.shape)
-        logging.info("Formato y_train:", y_train.shape)
-        logging.info("Formato X_test:", X_test.shape)
-        logging.info("Formato y_test:", y_test.shape)
+        logging.info(f"Formato X_train: {X_train.shape}")
+        logging.info(f"Formato y_train: {y_train.shape}")
+        logging.info(f"Formato X_test: {X_test.shape}")
+        logging.info(f"Formato y_test: {y_test.shape}")
 
         return X_train, y_train, X_test, y_test
     except Exception as e:
         logging.error(f"Erro ao preprocessar os dados: {e}")
         raise RuntimeError(f"Erro ao preprocessar os dados: {e}")
 
-    
-    
-def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, retry_delay=60, max_retries=3):
+
+def make_window_dataset(series, time_steps=60, batch_size=32, shuffle=True, seed=None):
+    """
+    Cria um `tf.data.Dataset` que gera as janelas (X, y) sob demanda a partir da série compacta.
+
+    Em vez de materializar o tensor (N, time_steps, 1), o dataset embaralha apenas os índices
+    de início das janelas e monta cada lote com um `gather` sobre a série, de modo que a memória
+    cresce com o tamanho da série e não com `time_steps` vezes o tamanho da série. Se `series`
+    for um `numpy.memmap`, as janelas são lidas do disco lote a lote, sem carregar a série inteira.
+
+    Args:
+        series (numpy.ndarray): Série de valores (1D ou 2D com a primeira coluna usada).
+        time_steps (int, optional): Tamanho da janela. Padrão é 60.
+        batch_size (int, optional): Tamanho do lote. Padrão é 32.
+        shuffle (bool, optional): Se True, embaralha as janelas a cada época. Padrão é True.
+        seed (int, optional): Semente do embaralhamento.
+
+    Returns:
+        tf.data.Dataset: Lotes (X, y) com formatos (batch, time_steps, 1) e (batch,), em float32.
+    """
+    import tensorflow as tf # Importado sob demanda: só o treino precisa do TensorFlow
+
+    values = np.asarray(series) if not isinstance(series, np.memmap) else series
+    if values.ndim > 1:
+        values = values[:, 0]
+    n_windows = max(len(values) - time_steps, 0)
+
+    dataset = tf.data.Dataset.range(n_windows)
+    if shuffle:
+        dataset = dataset.shuffle(n_windows or 1, seed=seed, reshuffle_each_iteration=True) # Buffer só de índices (8 bytes por janela)
+    dataset = dataset.batch(batch_size)
+
+    if isinstance(values, np.memmap):
+        offsets = np.arange(time_steps + 1)
+
+        def read_windows(starts):
+            rows = np.asarray(values[starts[:, None] + offsets], dtype=np.float32) # Lê do disco só as linhas do lote
+            return rows[:, :-1, np.newaxis], rows[:, -1]
+
+        def to_windows(starts):
+            X, y = tf.numpy_function(read_windows, [starts], (tf.float32, tf.float32))
+            return tf.ensure_shape(X, (None, time_steps, 1)), tf.ensure_shape(y, (None,))
+    else:
+        compact = tf.constant(np.ascontiguousarray(values, dtype=np.float32)) # Única cópia: a série compacta
+        offsets = tf.range(time_steps + 1, dtype=tf.int64)
+
+        def to_windows(starts):
+            rows = tf.gather(compact, starts[:, None] + offsets)
+            return rows[:, :-1, tf.newaxis], rows[:, -1]
+
+    return dataset.map(to_windows, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def preprocess_data_streaming(data, sequence_lenght=60, batch_size=32, memmap_path=None, seed=None):
+    """
+    Versão de `preprocess_data` que retorna datasets de streaming em vez de arrays de janelas.
+
+    A divisão treino/teste é a mesma de `preprocess_data` (80/20 antes de formar as janelas).
+
+    Args:
+        data (pandas.DataFrame): Dados (já padronizados) a serem processados.
+        sequence_lenght (int, optional): Tamanho da janela. Defaults to 60.
+        batch_size (int, optional): Tamanho do lote. Defaults to 32.
+        memmap_path (str, optional): Se informado, a série é gravada neste arquivo `.npy` (extensão
+        acrescentada se ausente) e lida por memory-map durante o treino. Defaults to None (série em memória).
+        seed (int, optional): Semente do embaralhamento das janelas de treino.
+
+    Returns:
+        train_dataset, test_dataset: `tf.data.Dataset` de lotes (X, y); só o de treino é embaralhado.
+    """
+    try:
+        logging.info('Preprocessando os dados em modo streaming!')
+        values = np.asarray(data.values, dtype=np.float32)[:, 0]
+        if memmap_path is not None:
+            memmap_path = os.fspath(memmap_path)
+            if not memmap_path.endswith('.npy'): # np.save acrescenta a extensão; np.load não
+                memmap_path = f'{memmap_path}.npy'
+            np.save(memmap_path, values)
+            values = np.load(memmap_path, mmap_mode='r')
+
+        train_size = int(len(values) * 0.8)
+        logging.info(f"Tamanho dos dados de treino: {train_size}")
+        logging.info(f"Tamanho dos dados de teste: {len(values) - train_size}")
+
+        train_dataset = make_window_dataset(values[:train_size], sequence_lenght, batch_size, shuffle=True, seed=seed)
+        test_dataset = make_window_dataset(values[train_size:], sequence_lenght, batch_size, shuffle=False)
+        return train_dataset, test_dataset
+    except Exception as e:
+        logging.error(f"Erro ao preprocessar os dados: {e}")
+        raise RuntimeError(f"Erro ao preprocessar os dados: {e}")
+
+
+def set_fetch_function(fetch_fn=None):
+    """Substitui a função de download usada por `download_stock_data` (ex: por uma fonte local em testes).
+
+    Args:
+        fetch_fn (callable, optional): Função com a mesma assinatura de `fetch_from_providers`.
+                                       Se None, restaura a camada de download configurada em DATA_FETCHER.
+    """
+    global _FETCH_FUNCTION
+    _FETCH_FUNCTION = fetch_fn if fetch_fn is not None else _default_fetch_function()
+
+
+def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, retry_delay=60, max_retries=3, use_cache=True):
     """
-    Baixa os dados históricos da ação, tentando yfinance primeiro e Alpha Vantage como fallback.
+    Baixa os dados históricos da ação, tentando Yahoo Finance primeiro e Alpha Vantage como fallback
+    (por padrão pela camada assíncrona de `src/data_fetcher.py`; ver DATA_FETCHER).
+
+    Os fechamentos já baixados ficam num cache local em disco (ver `src/price_cache.py`), de modo que
+    apenas o intervalo ainda não coberto é buscado na rede.
 
     Args:
         stock_symbol (str): O símbolo da ação (ex: "AAPL").
@@ -108,10 +294,13 @@ def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, re
                                     Se None, usa a data de hoje.
         retry_delay (int): Tempo em segundos para esperar antes de retentar o download em caso de rate limit.
         max_retries (int): Número máximo de tentativas para baixar os dados com yfinance antes de usar Alpha Vantage.
+        use_cache (bool): Se True (padrão), usa o cache local de históricos. Pode ser desligado
+                          globalmente com a variável de ambiente PRICE_CACHE_ENABLED=0.
 
     Returns:
         pandas.DataFrame: DataFrame com os dados históricos da ação, ou None em caso de falha após várias tentativas.
     """
+    import pandas as pd
     if end_date is None:
         end_date = datetime.today().strftime('%Y-%m-%d')
 
@@ -122,6 +311,38 @@ def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, re
         logging.warning(f"Data de início ({start_date}) é igual ou posterior à data de fim ({end_date}). Retornando DataFrame vazio.")
         return pd.DataFrame()  # Retorna DataFrame vazio em vez de erro
 
+    def fetch(symbol, start, end):
+        with timed('fetch'): # Só a parte buscada na rede (ou na função substituta)
+            return _FETCH_FUNCTION(symbol, start, end, retry_delay=retry_delay, max_retries=max_retries)
+
+    with timed('download'): # Total, incluindo a leitura do cache local
+        if use_cache and PRICE_CACHE_ENABLED:
+            return price_cache.get_cached_history(stock_symbol, start_date, end_date, fetch_fn=fetch)
+        return fetch(stock_symbol, start_date, end_date)
+
+
+def fetch_from_providers(stock_symbol, start_date, end_date, retry_delay=60, max_retries=3):
+    """
+    Baixa da rede os dados históricos da ação no intervalo pedido, sem passar pelo cache local.
+
+    Args:
+        stock_symbol (str): O símbolo da ação (ex: "AAPL").
+        start_date (str): A data inicial para o download dos dados. Formato: 'YYYY-MM-DD'.
+        end_date (str): A data final para o download dos dados. Formato: 'YYYY-MM-DD'.
+        retry_delay (int): Tempo em segundos para esperar antes de retentar o download em caso de rate limit.
+        max_retries (int): Número máximo de tentativas para baixar os dados com yfinance antes de usar Alpha Vantage.
+
+    Returns:
+        pandas.DataFrame: DataFrame com a coluna 'Close', vazio se nenhum provedor tiver dados para o período.
+    """
+    # Importados sob demanda: os provedores só são necessários quando o cache local não cobre o pedido
+    import pandas as pd
+    import yfinance as yf
+    from alpha_vantage.timeseries import TimeSeries
+
+    start_date_dt = pd.to_datetime(start_date)
+    end_date_dt = pd.to_datetime(end_date)
+
     # Tentar com yfinance primeiro
     for retry in range(max_retries):
         try:
@@ -131,7 +352,7 @@ def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, re
             if not data.empty:
                 data = data[['Close']]
                 data.index = pd.to_datetime(data.index)
-                logging.info(f'Dados de {stock_symbol} baixados com sucesso de Yahoo Finance.')
+                log_request('Dados de %s baixados com sucesso de Yahoo Finance.', stock_symbol)
                 return data
             else:
                 logging.warning(f"Yahoo Finance retornou dados vazios para {stock_symbol} no período {start_date} - {end_date}.")
@@ -140,6 +361,8 @@ def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, re
         except yf.YFError as yf_error: # Captura erros gerais de yfinance também
             if "Rate Limit Exceeded" in str(yf_error) or isinstance(yf_error, yf.YFRateLimitError): # Verifica explicitamente a mensagem ou o tipo de erro
                 logging.warning(f"Yahoo Finance: Limite de requisições atingido para {stock_symbol} (Tentativa {retry + 1}/{max_retries}). Aguardando {retry_delay} segundos...")
+                increment('fetch_rate_limited_total', provider='yahoo')
+                increment('fetch_retries_total', provider='yahoo')
                 time.sleep(retry_delay)
             else:
                 logging.error(f"Erro com Yahoo Finance para {stock_symbol} (Tentativa {retry + 1}/{max_retries}): {yf_error}")
@@ -149,6 +372,7 @@ def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, re
             break # Sai do loop de retentativas e tenta Alpha Vantage
 
     logging.info(f"Tentando baixar dados de {stock_symbol} com Alpha Vantage como fallback.")
+    increment('fetch_fallbacks_total', provider='alphavantage')
     try:
         api_key = os.getenv('ALPHA_KEY')
         if not api_key:
@@ -172,7 +396,7 @@ def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, re
             return pd.DataFrame() # Retorna DataFrame vazio se não houver dados no período desejado
 
         df_filtered = df_filtered.sort_index(ascending=True)
-        logging.info(f'Dados de {stock_symbol} baixados com sucesso de Alpha Vantage.')
+        log_request('Dados de %s baixados com sucesso de Alpha Vantage.', stock_symbol)
         return df_filtered
 
     except ValueError as ve:
@@ -180,4 +404,13 @@ def download_stock_data(stock_symbol, start_date='2020-01-01', end_date=None, re
         raise ValueError(f"Erro de configuração com Alpha Vantage: {ve}") # Re-levanta ValueError para indicar problema de config
     except Exception as e:
         logging.error(f"Erro ao processar download com Alpha Vantage para {stock_symbol}: {e}")
+        increment('fetch_failures_total')
         raise RuntimeError(f"Falha ao baixar dados para {stock_symbol} com Yahoo Finance e Alpha Vantage: {e}") # Re-levanta RuntimeError para falha geral
+
+
+def _default_fetch_function():
+    return fetch_from_providers if DATA_FETCHER == 'legacy' else fetch_with_async_providers
+
+
+# Função de download usada por download_stock_data (substituível via set_fetch_function)
+_FETCH_FUNCTION = _default_fetch_function()
@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.prediction_cache import effective_last_bar
+
+# Configuração do armazenamento de previsões pré-calculadas (variáveis de ambiente)
+FORECAST_STORE_ENABLED = os.getenv('FORECAST_STORE_ENABLED', '1') != '0'
+FORECAST_STORE_PATH = os.getenv('FORECAST_STORE_PATH', os.path.join('models', 'forecasts.npz'))
+
+# Intervalo mínimo, em segundos, entre verificações de um arquivo novo gravado pelo job (ver `src/precompute.py`)
+FORECAST_STORE_CHECK_SECONDS = float(os.getenv('FORECAST_STORE_CHECK_SECONDS', '5'))
+
+
+def write_store(rows, horizon, path=None, created_at=None):
+    """Grava as previsões pré-calculadas em um arquivo `.npz` compacto, substituindo o anterior.
+
+    O arquivo guarda colunas (símbolo, primeiro e último pregão da janela, índice do modelo/versão, time_steps), a
+    tabela dos modelos/versões usados e uma matriz (símbolos, horizon) com os preços previstos.
+    A gravação é atômica (arquivo temporário + rename): processos da API que leem o arquivo nunca
+    veem uma versão pela metade.
+
+    Args:
+        rows (list[tuple]): (símbolo, primeiro pregão da janela em ISO, último pregão em ISO,
+                            'símbolo_do_modelo@versão', time_steps, preços previstos).
+        horizon (int): Número de dias previstos por símbolo.
+        path (str, optional): Arquivo de destino. Padrão é FORECAST_STORE_PATH.
+        created_at (float, optional): Momento do cálculo (epoch). Padrão é agora.
+
+    Raises:
+        RuntimeError: Se ocorrer um erro ao gravar o arquivo.
+    """
+    path = path or FORECAST_STORE_PATH
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        prices = np.array([row[5][:horizon] for row in rows], dtype=np.float64).reshape(len(rows), horizon)
+        models, model_ids = np.unique(np.array([row[3] for row in rows], dtype=str), return_inverse=True) # Poucos modelos para muitos símbolos
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                symbols=np.array([row[0].upper() for row in rows], dtype='S'),
+                first_bars=np.array([row[1] for row in rows], dtype='datetime64[D]'),
+                last_bars=np.array([row[2] for row in rows], dtype='datetime64[D]'),
+                models=models,
+                model_ids=model_ids.astype(np.int32),
+                time_steps=np.array([row[4] for row in rows], dtype=np.int32),
+                prices=prices,
+                horizon=np.int32(horizon),
+                created_at=np.float64(created_at or time.time()),
+            )
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.error(f'Erro ao gravar as previsões pré-calculadas em {path}: {e}')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f'Erro ao gravar as previsões pré-calculadas: {e}')
+
+
+class ForecastStore:
+    """Leitura das previsões pré-calculadas, com busca O(1) por símbolo.
+
+    O arquivo é carregado inteiro em memória (um dicionário símbolo -> linha e a matriz de preços)
+    e recarregado quando o job grava uma versão nova. Uma previsão só é usada quando corresponde
+    exatamente ao que a requisição calcularia: mesmo último pregão, mesmo modelo/versão, mesma
+    janela, horizonte coberto e um `start_date` que inclua a janela inteira. Caso contrário a
+    requisição segue para o cálculo normal (que responde, por exemplo, o erro de histórico
+    insuficiente para a janela).
+
+    Args:
+        path (str, optional): Arquivo gravado por `write_store`. Padrão é FORECAST_STORE_PATH.
+        check_seconds (float, optional): Intervalo mínimo entre verificações de um arquivo novo.
+    """
+
+    def __init__(self, path=None, check_seconds=None):
+        self.path = path or FORECAST_STORE_PATH
+        self.check_seconds = FORECAST_STORE_CHECK_SECONDS if check_seconds is None else check_seconds
+        self._snapshot = ({}, None, 0, None) # (símbolo -> (linha, primeiro pregão, último pregão, modelo, time_steps), preços, horizon, criado_em)
+        self._warned_models = set() # Versões do modelo já avisadas como diferentes das do armazenamento
+        self._mtime = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'model_mismatches': 0, 'reloads': 0}
+
+    def _refresh(self):
+        """Recarrega o arquivo se ele mudou desde a última leitura (no máximo uma verificação por `check_seconds`)."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_seconds: # Outra thread acabou de verificar
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                if self._mtime is not None:
+                    self._snapshot, self._mtime = ({}, None, 0, None), None
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with np.load(self.path, allow_pickle=False) as data:
+                    models = data['models'].tolist()
+                    table = {
+                        symbol.decode(): (row, first_bar, last_bar, models[model_id], time_steps)
+                        for row, (symbol, first_bar, last_bar, model_id, time_steps) in enumerate(zip(
+                            data['symbols'].tolist(), data['first_bars'].astype(str).tolist(), data['last_bars'].astype(str).tolist(),
+                            data['model_ids'].tolist(), data['time_steps'].tolist()))
+                    }
+                    self._snapshot = (table, data['prices'], int(data['horizon']), float(data['created_at']))
+                self._mtime = mtime
+                self._warned_models = set()
+                self.stats['reloads'] += 1
+                logging.info(f'Previsões pré-calculadas carregadas de {self.path}: {len(table)} símbolos.')
+            except Exception as e:
+                logging.error(f'Erro ao carregar as previsões pré-calculadas de {self.path}: {e}')
+
+    def lookup(self, symbol, start_date, end_date, horizon, entry, time_steps=60):
+        """Retorna as previsões pré-calculadas do símbolo, ou None se não houver uma que corresponda à requisição.
+
+        Args:
+            symbol (str): Símbolo da ação.
+            start_date (str): Data de início do download da requisição (YYYY-MM-DD). Se for posterior ao
+                              primeiro pregão da janela, o cálculo normal não teria histórico suficiente.
+            end_date (str): Data de fim do download da requisição (YYYY-MM-DD).
+            horizon (int): Número de dias pedidos.
+            entry (ModelEntry): Modelo que a requisição usaria; sua versão precisa ser a do cálculo.
+            time_steps (int, optional): Tamanho da janela, se o modelo não definir o seu. Padrão é 60.
+
+        Returns:
+            numpy.ndarray: Os `horizon` preços previstos, ou None.
+        """
+        self._refresh()
+        table, prices, stored_horizon, _ = self._snapshot
+        found = table.get(symbol.upper())
+        if found is None or horizon > stored_horizon:
+            self.stats['misses'] += 1
+            return None
+        row, first_bar, last_bar, model, stored_time_steps = found
+        expected_model = f'{entry.symbol}@{entry.version}'
+        if model != expected_model:
+            self.stats['model_mismatches'] += 1
+            if expected_model not in self._warned_models: # Um aviso por versão e arquivo: o job usou outro modelo
+                self._warned_models.add(expected_model)
+                logging.warning(f'Previsões pré-calculadas de {symbol} usam o modelo {model}, mas a API usa {expected_model}. '
+                                f'Recalcule o armazenamento com o modelo atual (ver src/precompute.py).')
+            return None
+        if last_bar != effective_last_bar(end_date)[0] or stored_time_steps != (entry.time_steps or time_steps):
+            self.stats['stale'] += 1 # Pregão mais recente desde o último cálculo
+            return None
+        if start_date > first_bar: # Datas ISO: a comparação de texto segue a ordem cronológica
+            self.stats['misses'] += 1 # O cálculo normal responde o erro de histórico insuficiente
+            return None
+        self.stats['hits'] += 1
+        return prices[row, :horizon] # O rollout é autorregressivo: os primeiros dias não dependem do horizonte pedido
+
+    def get_stats(self):
+        """Retorna os contadores, o número de símbolos carregados e a idade do cálculo em segundos."""
+        self._refresh()
+        table, _, horizon, created_at = self._snapshot
+        return dict(self.stats, symbols=len(table), horizon=horizon,
+                    age_seconds=time.time() - created_at if created_at is not None else None)
+
+
+_FORECAST_STORE = None
+
+
+def get_forecast_store():
+    """Retorna o armazenamento de previsões pré-calculadas do processo, criando-o na primeira chamada (None se desligado)."""
+    global _FORECAST_STORE
+    if not FORECAST_STORE_ENABLED:
+        return None
+    if _FORECAST_STORE is None:
+        _FORECAST_STORE = ForecastStore()
+    return _FORECAST_STORE
@@ -0,0 +1,255 @@
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.logger import configure_logging
+from src.data_handler import download_stock_data, standardize_data
+from src.model_building import DEFAULT_START_DATE, DEFAULT_END_DATE, _init_training_worker, main as train_symbol
+from src.model_registry import save_hyperparameters
+
+# Grade padrão da busca (ver `--units`, `--batch-sizes` e `--time-steps` na linha de comando)
+DEFAULT_GRID = {'units': [32, 50, 64], 'batch_size': [32, 64], 'time_steps': [30, 60, 90]}
+
+# Diretório dos relatórios de cada busca (todas as tentativas, com a curva de validação)
+SEARCH_DIR = os.path.join('models', 'search')
+
+# Dados compartilhados do processo de busca (anexados uma vez por processo em `_init_search_worker`)
+_SHARED = {}
+
+
+def build_grid(grid=None, max_trials=None, seed=0):
+    """Monta as tentativas da busca a partir da grade de hiperparâmetros.
+
+    Args:
+        grid (dict, optional): Valores de cada hiperparâmetro. Padrão é `DEFAULT_GRID`.
+        max_trials (int, optional): Se informado, sorteia no máximo este número de combinações.
+        seed (int, optional): Semente do sorteio. Padrão é 0.
+
+    Returns:
+        list[dict]: Uma configuração por tentativa.
+    """
+    grid = grid or DEFAULT_GRID
+    names = list(grid)
+    trials = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if max_trials is not None and max_trials < len(trials):
+        trials = random.Random(seed).sample(trials, max_trials)
+    return trials
+
+
+def _init_search_worker(threads_per_worker, series_name, series_length, progress_name, progress_shape):
+    """Inicializa um processo da busca: limita as threads e anexa a série e a tabela de progresso compartilhadas."""
+    _init_training_worker(threads_per_worker)
+    series_memory = shared_memory.SharedMemory(name=series_name)
+    progress_memory = shared_memory.SharedMemory(name=progress_name)
+    _SHARED['memory'] = (series_memory, progress_memory) # Mantém as referências vivas enquanto o processo existir
+    _SHARED['series'] = np.ndarray((series_length,), dtype=np.float32, buffer=series_memory.buf)
+    _SHARED['progress'] = np.ndarray(progress_shape, dtype=np.float64, buffer=progress_memory.buf)
+
+
+def _pruning_callback(trial_index, progress, warmup_epochs, min_peers):
+    """Callback do Keras que publica o val_loss de cada época e interrompe tentativas piores que a mediana.
+
+    Ao fim de cada época, o val_loss da tentativa é gravado na tabela compartilhada (tentativas x
+    épocas). A partir de `warmup_epochs`, se ao menos `min_peers` outras tentativas já passaram pela
+    mesma época e o val_loss está acima da mediana delas, o treino é interrompido.
+    """
+    from tensorflow.keras.callbacks import Callback # Importado sob demanda: o TensorFlow só é carregado no processo de treino
+
+    class MedianPruning(Callback):
+        def __init__(self):
+            super().__init__()
+            self.pruned_at = None
+
+        def on_epoch_end(self, epoch, logs=None):
+            val_loss = float((logs or {}).get('val_loss', np.nan))
+            progress[trial_index, epoch] = val_loss
+            if epoch + 1 < warmup_epochs or not np.isfinite(val_loss):
+                return
+            peers = np.delete(progress[:, epoch], trial_index)
+            peers = peers[np.isfinite(peers)]
+            if len(peers) >= min_peers and val_loss > np.median(peers):
+                self.pruned_at = epoch + 1
+                self.model.stop_training = True
+
+    return MedianPruning()
+
+
+def _run_trial(trial_index, params, train_size, epochs, warmup_epochs, min_peers):
+    """Treina uma tentativa sobre a série compartilhada e retorna o resultado, sem propagar exceções."""
+    started = time.perf_counter()
+    try:
+        from src.data_handler import make_window_dataset
+        from src.lstm_model import create_model
+
+        series, progress = _SHARED['series'], _SHARED['progress']
+        # As janelas são montadas lote a lote a partir da série compartilhada: nada de (N, time_steps) por processo
+        train_ds = make_window_dataset(series[:train_size], params['time_steps'], params['batch_size'], shuffle=True, seed=trial_index)
+        val_ds = make_window_dataset(series[train_size:], params['time_steps'], params['batch_size'], shuffle=False)
+
+        pruning = _pruning_callback(trial_index, progress, warmup_epochs, min_peers)
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            _, history = create_model(train_ds, None, val_ds, None, units=params['units'], batch_size=params['batch_size'],
+                                      epochs=epochs, model_dir=checkpoint_dir, callbacks=[pruning], verbose=0)
+        val_losses = [float(value) for value in history.history['val_loss']]
+        return {
+            'trial': trial_index,
+            'params': params,
+            'status': 'pruned' if pruning.pruned_at else 'complete',
+            'val_loss': min(val_losses),
+            'epochs': len(val_losses),
+            'val_loss_curve': val_losses,
+            'seconds': time.perf_counter() - started,
+        }
+    except Exception as e:
+        return {'trial': trial_index, 'params': params, 'status': 'failed', 'error': str(e), 'seconds': time.perf_counter() - started}
+
+
+def run_search(symbol, start_date=DEFAULT_START_DATE, end_date=DEFAULT_END_DATE, grid=None, max_trials=None, epochs=30,
+               warmup_epochs=3, min_peers=2, max_workers=None, threads_per_worker=1, set_default=False, train_best=False):
+    """
+    Busca em grade os hiperparâmetros do modelo de um símbolo, com tentativas em paralelo e poda pela mediana.
+
+    A série padronizada é baixada e preparada uma única vez e colocada em memória compartilhada; cada
+    processo de treino a anexa e monta as janelas de cada tentativa lote a lote (ver
+    `make_window_dataset`), com a janela (`time_steps`) da tentativa; nenhum processo recebe cópias
+    das janelas nem baixa os dados de novo. Tentativas cujo val_loss fica acima da mediana das demais na
+    mesma época são interrompidas (ver `_pruning_callback`). A divisão treino/validação é a de `main`.
+
+    A melhor configuração é gravada em `hyperparameters.json` no registro do símbolo (e, com
+    `set_default`, também em `models/`), e passa a ser usada por `model_building.main`. O relatório
+    com todas as tentativas fica em `models/search/`.
+
+    Args:
+        symbol (str): Símbolo da ação.
+        start_date (str, optional): Data inicial dos dados (YYYY-MM-DD).
+        end_date (str, optional): Data final dos dados (YYYY-MM-DD).
+        grid (dict, optional): Valores de units, batch_size e time_steps. Padrão é `DEFAULT_GRID`.
+        max_trials (int, optional): Número máximo de combinações sorteadas da grade. Padrão é a grade inteira.
+        epochs (int, optional): Máximo de épocas por tentativa (gravado como `epochs` da melhor configuração). Padrão é 30.
+        warmup_epochs (int, optional): Épocas antes de uma tentativa poder ser podada. Padrão é 3.
+        min_peers (int, optional): Outras tentativas necessárias na mesma época para podar. Padrão é 2.
+        max_workers (int, optional): Processos de treino. Padrão é núcleos / threads_per_worker.
+        threads_per_worker (int, optional): Threads do TensorFlow por processo. Padrão é 1.
+        set_default (bool, optional): Se True, grava também a configuração padrão (`models/hyperparameters.json`).
+        train_best (bool, optional): Se True, treina e registra o modelo do símbolo com a melhor configuração.
+
+    Raises:
+        RuntimeError: Se os dados não puderem ser preparados ou nenhuma tentativa terminar.
+
+    Returns:
+        dict: Relatório da busca com 'best' (configuração e val_loss) e 'trials'.
+    """
+    symbol = symbol.upper()
+    trials = build_grid(grid, max_trials)
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+    try:
+        data = download_stock_data(stock_symbol=symbol, start_date=start_date, end_date=end_date)
+        scaled = standardize_data(data, scaler_path=None)
+        values = np.asarray(scaled.values, dtype=np.float32)[:, 0]
+    except Exception as e:
+        logging.error(f'Erro ao preparar os dados da busca de hiperparâmetros de {symbol}: {e}')
+        raise RuntimeError(f'Erro ao preparar os dados da busca de hiperparâmetros: {e}')
+
+    train_size = int(len(values) * 0.8) # Mesma divisão de `preprocess_data`
+    series_memory = shared_memory.SharedMemory(create=True, size=values.nbytes)
+    progress_memory = shared_memory.SharedMemory(create=True, size=len(trials) * epochs * 8)
+    try:
+        np.ndarray(values.shape, dtype=np.float32, buffer=series_memory.buf)[:] = values
+        progress = np.ndarray((len(trials), epochs), dtype=np.float64, buffer=progress_memory.buf)
+        progress[:] = np.nan
+
+        logging.info(f'Busca de hiperparâmetros de {symbol}: {len(trials)} tentativas, até {epochs} épocas cada, '
+                     f'{max_workers} processos com {threads_per_worker} thread(s).')
+        started = datetime.now()
+        results = []
+        context = multiprocessing.get_context('spawn') # Processos limpos, como em `train_universe`
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_search_worker,
+                                 initargs=(threads_per_worker, series_memory.name, len(values), progress_memory.name, progress.shape)) as executor:
+            futures = [executor.submit(_run_trial, index, params, train_size, epochs, warmup_epochs, min_peers)
+                       for index, params in enumerate(trials)]
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    result = future.result()
+                except Exception as e: # O processo de treino morreu (ex: falta de memória)
+                    result = {'trial': futures.index(future), 'status': 'failed', 'error': str(e)}
+                results.append(result)
+                logging.info(f'Busca {symbol}: tentativa {result["trial"]} {result["status"]} '
+                             f'(val_loss {result.get("val_loss", float("nan")):.6f}, {result.get("epochs", 0)} épocas) ({done}/{len(trials)}).')
+    finally:
+        series_memory.close()
+        series_memory.unlink()
+        progress_memory.close()
+        progress_memory.unlink()
+
+    finished = [result for result in results if result['status'] != 'failed']
+    if not finished:
+        raise RuntimeError(f'Nenhuma tentativa da busca de hiperparâmetros de {symbol} terminou: {results[0].get("error") if results else ""}')
+    best = min(finished, key=lambda result: result['val_loss'])
+    report = {
+        'symbol': symbol,
+        'start_date': start_date,
+        'end_date': end_date,
+        'started_at': started.isoformat(timespec='seconds'),
+        'duration_seconds': (datetime.now() - started).total_seconds(),
+        'best': best,
+        'trials': sorted(results, key=lambda result: result['trial']),
+    }
+    logging.info(f'Busca {symbol} concluída em {datetime.now() - started}: melhor configuração {best["params"]} '
+                 f'(val_loss {best["val_loss"]:.6f}); {sum(result["status"] == "pruned" for result in results)} tentativas podadas.')
+
+    config = dict(best['params'], epochs=epochs, val_loss=best['val_loss'], searched_at=report['started_at'],
+                  search_period=[start_date, end_date], trials=len(trials))
+    save_hyperparameters(config, symbol=symbol)
+    if set_default:
+        save_hyperparameters(dict(config, symbol=symbol))
+
+    os.makedirs(SEARCH_DIR, exist_ok=True)
+    with open(os.path.join(SEARCH_DIR, f"{symbol}_{started.strftime('%Y%m%dT%H%M%S')}.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    if train_best:
+        report['version'] = train_symbol(symbol, set_default=set_default, start_date=start_date, end_date=end_date)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Busca em grade dos hiperparâmetros do modelo LSTM de um símbolo.')
+    parser.add_argument('--symbol', default='MSFT')
+    parser.add_argument('--start-date', default=DEFAULT_START_DATE)
+    parser.add_argument('--end-date', default=DEFAULT_END_DATE)
+    parser.add_argument('--units', type=int, nargs='+', default=DEFAULT_GRID['units'])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_GRID['batch_size'])
+    parser.add_argument('--time-steps', type=int, nargs='+', default=DEFAULT_GRID['time_steps'])
+    parser.add_argument('--max-trials', type=int, default=None, help='Sorteia no máximo este número de combinações da grade.')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--warmup-epochs', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--set-default', action='store_true', help='Grava também a configuração padrão (models/hyperparameters.json).')
+    parser.add_argument('--train-best', action='store_true', help='Treina e registra o modelo com a melhor configuração.')
+    args = parser.parse_args()
+
+    configure_logging()
+    report = run_search(args.symbol, start_date=args.start_date, end_date=args.end_date,
+                        grid={'units': args.units, 'batch_size': args.batch_sizes, 'time_steps': args.time_steps},
+                        max_trials=args.max_trials, epochs=args.epochs, warmup_epochs=args.warmup_epochs,
+                        max_workers=args.workers, threads_per_worker=args.threads_per_worker,
+                        set_default=args.set_default, train_best=args.train_best)
+    print(f"{'tentativa':<10}{'units':>6}{'batch':>6}{'janela':>7}{'status':>10}{'épocas':>8}{'val_loss':>12}")
+    for trial in report['trials']:
+        params = trial.get('params', {})
+        print(f"{trial['trial']:<10}{params.get('units', ''):>6}{params.get('batch_size', ''):>6}{params.get('time_steps', ''):>7}"
+              f"{trial['status']:>10}{trial.get('epochs', 0):>8}{trial.get('val_loss', float('nan')):>12.6f}")
+    print(f"Melhor configuração: {report['best']['params']} (val_loss {report['best']['val_loss']:.6f})")
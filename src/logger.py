@@ -1,40 +1,150 @@
+import atexit
 import logging
+import logging.handlers
 import os
-import inspect
+import queue
+import random
+import sys
+import threading
 
-def configure_logging():
+# Se '1' (padrão), os registros vão para uma fila e são formatados e gravados por uma thread em segundo plano,
+# fora do caminho das requisições. Se '0', os handlers gravam de forma síncrona, como antes.
+LOG_ASYNC = os.getenv('LOG_ASYNC', '1') == '1'
+
+# Fração (0 a 1) das linhas INFO por requisição que são registradas (ver `log_request`). Avisos e erros nunca são amostrados.
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv('LOG_REQUEST_SAMPLE_RATE', '1'))
+
+# Tamanho máximo da fila; cheia, as linhas INFO novas são descartadas em vez de bloquear quem registra
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+_REQUEST_LOGGER = logging.getLogger('stock_forecaster.requests')
+_LOCK = threading.Lock()
+_STATE = {'configured': False, 'handler': None, 'listener': None, 'dropped': 0, 'hooks_installed': False}
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que enfileira o registro sem formatá-lo.
+
+    O `QueueHandler` padrão formata a mensagem (msg % args) na thread que registra; aqui a
+    formatação fica para a thread do `QueueListener`. Os argumentos das mensagens do projeto são
+    valores imutáveis (textos e números), então formatá-los depois não muda o resultado.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record) # Avisos e erros esperam por espaço na fila; só linhas INFO são descartadas
+            else:
+                _STATE['dropped'] += 1
+
+
+def _start_listener(handlers):
+    """Cria a fila e a thread que grava os registros nos handlers."""
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _STATE['listener'] = listener
+    if _STATE['handler'] is None:
+        _STATE['handler'] = _LazyQueueHandler(log_queue)
+    else:
+        _STATE['handler'].queue = log_queue
+
+
+def _after_fork_in_child():
+    # A thread de gravação não sobrevive ao fork (ex: workers de `src/server.py`): o processo filho
+    # recebe uma fila e uma thread próprias; registros pendentes do pai são gravados pelo pai
+    global _LOCK
+    _LOCK = threading.Lock()
+    if _STATE['listener'] is not None:
+        _start_listener(_STATE['listener'].handlers)
+
+
+def stop_logging():
+    """Grava os registros pendentes na fila e encerra a thread de gravação (chamado na saída do processo)."""
+    with _LOCK:
+        listener, _STATE['listener'] = _STATE['listener'], None
+    if listener is not None:
+        listener.stop()
+
+
+def configure_logging(name=None):
     """
     Configura o sistema de logging criando um arquivo específico com base no nome do módulo que chamou.
+
+    A configuração é idempotente: só a primeira chamada configura (ex: o script ou o processo
+    principal de `src/server.py`), e as seguintes (ex: no startup da API) não fazem nada. Handlers
+    instalados antes no logger raiz, como o que o logging cria sozinho quando uma mensagem é
+    registrada antes de qualquer configuração, são substituídos. Com LOG_ASYNC=1, o logger raiz
+    recebe apenas um handler de fila, e a formatação e a escrita no arquivo e no console ficam com
+    uma thread em segundo plano.
+
+    Args:
+        name (str, optional): Nome do arquivo de log (sem extensão). Se None, usa o nome do módulo que chamou.
     """
-    # Caminho para a pasta de logs
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "logs")
-    os.makedirs(log_dir, exist_ok=True)  # Garante que a pasta de logs exista
-
-    # Inspeciona a pilha para encontrar o módulo correto (ignorando entradas inválidas)
-    caller_filename = None
-    for frame in inspect.stack():
-        if frame.filename != __file__ and os.path.isfile(frame.filename):
-            caller_filename = frame.filename  # Caminho completo do arquivo chamador
-            break
-
-    # Garante que um nome válido foi encontrado
-    if not caller_filename:
-        caller_name = "unknown"
-    else:
-        caller_name = os.path.splitext(os.path.basename(caller_filename))[0]
+    with _LOCK:
+        if _STATE['configured']: # Já configurado (ex: chamada repetida no startup da API)
+            return
+        _STATE['configured'] = True
+
+        # Caminho para a pasta de logs
+        log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "logs")
+        os.makedirs(log_dir, exist_ok=True)  # Garante que a pasta de logs exista
+
+        if name is None:
+            # Apenas o frame do chamador é inspecionado (inspect.stack() percorreria e leria o código de toda a pilha)
+            caller_filename = sys._getframe(1).f_code.co_filename
+            name = os.path.splitext(os.path.basename(caller_filename))[0] if os.path.isfile(caller_filename) else "unknown"
 
-    # Define o caminho do arquivo de log específico
-    log_file = os.path.join(log_dir, f"{caller_name}.log")
+        # Define o caminho do arquivo de log específico
+        log_file = os.path.join(log_dir, f"{name}.log")
 
-    # Configura o logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        handlers = [
             logging.FileHandler(log_file),  # Log em arquivo específico
             logging.StreamHandler()         # Log no console
         ]
-    )
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        if not LOG_ASYNC:
+            for handler in handlers:
+                root.addHandler(handler)
+            return
+
+        _start_listener(handlers)
+        root.addHandler(_STATE['handler'])
+        if not _STATE['hooks_installed']:
+            atexit.register(stop_logging)
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+            _STATE['hooks_installed'] = True
+
+
+def log_request(message, *args):
+    """Registra uma linha INFO do caminho de uma requisição, sujeita à amostragem LOG_REQUEST_SAMPLE_RATE.
+
+    A mensagem usa o estilo `%` do logging (ex: log_request('Predição para %s: %.2f', symbol, price)):
+    os argumentos só são formatados se a linha for registrada, e na thread de gravação.
+    """
+    if LOG_REQUEST_SAMPLE_RATE < 1 and random.random() >= LOG_REQUEST_SAMPLE_RATE:
+        return
+    if _REQUEST_LOGGER.isEnabledFor(logging.INFO):
+        _REQUEST_LOGGER.info(message, *args, stacklevel=2)
+
 
-# Chama a configuração ao importar o módulo
-configure_logging()
+def get_logging_stats():
+    """Retorna o tamanho atual da fila de logging e os registros descartados por fila cheia."""
+    handler = _STATE['handler']
+    return {
+        'async': _STATE['listener'] is not None,
+        'queued': handler.queue.qsize() if handler is not None else 0,
+        'dropped': _STATE['dropped'],
+    }
@@ -15,19 +15,25 @@ def rmse(y_true, y_pred):
     """
     return K.sqrt(K.mean(K.square(y_pred - y_true)))
 
-def create_model(X_train, y_train, X_test, y_test, units=50, batch_size=32, epochs=100, model_dir='models'): # Adicionando model_dir
+def create_model(X_train, y_train, X_test, y_test, units=50, batch_size=32, epochs=100, model_dir='models', callbacks=None, verbose=1): # Adicionando model_dir
     """
     Cria, compila e treina um modelo LSTM para previsão de séries temporais.
 
+    Também aceita datasets de streaming (ver `data_handler.preprocess_data_streaming`): se `X_train`
+    e `X_test` forem `tf.data.Dataset` de lotes (X, y), `y_train`/`y_test` são ignorados e o
+    `batch_size` é o dos datasets.
+
     Args:
-        X_train (numpy.ndarray): Dados de entrada para treinamento.
-        y_train (numpy.ndarray): Rótulos de treinamento.
-        X_test (numpy.ndarray): Dados de entrada para validação.
-        y_test (numpy.ndarray): Rótulos de validação.
+        X_train (numpy.ndarray | tf.data.Dataset): Dados de entrada para treinamento.
+        y_train (numpy.ndarray): Rótulos de treinamento (None com datasets).
+        X_test (numpy.ndarray | tf.data.Dataset): Dados de entrada para validação.
+        y_test (numpy.ndarray): Rótulos de validação (None com datasets).
         units (int, optional): Número de unidades LSTM em cada camada. Padrão é 50.
         batch_size (int, optional): Tamanho do batch para treinamento. Padrão é 32.
         epochs (int, optional): Número de épocas para o treinamento. Padrão é 100.
         model_dir (str, optional): Diretório para salvar os modelos. Padrão é 'models'. # Novo argumento
+        callbacks (list, optional): Callbacks adicionais do Keras (ex: a poda da busca de hiperparâmetros).
+        verbose (int, optional): Nível de log do Keras no treino. Padrão é 1.
 
     Returns:
         model: O modelo treinado.
@@ -48,15 +54,17 @@ def create_model(X_train, y_train, X_test, y_test, units=50, batch_size=32, epoc
             monitor='val_loss',
             save_best_only=True,
             save_weights_only=False, # Salvar o modelo completo, não apenas os pesos
-            verbose=1
+            verbose=verbose
         )
-        callbacks = [early_stopping, model_checkpoint] # Usando ambos callbacks
+        callbacks = [early_stopping, model_checkpoint] + list(callbacks or []) # Usando ambos callbacks
 
         # Criando o modelo sequencial
         model = Sequential()
 
         # Primeira camada LSTM
-        model.add(LSTM(units=units, return_sequences=True, input_shape=(X_train.shape[1], 1)))
+        streaming = isinstance(X_train, tf.data.Dataset)
+        time_steps = X_train.element_spec[0].shape[1] if streaming else X_train.shape[1]
+        model.add(LSTM(units=units, return_sequences=True, input_shape=(time_steps, 1)))
         model.add(Dropout(0.2))
 
         # Segunda camada LSTM
@@ -70,15 +78,23 @@ def create_model(X_train, y_train, X_test, y_test, units=50, batch_size=32, epoc
         model.compile(optimizer='adam', loss='mean_squared_error', metrics=['mae', 'mse', rmse])
 
         # Exibe a arquitetura do modelo
-        model.summary()
+        if verbose:
+            model.summary()
 
         # Treinando o modelo
-        history = model.fit(X_train, y_train,
-                            validation_data=(X_test, y_test),
-                            epochs=epochs,
-                            batch_size=batch_size,
-                            verbose=1,
-                            callbacks=callbacks) # Usando a lista de callbacks
+        if streaming: # Os datasets já entregam lotes (X, y) embaralhados
+            history = model.fit(X_train,
+                                validation_data=X_test,
+                                epochs=epochs,
+                                verbose=verbose,
+                                callbacks=callbacks)
+        else:
+            history = model.fit(X_train, y_train,
+                                validation_data=(X_test, y_test),
+                                epochs=epochs,
+                                batch_size=batch_size,
+                                verbose=verbose,
+                                callbacks=callbacks) # Usando a lista de callbacks
 
         logging.info('Modelo treinado com sucesso.')
 
@@ -87,6 +103,56 @@ def create_model(X_train, y_train, X_test, y_test, units=50, batch_size=32, epoc
         logging.error(f'Erro ao treinar o modelo: {e}')
         raise RuntimeError(f'Erro ao treinar o modelo: {e}')
 
+def rescale_model_io(model, scale, shift):
+    """
+    Reescreve os pesos de entrada e de saída do modelo para uma nova escala dos dados, sem mudar suas previsões.
+
+    Se um valor normalizado na escala antiga é `scale * x_novo + shift`, a primeira camada LSTM passa
+    a receber `x_novo` diretamente e a camada densa de saída passa a responder na nova escala.
+
+    Args:
+        model (keras.Model): Modelo LSTM→...→Dense criado por `create_model`.
+        scale (float): Razão entre a faixa nova e a faixa antiga do scaler.
+        shift (float): Deslocamento do mínimo, em unidades da escala antiga.
+    """
+    lstm, dense = model.layers[0], model.layers[-1]
+    kernel, recurrent_kernel, bias = lstm.get_weights()
+    lstm.set_weights([kernel * scale, recurrent_kernel, bias + kernel[0] * shift])
+    dense_kernel, dense_bias = dense.get_weights()
+    dense.set_weights([dense_kernel / scale, (dense_bias - shift) / scale])
+
+
+def fine_tune_model(model, X_train, y_train, X_val, y_val, epochs=5, batch_size=32, learning_rate=1e-4):
+    """
+    Continua o treino de um modelo já treinado por poucas épocas, com taxa de aprendizado reduzida.
+
+    Args:
+        model (keras.Model): Modelo a ajustar (os pesos são alterados no próprio objeto).
+        X_train, y_train (numpy.ndarray): Janelas e alvos de ajuste.
+        X_val, y_val (numpy.ndarray): Janelas e alvos de validação (usados pelo EarlyStopping).
+        epochs (int, optional): Número máximo de épocas. Padrão é 5.
+        batch_size (int, optional): Tamanho do batch. Padrão é 32.
+        learning_rate (float, optional): Taxa de aprendizado do Adam. Padrão é 1e-4.
+
+    Returns:
+        history: O histórico do ajuste.
+    """
+    try:
+        logging.info(f'Ajustando o modelo LSTM por até {epochs} épocas (taxa de aprendizado {learning_rate}).')
+        model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate), loss='mean_squared_error', metrics=['mae', 'mse', rmse])
+        early_stopping = EarlyStopping(monitor='val_loss', patience=2, restore_best_weights=True)
+        history = model.fit(X_train, y_train,
+                            validation_data=(X_val, y_val),
+                            epochs=epochs,
+                            batch_size=batch_size,
+                            verbose=0,
+                            callbacks=[early_stopping])
+        logging.info('Modelo ajustado com sucesso.')
+        return history
+    except Exception as e:
+        logging.error(f'Erro ao ajustar o modelo: {e}')
+        raise RuntimeError(f'Erro ao ajustar o modelo: {e}')
+
 def save_model(model, model_dir='models'): # Adicionando model_dir
     """
     Salva o modelo treinado no caminho especificado, utilizando o símbolo no nome do arquivo.
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Se '0', nenhuma medição é registrada (o endpoint /metrics continua respondendo, só com os contadores dos caches)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+
+# Prefixo de todas as métricas expostas
+NAMESPACE = 'stock_forecaster'
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LOCK = threading.Lock()
+_COUNTERS = {} # (nome, labels) -> valor
+_HISTOGRAMS = {} # (nome, labels) -> [contagens por bucket (não cumulativas) + +Inf, soma, contagem]
+_HELP = {
+    'stage_duration_seconds': 'Duração de cada etapa da predição e do download.',
+    'http_request_duration_seconds': 'Duração das requisições HTTP, por rota, método e status.',
+    'fetch_requests_total': 'Requisições feitas a cada provedor de dados.',
+    'fetch_rate_limited_total': 'Respostas de rate limit recebidas de cada provedor.',
+    'fetch_retries_total': 'Novas tentativas após rate limit, por provedor.',
+    'fetch_fallbacks_total': 'Vezes em que um provedor foi usado como fallback do anterior.',
+    'fetch_failures_total': 'Downloads em que todos os provedores falharam.',
+    'slow_requests_profiled_total': 'Requisições lentas com perfil de amostragem gravado.',
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    """Soma `amount` ao contador `name` com os labels informados (ex: increment('fetch_retries_total', provider='yahoo'))."""
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels_key(labels))
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    """Registra uma duração (em segundos) no histograma `name` com os labels informados."""
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels_key(labels))
+    position = 0
+    while position < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[position]:
+        position += 1
+    with _LOCK:
+        histogram = _HISTOGRAMS.get(key)
+        if histogram is None:
+            histogram = _HISTOGRAMS[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+        histogram[0][position] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Mede a duração do bloco no histograma de etapas (ex: `with timed('model'): ...`).
+
+    Args:
+        stage (str): Nome da etapa (ex: 'download', 'scale', 'model', 'inverse_transform').
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('stage_duration_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+
+def get_metrics_snapshot():
+    """Retorna uma cópia dos contadores e histogramas (ex: para testes ou relatórios)."""
+    with _LOCK:
+        counters = {(name, labels): value for (name, labels), value in _COUNTERS.items()}
+        histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in _HISTOGRAMS.items()}
+    return {'counters': counters, 'histograms': histograms}
+
+
+def reset_metrics():
+    """Zera todas as medições registradas."""
+    with _LOCK:
+        _COUNTERS.clear()
+        _HISTOGRAMS.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"' for name, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(collected=None):
+    """Monta o texto do endpoint /metrics no formato de exposição do Prometheus.
+
+    Args:
+        collected (dict, optional): Valores lidos de outros módulos no momento da coleta, no formato
+                                    {nome: (tipo ('counter' ou 'gauge'), [(labels (dict), valor)])}
+                                    (ex: contadores e taxa de acerto dos caches).
+
+    Returns:
+        str: Métricas no formato texto do Prometheus (versão 0.0.4).
+    """
+    snapshot = get_metrics_snapshot()
+    lines = []
+
+    def header(name, kind):
+        full_name = f'{NAMESPACE}_{name}'
+        if name in _HELP:
+            lines.append(f'# HELP {full_name} {_HELP[name]}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        return full_name
+
+    for name in sorted({name for name, _ in snapshot['counters']}):
+        full_name = header(name, 'counter')
+        for (metric, labels), value in sorted(snapshot['counters'].items()):
+            if metric == name:
+                lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+
+    for name in sorted({name for name, _ in snapshot['histograms']}):
+        full_name = header(name, 'histogram')
+        for (metric, labels), (buckets, total, count) in sorted(snapshot['histograms'].items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket_count
+                lines.append(f'{full_name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{full_name}_count{_format_labels(labels)} {count}')
+
+    for name, (kind, samples) in sorted((collected or {}).items()):
+        full_name = header(name, kind)
+        for labels, value in samples:
+            lines.append(f'{full_name}{_format_labels(_labels_key(labels))} {_format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
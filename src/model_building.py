@@ -1,14 +1,35 @@
+import argparse
 import logging
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from src.logger import configure_logging
 
-from src.data_handler import download_stock_data, preprocess_data, standardize_data
-from src.lstm_model import create_model, save_model
+from src.data_handler import download_stock_data, preprocess_data, preprocess_data_streaming, standardize_data
+from src.data_handler import build_windows, expand_scaler_range
+from src.model_registry import register_model, read_metadata, load_entry, load_hyperparameters, save_default_model
 
 from datetime import datetime
 
+# Período padrão de treino
+DEFAULT_START_DATE = '2020-01-01'
+DEFAULT_END_DATE = '2025-02-19'
 
+# Diretório dos checkpoints de treino, um subdiretório por símbolo para que treinos paralelos não se sobrescrevam
+CHECKPOINT_DIR = os.path.join('models', 'checkpoints')
 
-def main(symbol: str):
+# Gera as janelas de treino sob demanda com tf.data em vez de materializar o tensor (N, 60, 1)
+STREAMING_INPUT = os.getenv('TRAINING_STREAMING_INPUT', '1') == '1'
+TIME_STEPS = 60
+
+# Atualização incremental: janelas mais recentes usadas no ajuste e reservadas para validação
+FINE_TUNE_BARS = 250
+VALIDATION_BARS = 20
+
+
+def main(symbol: str, set_default: bool = False, start_date: str = DEFAULT_START_DATE, end_date: str = DEFAULT_END_DATE, run_id: str = None, streaming: bool = None):
     """
     Executa o pipeline completo para criar e salvar um modelo de previsão para uma ação específica.
 
@@ -16,42 +37,315 @@ def main(symbol: str):
     1. Download de dados históricos da ação.
     2. Padronização dos dados.
     3. Pré-processamento dos dados para treinamento do modelo.
-    4. Criação e treinamento do modelo de machine learning.
-    5. Salvamento do modelo treinado.
+    4. Criação e treinamento do modelo de machine learning, com os hiperparâmetros escolhidos para o
+       símbolo pela busca de hiperparâmetros (ver `load_hyperparameters`), se houver.
+    5. Registro do modelo e do scaler como nova versão do símbolo no registro de modelos.
 
     Args:
         symbol (str): O símbolo da ação para a qual o modelo será criado (ex: "AAPL", "MSFT").
+        set_default (bool, optional): Se True, também salva o modelo e o scaler como o modelo padrão da API
+                                      (`models/lstm_model.keras`, `models/lstm_model.npz` e `models/Scaler_model.pkl`,
+                                      ver `save_default_model`). Padrão é False.
+        start_date (str, optional): Data inicial dos dados de treino (YYYY-MM-DD). Padrão é '2020-01-01'.
+        end_date (str, optional): Data final dos dados de treino (YYYY-MM-DD). Padrão é '2025-02-19'.
+        run_id (str, optional): Identificador da rodada de treino, gravado nos metadados do modelo
+                                (usado por `train_universe` para retomar uma rodada interrompida).
+        streaming (bool, optional): Se True, treina com datasets `tf.data` que geram as janelas sob demanda.
+                                    Padrão é `STREAMING_INPUT` (variável de ambiente `TRAINING_STREAMING_INPUT`).
+
+    Returns:
+        str: A versão registrada do modelo.
 
     Raises:
         RuntimeError: Se ocorrer qualquer erro durante a execução do pipeline,
                       uma exceção RuntimeError será levantada com uma mensagem detalhada do erro.
     """
+    from src.lstm_model import create_model # Importado sob demanda: o TensorFlow só é carregado depois de configurar as threads
+
+    streaming = STREAMING_INPUT if streaming is None else streaming
+    hyperparameters = load_hyperparameters(symbol)
+    time_steps = hyperparameters['time_steps']
+
     try:
-        logging.info(f'Iniciando pipeline para criar modelo para a ação: {symbol}.')
+        logging.info(f'Iniciando pipeline para criar modelo para a ação: {symbol} (hiperparâmetros: {hyperparameters}).')
 
-        start_date = '2020-01-01'
-        end_date = '2025-02-19'
         logging.info(f'Baixando dados de {symbol} de {start_date} até {end_date}.')
-        data = download_stock_data(stock_symbol=symbol, start=start_date, end=end_date)
+        data = download_stock_data(stock_symbol=symbol, start_date=start_date, end_date=end_date)
 
         logging.info(f'Padronizando os dados de {symbol}.')
-        data = standardize_data(data)
+        data, scaler = standardize_data(data, scaler_path=None, return_scaler=True) # O scaler é salvo junto com o modelo do símbolo
 
         logging.info(f'Pré-processando os dados de {symbol} para treinamento.')
-        X_train, y_train, X_test, y_test = preprocess_data(data=data)
+        checkpoint_dir = os.path.join(CHECKPOINT_DIR, symbol.upper())
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        if streaming:
+            X_train, X_test = preprocess_data_streaming(data=data, sequence_lenght=time_steps, batch_size=hyperparameters['batch_size'])
+            y_train = y_test = None
+        else:
+            X_train, y_train, X_test, y_test = preprocess_data(data=data, sequence_lenght=time_steps)
 
         logging.info(f'Criando e treinando o modelo para {symbol}.')
-        model, history = create_model(X_train, y_train, X_test, y_test)
+        model, history = create_model(X_train, y_train, X_test, y_test, units=hyperparameters['units'],
+                                      batch_size=hyperparameters['batch_size'], epochs=hyperparameters['epochs'], model_dir=checkpoint_dir)
 
-        logging.info(f'Salvando o modelo.')
-        save_model(model)
+        logging.info(f'Registrando o modelo de {symbol}.')
+        version = register_model(symbol, model, scaler, metadata={
+            'start_date': start_date,
+            'end_date': end_date,
+            'run_id': run_id,
+            'time_steps': time_steps,
+            'hyperparameters': hyperparameters,
+            'val_loss': float(min(history.history['val_loss'])),
+        })
+
+        if set_default:
+            logging.info(f'Salvando o modelo de {symbol} como modelo padrão.')
+            save_default_model(model, scaler, dict(hyperparameters, symbol=symbol))
 
         logging.info(f'Modelo criado e salvo com sucesso!')
+        return version
 
     except Exception as e:
         error_message = f'Erro ao executar o pipeline para a ação {symbol}: {e}'
         logging.error(error_message)
         raise RuntimeError(error_message) from e  # Relevanta a exceção original encadeada
 
+
+def _validation_metrics(model, X, y, scaler):
+    """RMSE e MAE das previsões em unidades de preço (independentes da escala do scaler)."""
+    predicted = scaler.inverse_transform(np.asarray(model.predict_on_batch(X)).reshape(-1, 1))[:, 0]
+    actual = scaler.inverse_transform(np.asarray(y).reshape(-1, 1))[:, 0]
+    errors = predicted - actual
+    return {'rmse': float(np.sqrt(np.mean(errors ** 2))), 'mae': float(np.mean(np.abs(errors)))}
+
+
+def update(symbol: str, end_date: str = None, epochs: int = 5, max_regression: float = 0.05, run_id: str = None, set_default: bool = False):
+    """
+    Atualiza incrementalmente o modelo registrado de uma ação com os pregões novos, sem treinar do zero.
+
+    O pipeline carrega a versão mais recente do modelo e do scaler, baixa apenas o período recente
+    (o histórico antigo vem do cache local de preços), trata explicitamente a deriva da faixa do
+    scaler e ajusta o modelo por poucas épocas a partir dos pesos atuais:
+    1. Se os preços novos saem da faixa do scaler, a faixa é ampliada e os pesos de entrada e de saída
+       do modelo são reescritos para a nova escala, de modo que as previsões não mudam.
+    2. O modelo é ajustado com as `FINE_TUNE_BARS` janelas mais recentes, reservando as
+       `VALIDATION_BARS` últimas para validação.
+    3. RMSE e MAE de validação (em unidades de preço) são medidos antes e depois do ajuste e gravados
+       nos metadados. A nova versão só é registrada se o RMSE não piorar mais que `max_regression`.
+
+    Símbolos sem modelo registrado são treinados do zero com `main`.
+
+    Args:
+        symbol (str): O símbolo da ação (ex: "AAPL", "MSFT").
+        end_date (str, optional): Data final dos dados (YYYY-MM-DD). Padrão é hoje.
+        epochs (int, optional): Número máximo de épocas do ajuste. Padrão é 5.
+        max_regression (float, optional): Piora relativa máxima do RMSE de validação aceita. Padrão é 0.05.
+        run_id (str, optional): Identificador da rodada de treino, gravado nos metadados.
+        set_default (bool, optional): Se True, também salva o modelo atualizado como modelo padrão da API.
+
+    Returns:
+        dict: {'status': 'updated' | 'rejected' | 'up_to_date' | 'trained', 'version', 'metrics_before', 'metrics_after'}.
+
+    Raises:
+        RuntimeError: Se ocorrer qualquer erro durante a atualização.
+    """
+    from src.lstm_model import fine_tune_model, rescale_model_io # Importado sob demanda, como em `main`
+
+    end_date = end_date or datetime.today().strftime('%Y-%m-%d')
+    base = read_metadata(symbol)
+    if base is None:
+        logging.info(f'{symbol} não tem modelo registrado; treinando do zero.')
+        version = main(symbol, set_default=set_default, start_date=DEFAULT_START_DATE, end_date=end_date, run_id=run_id)
+        return {'status': 'trained', 'version': version}
+
+    try:
+        time_steps = base.get('time_steps', TIME_STEPS)
+        if pd.Timestamp(end_date) <= pd.Timestamp(base['end_date']):
+            logging.info(f'Modelo de {symbol} (versão {base["version"]}) já cobre os dados até {end_date}.')
+            return {'status': 'up_to_date', 'version': base['version']}
+
+        logging.info(f'Atualizando o modelo de {symbol} (versão {base["version"]}, dados até {base["end_date"]}) até {end_date}.')
+        entry = load_entry(symbol, base['version'], backend='keras')
+        model, scaler = entry.model, entry.scaler
+
+        # Só o período recente é necessário: as janelas de ajuste e de validação e o contexto de cada uma
+        bars_needed = FINE_TUNE_BARS + VALIDATION_BARS + time_steps
+        start_date = (pd.Timestamp(end_date) - pd.tseries.offsets.BDay(int(bars_needed * 1.1))).strftime('%Y-%m-%d')
+        data = download_stock_data(stock_symbol=symbol, start_date=start_date, end_date=end_date)
+        new_bars = int((data.index >= pd.Timestamp(base['end_date'])).sum())
+        if new_bars == 0:
+            logging.info(f'Nenhum pregão novo para {symbol} desde {base["end_date"]}.')
+            return {'status': 'up_to_date', 'version': base['version']}
+        if len(data) <= time_steps + VALIDATION_BARS:
+            raise ValueError(f'Dados insuficientes para atualizar o modelo: {len(data)} pregões.')
+
+        # Deriva do scaler: amplia a faixa e leva o modelo para a nova escala sem mudar suas previsões
+        new_scaler, drift = expand_scaler_range(scaler, data.values)
+        if drift['expanded']:
+            old_range = scaler.data_max_[0] - scaler.data_min_[0]
+            scale = (new_scaler.data_max_[0] - new_scaler.data_min_[0]) / old_range
+            shift = (new_scaler.data_min_[0] - scaler.data_min_[0]) / old_range
+            logging.warning(f'Preços de {symbol} fora da faixa do scaler ({drift["new_min"][0]:.2f} - {drift["new_max"][0]:.2f}); '
+                            f'faixa ampliada para {new_scaler.data_min_[0]:.2f} - {new_scaler.data_max_[0]:.2f}.')
+            rescale_model_io(model, scale, shift)
+            scaler = new_scaler
+
+        X, y = build_windows(scaler.transform(data.values), time_steps, materialize=True)
+        X_train, y_train = X[-(FINE_TUNE_BARS + VALIDATION_BARS):-VALIDATION_BARS], y[-(FINE_TUNE_BARS + VALIDATION_BARS):-VALIDATION_BARS]
+        X_val, y_val = X[-VALIDATION_BARS:], y[-VALIDATION_BARS:]
+
+        metrics_before = _validation_metrics(model, X_val, y_val, scaler)
+        history = fine_tune_model(model, X_train, y_train, X_val, y_val, epochs=epochs)
+        metrics_after = _validation_metrics(model, X_val, y_val, scaler)
+        logging.info(f'Validação de {symbol}: RMSE {metrics_before["rmse"]:.4f} -> {metrics_after["rmse"]:.4f}, '
+                     f'MAE {metrics_before["mae"]:.4f} -> {metrics_after["mae"]:.4f}.')
+
+        result = {'metrics_before': metrics_before, 'metrics_after': metrics_after}
+        if metrics_after['rmse'] > metrics_before['rmse'] * (1 + max_regression):
+            logging.warning(f'Ajuste de {symbol} rejeitado: o RMSE de validação piorou. Mantendo a versão {base["version"]}.')
+            return dict(result, status='rejected', version=base['version'])
+
+        version = register_model(symbol, model, scaler, metadata={
+            'start_date': base.get('start_date'),
+            'end_date': end_date,
+            'run_id': run_id,
+            'time_steps': time_steps,
+            'val_loss': float(min(history.history['val_loss'])),
+            'mode': 'incremental',
+            'base_version': base['version'],
+            'new_bars': new_bars,
+            'epochs': len(history.history['val_loss']),
+            'scaler_drift': drift,
+            'metrics_before': metrics_before,
+            'metrics_after': metrics_after,
+        })
+
+        if set_default:
+            logging.info(f'Salvando o modelo de {symbol} como modelo padrão.')
+            save_default_model(model, scaler, dict(base.get('hyperparameters') or load_hyperparameters(symbol), time_steps=time_steps, symbol=symbol))
+        return dict(result, status='updated', version=version)
+
+    except Exception as e:
+        error_message = f'Erro ao atualizar o modelo da ação {symbol}: {e}'
+        logging.error(error_message)
+        raise RuntimeError(error_message) from e
+
+
+def _init_training_worker(threads_per_worker):
+    """Inicializa um processo de treino limitando as threads do TensorFlow e das bibliotecas numéricas.
+
+    Deve rodar antes de o TensorFlow criar seu runtime; por isso `main` importa o TensorFlow sob demanda.
+    """
+    threads = str(threads_per_worker)
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ[variable] = threads
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(threads_per_worker)
+
+    configure_logging('model_building')
+
+
+def _train_symbol(symbol, start_date, end_date, run_id, incremental=False, epochs=5):
+    """Treina (ou atualiza) um símbolo em um processo de treino e retorna o resultado sem propagar exceções."""
+    try:
+        if incremental:
+            return update(symbol, end_date=end_date, epochs=epochs, run_id=run_id)
+        version = main(symbol, start_date=start_date, end_date=end_date, run_id=run_id)
+        return {'status': 'trained', 'version': version}
+    except Exception as e:
+        return {'status': 'failed', 'error': str(e)}
+
+
+def train_universe(symbols, start_date=DEFAULT_START_DATE, end_date=DEFAULT_END_DATE, max_workers=None, threads_per_worker=1, run_id=None, incremental=False, epochs=5):
+    """
+    Treina modelos para um universo de ações em paralelo, um processo por símbolo.
+
+    Cada processo limita o TensorFlow a `threads_per_worker` threads, para que os processos não
+    disputem os mesmos núcleos, e registra o modelo e o scaler do símbolo no registro de modelos.
+    A rodada pode ser retomada após uma falha: símbolos cuja versão mais recente já pertence à
+    mesma rodada (`run_id`) são pulados, e versões incompletas nunca são publicadas no registro.
+
+    Args:
+        symbols (list[str]): Símbolos das ações a treinar.
+        start_date (str, optional): Data inicial dos dados de treino (YYYY-MM-DD).
+        end_date (str, optional): Data final dos dados de treino (YYYY-MM-DD).
+        max_workers (int, optional): Número de processos de treino. Padrão é núcleos / threads_per_worker.
+        threads_per_worker (int, optional): Threads do TensorFlow por processo. Padrão é 1.
+        run_id (str, optional): Identificador da rodada. Padrão é '<start_date>_<end_date>'.
+        incremental (bool, optional): Se True, atualiza os modelos existentes com `update` em vez de treinar do zero.
+        epochs (int, optional): Número máximo de épocas do ajuste incremental (ver `update`). Padrão é 5.
+
+    Returns:
+        dict: Resultado por símbolo: {'status': 'trained' | 'updated' | ... | 'skipped' | 'failed', 'version' ou 'error'}.
+    """
+    run_id = run_id or f'{start_date}_{end_date}'
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+    results = {}
+    pending = []
+    for symbol in symbols:
+        metadata = read_metadata(symbol)
+        if metadata is not None and metadata.get('run_id') == run_id:
+            results[symbol] = {'status': 'skipped', 'version': metadata['version']}
+        else:
+            pending.append(symbol)
+
+    logging.info(f'Rodada {run_id}: {len(pending)} símbolos a treinar, {len(results)} já concluídos, '
+                 f'{max_workers} processos com {threads_per_worker} thread(s) cada.')
+
+    started = datetime.now()
+    # 'spawn' garante processos limpos, sem herdar um runtime do TensorFlow já inicializado
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                             initializer=_init_training_worker, initargs=(threads_per_worker,)) as executor:
+        futures = {executor.submit(_train_symbol, symbol, start_date, end_date, run_id, incremental, epochs): symbol for symbol in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            symbol = futures[future]
+            try:
+                results[symbol] = future.result()
+            except Exception as e: # O processo de treino morreu (ex: falta de memória)
+                results[symbol] = {'status': 'failed', 'error': str(e)}
+            logging.info(f'Rodada {run_id}: {symbol} {results[symbol]["status"]} ({done}/{len(pending)}).')
+
+    failed = [symbol for symbol, result in results.items() if result['status'] == 'failed']
+    logging.info(f'Rodada {run_id} concluída em {datetime.now() - started}: '
+                 f'{len(results) - len(failed)} de {len(symbols)} símbolos com modelo atualizado.')
+    if failed:
+        logging.warning(f'Rodada {run_id}: falha ao treinar {", ".join(failed)}.')
+    return {symbol: results[symbol] for symbol in symbols}
+
+
 if __name__ == '__main__':
-    main('MSFT')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Treina modelos LSTM de previsão de preços por ação.')
+    parser.add_argument('--symbol', '--symbols', dest='symbols', nargs='+', default=['MSFT'], help='Símbolos das ações (ex: MSFT AAPL).')
+    parser.add_argument('--symbols-file', help='Arquivo com um símbolo por linha.')
+    parser.add_argument('--start-date', default=DEFAULT_START_DATE)
+    parser.add_argument('--end-date', default=None, help=f'Padrão: {DEFAULT_END_DATE} (hoje com --incremental).')
+    parser.add_argument('--workers', type=int, default=None, help='Processos de treino (padrão: núcleos / threads por processo).')
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--run-id', default=None)
+    parser.add_argument('--no-default', action='store_true', help='Não atualiza o modelo padrão da API ao treinar um único símbolo.')
+    parser.add_argument('--incremental', action='store_true', help='Atualiza os modelos registrados com os pregões novos, sem treinar do zero.')
+    parser.add_argument('--epochs', type=int, default=5, help='Épocas do ajuste incremental.')
+    args = parser.parse_args()
+
+    configure_logging()
+    end_date = args.end_date or (datetime.today().strftime('%Y-%m-%d') if args.incremental else DEFAULT_END_DATE)
+
+    symbols = args.symbols
+    if args.symbols_file:
+        with open(args.symbols_file, 'r', encoding='utf-8') as f:
+            symbols = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    if len(symbols) == 1 and args.workers is None and args.incremental:
+        print(update(symbols[0], end_date=end_date, epochs=args.epochs, run_id=args.run_id, set_default=not args.no_default))
+    elif len(symbols) == 1 and args.workers is None:
+        main(symbols[0], set_default=not args.no_default, start_date=args.start_date, end_date=end_date, run_id=args.run_id)
+    else:
+        train_universe(symbols, start_date=args.start_date, end_date=end_date, max_workers=args.workers,
+                       threads_per_worker=args.threads_per_worker, run_id=args.run_id,
+                       incremental=args.incremental, epochs=args.epochs)
@@ -1,33 +1,68 @@
-import yfinance as yf
-import pandas as pd
-from datetime import datetime, timedelta
-from sklearn.preprocessing import MinMaxScaler
 import numpy as np
-from tensorflow.keras.models import load_model
 import os
 import logging
-from src.logger import configure_logging
+from src.logger import configure_logging, log_request
 import joblib
+from concurrent.futures import ThreadPoolExecutor
 from src.data_handler import download_stock_data
+from src.model_registry import INFERENCE_BACKEND, ModelEntry, get_model_registry, load_hyperparameters
+from src.numpy_lstm import WEIGHTS_FILENAME, artifact_version, load_numpy_model
+from src.prediction_cache import get_prediction_cache, invalidate_predictions, prediction_key
+from src.forecast_store import get_forecast_store
+from src.metrics import timed
 
 # Variáveis globais para armazenar o modelo e o scaler carregados (serão inicializadas na inicialização da API)
 MODEL = None
 SCALER = None
 
-def load_model_for_api(model_dir='models'):
+# Modelo padrão (MODEL/SCALER) no formato do registro, usado quando o símbolo não tem modelo próprio
+_DEFAULT_ENTRY = None
+
+# Versão do modelo e do scaler padrão (hash do conteúdo dos artefatos), usada nas chaves do cache de predições
+# e das previsões pré-calculadas
+_DEFAULT_VERSIONS = {'model': None, 'scaler': None}
+
+# Tamanho da janela com que o modelo padrão foi treinado (ver `models/hyperparameters.json`)
+_DEFAULT_TIME_STEPS = None
+
+# Permite desligar a busca de modelos por símbolo no registro (ex: USE_MODEL_REGISTRY=0)
+USE_MODEL_REGISTRY = os.getenv('USE_MODEL_REGISTRY', '1') != '0'
+
+def load_model_for_api(model_dir='models', backend=None):
     """Carrega o modelo LSTM para uso na API, armazenando-o em variável global.
 
     Args:
         model_dir (str, optional): Diretório onde o modelo está salvo. Padrão é 'models'.
+        backend (str, optional): Motor de inferência, 'keras' ou 'numpy'. Padrão é a variável de ambiente
+                                 INFERENCE_BACKEND (ou 'keras'). O motor 'numpy' usa os pesos exportados
+                                 em `lstm_model.npz` (ver `src/numpy_lstm.py`).
 
     Raises:
         RuntimeError: Se ocorrer um erro ao carregar o modelo.
     """
-    global MODEL # Indica que estamos usando a variável global MODEL
+    global MODEL, _DEFAULT_TIME_STEPS # Indica que estamos usando a variável global MODEL
+    backend = backend or INFERENCE_BACKEND
     try:
-        logging.info(f'Carregando o modelo para API do diretório: {model_dir}')
-        model_path = os.path.join(model_dir, 'lstm_model.keras')
-        MODEL = load_model(model_path) # Carrega o modelo e armazena na variável global
+        logging.info(f'Carregando o modelo para API do diretório: {model_dir} (motor {backend})')
+        keras_path = os.path.join(model_dir, 'lstm_model.keras')
+        if backend == 'numpy':
+            model_path = os.path.join(model_dir, WEIGHTS_FILENAME)
+            MODEL = load_numpy_model(model_dir) # Forward pass em NumPy, sem TensorFlow
+            # A versão é a do .keras de onde os pesos carregados foram exportados: os dois motores do mesmo treino
+            # (ex: job de pré-cálculo com Keras e API com NumPy) compartilham previsões pré-calculadas e cache, e
+            # pesos de um treino anterior continuam com a versão desse treino
+            version = MODEL.source_version or artifact_version(model_path)
+            if MODEL.source_version and os.path.exists(keras_path) and artifact_version(keras_path) != MODEL.source_version:
+                logging.warning(f'Os pesos em {model_path} não foram exportados de {keras_path}; o motor NumPy serve o treino anterior. '
+                                f'Reexporte-os com `python -m src.numpy_lstm export {model_dir}`.')
+        else:
+            from tensorflow.keras.models import load_model # Importado sob demanda: o motor NumPy dispensa o TensorFlow
+            model_path = keras_path
+            MODEL = load_model(model_path, compile=False) # Carrega o modelo (sem compilar: só é usado para inferência) e armazena na variável global
+            version = artifact_version(model_path)
+        _DEFAULT_VERSIONS['model'] = version
+        _DEFAULT_TIME_STEPS = load_hyperparameters(model_dir=model_dir)['time_steps']
+        invalidate_predictions('default') # Predições do modelo anterior não são mais válidas
         logging.info(f'Modelo para API carregado com sucesso de: {model_path}')
     except Exception as e:
         logging.error(f'Erro ao carregar o modelo para API de {model_dir}: {e}')
@@ -47,13 +82,221 @@ def load_scaler_for_api(model_dir='models'):
         logging.info(f'Carregando o scaler para API do diretório: {model_dir}')
         scaler_path = os.path.join(model_dir, 'Scaler_model.pkl')
         SCALER = joblib.load(scaler_path) # Carrega o scaler e armazena na variável global
+        _DEFAULT_VERSIONS['scaler'] = artifact_version(scaler_path)
+        invalidate_predictions('default')
         logging.info(f'Scaler para API carregado com sucesso de: {scaler_path}')
     except Exception as e:
         logging.error(f'Erro ao carregar o scaler para API de {model_dir}: {e}')
         raise RuntimeError(f'Erro ao carregar o scaler para API: {e}')
 
 
-def predict_price_for_api(symbol, start_date, end_date, time_steps=60):
+def get_default_entry():
+    """Retorna o modelo padrão (MODEL/SCALER globais) no formato de `ModelEntry`.
+
+    Raises:
+        RuntimeError: Se o modelo ou scaler não estiverem carregados.
+    """
+    global _DEFAULT_ENTRY
+
+    if MODEL is None or SCALER is None: # Verificação se o modelo e scaler foram carregados
+        logging.error('Modelo ou Scaler não foram carregados. Verifique a inicialização da API.')
+        raise RuntimeError('Modelo ou Scaler não inicializados para predição.')
+
+    if _DEFAULT_ENTRY is None or _DEFAULT_ENTRY.model is not MODEL or _DEFAULT_ENTRY.scaler is not SCALER:
+        _DEFAULT_ENTRY = ModelEntry('default', f"{_DEFAULT_VERSIONS['model']}.{_DEFAULT_VERSIONS['scaler']}", MODEL, SCALER,
+                                    time_steps=_DEFAULT_TIME_STEPS)
+    return _DEFAULT_ENTRY
+
+
+def resolve_model(symbol):
+    """Retorna o modelo a ser usado para o símbolo: o do registro, se houver, ou o modelo padrão.
+
+    Args:
+        symbol (str): Símbolo da ação (ex: AAPL).
+
+    Raises:
+        RuntimeError: Se o símbolo não tiver modelo próprio e o modelo padrão não estiver carregado.
+
+    Returns:
+        ModelEntry: Modelo, scaler e versão a serem usados na predição.
+    """
+    if USE_MODEL_REGISTRY:
+        try:
+            entry = get_model_registry().get(symbol)
+            if entry is not None:
+                return entry
+        except RuntimeError as e:
+            logging.warning(f'Falha ao carregar o modelo de {symbol} do registro, usando o modelo padrão: {e}')
+    return get_default_entry()
+
+
+def prepare_input_window(symbol, start_date, end_date, time_steps=60, entry=None):
+    """Baixa os dados da ação e monta a janela normalizada de entrada do modelo.
+
+    Args:
+        symbol (str): Símbolo da ação (ex: AAPL).
+        start_date (str): Data de início para baixar os dados (YYYY-MM-DD).
+        end_date (str): Data de fim para baixar os dados (YYYY-MM-DD).
+        time_steps (int, optional): Tamanho da janela de tempo (sequência) usada pelo modelo LSTM. Padrão é 60.
+                                    Modelos treinados com outra janela (`ModelEntry.time_steps`) usam a sua.
+        entry (ModelEntry, optional): Modelo cujo scaler normaliza a janela. Padrão é `resolve_model(symbol)`.
+
+    Raises:
+        RuntimeError: Se o scaler não estiver carregado.
+
+    Returns:
+        numpy.ndarray: Janela normalizada com formato (time_steps, 1), ou None se não houver dados suficientes.
+    """
+    entry = entry or resolve_model(symbol)
+    time_steps = entry.time_steps or time_steps
+
+    log_request('Baixando dados de %s de %s até %s para predição (API).', symbol, start_date, end_date)
+    data = download_stock_data(symbol, start_date=start_date, end_date=end_date)
+
+    ultimos_dias = _last_window(data, symbol, start_date, end_date, time_steps)
+    if ultimos_dias is None:
+        return None
+
+    with timed('scale'):
+        return entry.scaler.transform(ultimos_dias).astype(np.float32)
+
+
+def _last_window(data, symbol, start_date, end_date, time_steps):
+    """Retorna os últimos `time_steps` fechamentos (não normalizados) de `data`, ou None se não houver dados suficientes."""
+    if data is None or data.empty: # Verificação importante se não houver dados baixados
+        logging.warning("Não foram encontrados dados para %s no período %s - %s. Impossível realizar a predição (API).", symbol, start_date, end_date)
+        return None # Retornar None em caso de dados vazios
+
+    # Apenas os últimos 'time_steps' dias entram na janela, então só eles são normalizados
+    ultimos_dias = data.values[-time_steps:]
+    if ultimos_dias.shape[0] < time_steps: # Verificação importante: se não houver dados suficientes
+        logging.warning("Não há dados suficientes para criar uma sequência de %d dias para predição (API). Dados disponíveis: %d dias.", time_steps, ultimos_dias.shape[0])
+        return None # Retornar None se dados insuficientes
+    return ultimos_dias
+
+
+def predict_scaled_windows(X_input, entry=None):
+    """Executa um único forward pass do modelo sobre um lote de janelas normalizadas e desnormaliza o resultado.
+
+    Args:
+        X_input (numpy.ndarray): Lote de janelas com formato (batch, time_steps, 1).
+        entry (ModelEntry, optional): Modelo e scaler a usar. Padrão é o modelo padrão (MODEL/SCALER).
+
+    Raises:
+        RuntimeError: Se o modelo ou scaler não estiverem carregados.
+
+    Returns:
+        numpy.ndarray: Preços previstos (desnormalizados) com formato (batch,).
+    """
+    entry = entry or get_default_entry()
+
+    # predict_on_batch evita a montagem do pipeline tf.data que MODEL.predict faz a cada chamada
+    with timed('model'):
+        previsao_escalada = np.asarray(entry.model.predict_on_batch(X_input)).reshape(-1, 1)
+    with timed('inverse_transform'):
+        return entry.scaler.inverse_transform(previsao_escalada)[:, 0] # Desnormalizando com o scaler do modelo
+
+
+def _build_rollout_fn(model):
+    """Constrói o rollout autorregressivo do modelo como um único grafo TensorFlow.
+
+    O laço (`tf.while_loop`) roda dentro do grafo: a cada passo a previsão é anexada ao fim da
+    janela e o valor mais antigo é descartado. A assinatura fixa evita retracing para lotes,
+    janelas e horizontes diferentes.
+    """
+    import tensorflow as tf
+
+    @tf.function(input_signature=[
+        tf.TensorSpec(shape=[None, None, 1], dtype=tf.float32),
+        tf.TensorSpec(shape=[], dtype=tf.int32),
+    ])
+    def rollout(windows, horizon):
+        predictions = tf.TensorArray(tf.float32, size=horizon)
+
+        def body(step, window, predictions):
+            next_value = tf.cast(model(window, training=False), tf.float32) # (batch, 1)
+            predictions = predictions.write(step, next_value[:, 0])
+            window = tf.concat([window[:, 1:, :], next_value[:, :, tf.newaxis]], axis=1)
+            return step + 1, window, predictions
+
+        _, _, predictions = tf.while_loop(
+            lambda step, window, predictions: step < horizon,
+            body,
+            [tf.constant(0), windows, predictions],
+        )
+        return tf.transpose(predictions.stack()) # (batch, horizon)
+
+    return rollout
+
+
+def forecast_scaled_windows(X_input, horizon=1, entry=None):
+    """Prevê os próximos `horizon` fechamentos de um lote de janelas normalizadas e desnormaliza o resultado.
+
+    Para `horizon > 1` todo o rollout autorregressivo roda em uma única chamada a um grafo compilado,
+    em vez de `horizon` chamadas ao modelo.
+
+    Args:
+        X_input (numpy.ndarray): Lote de janelas com formato (batch, time_steps, 1).
+        horizon (int, optional): Número de dias à frente a prever. Padrão é 1.
+        entry (ModelEntry, optional): Modelo e scaler a usar. Padrão é o modelo padrão (MODEL/SCALER).
+
+    Raises:
+        RuntimeError: Se o modelo ou scaler não estiverem carregados.
+
+    Returns:
+        numpy.ndarray: Preços previstos (desnormalizados) com formato (batch, horizon).
+    """
+    entry = entry or get_default_entry()
+
+    if horizon <= 1:
+        return predict_scaled_windows(X_input, entry=entry)[:, np.newaxis]
+
+    if entry.rollout_fn is None and not hasattr(entry.model, 'rollout'): # Compila uma única vez por modelo carregado
+        entry.rollout_fn = _build_rollout_fn(entry.model)
+    with timed('model'):
+        if hasattr(entry.model, 'rollout'): # Motor NumPy: rollout próprio, sem TensorFlow
+            previsao_escalada = entry.model.rollout(X_input, horizon)
+        else:
+            previsao_escalada = entry.rollout_fn(np.asarray(X_input, dtype=np.float32), np.int32(horizon)).numpy()
+    batch_size = previsao_escalada.shape[0]
+    with timed('inverse_transform'):
+        return entry.scaler.inverse_transform(previsao_escalada.reshape(-1, 1)).reshape(batch_size, horizon)
+
+
+def format_forecast(prices):
+    """Monta o dicionário JSON-serializável de resposta a partir das previsões de um símbolo.
+
+    Args:
+        prices (numpy.ndarray): Preços previstos para os próximos dias, em ordem.
+
+    Returns:
+        dict: {'predicted_price': float} com o próximo fechamento e, para horizontes maiores que 1,
+              também {'predicted_prices': list[float]} com todos os dias previstos.
+    """
+    result = {'predicted_price': float(prices[0])}
+    if len(prices) > 1:
+        result['predicted_prices'] = [float(price) for price in prices]
+    return result
+
+
+def warm_up(time_steps=60, horizon=2):
+    """Executa predições fictícias com o modelo padrão para que a primeira requisição real não pague
+    a inicialização preguiçosa do motor (construção do grafo, compilação do rollout, alocações).
+
+    Args:
+        time_steps (int, optional): Tamanho da janela usada na predição fictícia. Padrão é 60.
+        horizon (int, optional): Horizonte usado para compilar o rollout autorregressivo. Padrão é 2.
+
+    Raises:
+        RuntimeError: Se o modelo ou scaler não estiverem carregados.
+    """
+    X_input = np.zeros((1, time_steps, 1), dtype=np.float32)
+    forecast_scaled_windows(X_input, horizon=1)
+    if horizon > 1:
+        forecast_scaled_windows(X_input, horizon=horizon)
+
+
+def predict_price_for_api(symbol, start_date, end_date, time_steps=60, horizon=1):
     """Realiza a predição do preço de fechamento da ação para o período especificado,
        usando o modelo e scaler já carregados globalmente.
 
@@ -62,53 +305,126 @@ def predict_price_for_api(symbol, start_date, end_date, time_steps=60):
         start_date (str): Data de início para baixar os dados (YYYY-MM-DD).
         end_date (str): Data de fim para baixar os dados (YYYY-MM-DD).
         time_steps (int, optional): Tamanho da janela de tempo (sequência) usada pelo modelo LSTM. Padrão é 60.
+        horizon (int, optional): Número de dias à frente a prever. Padrão é 1.
 
     Raises:
         RuntimeError: Se o modelo ou scaler não estiverem carregados, ou se ocorrer outro erro durante a predição.
 
     Returns:
         dict: Dicionário contendo o preço de fechamento previsto (desnormalizado). Ex: {'predicted_price': 123.45}.
+              Para `horizon > 1` inclui também 'predicted_prices' com a previsão de cada dia.
               Retorna None em caso de falha na predição ou dados insuficientes.
     """
-    global MODEL, SCALER # Indica que estamos usando as variáveis globais MODEL e SCALER
-
-    if MODEL is None or SCALER is None: # Verificação se o modelo e scaler foram carregados
-        logging.error('Modelo ou Scaler não foram carregados. Verifique a inicialização da API.')
-        raise RuntimeError('Modelo ou Scaler não inicializados para predição.')
+    entry = resolve_model(symbol) # Modelo do símbolo no registro ou o modelo padrão (MODEL/SCALER)
 
     try:
-        logging.info(f'Realizando a predição para {symbol} de {start_date} até {end_date} (API).')
-
-        # Usando as datas de entrada fornecidas para baixar os dados
-        logging.info(f'Baixando dados de {symbol} de {start_date} até {end_date} para predição (API).')
-        data = download_stock_data(symbol, start_date=start_date, end_date=end_date)
+        log_request('Realizando a predição para %s de %s até %s (API, modelo %s).', symbol, start_date, end_date, entry.version)
 
-        if data.empty: # Verificação importante se não houver dados baixados
-            logging.warning(f"Não foram encontrados dados para {symbol} no período {start_date} - {end_date}. Impossível realizar a predição (API).")
-            return None # Retornar None em caso de dados vazios
+        window = prepare_input_window(symbol, start_date, end_date, time_steps=time_steps, entry=entry)
+        if window is None:
+            return None
 
-        scaled_data = SCALER.transform(data.values) # Usando o SCALER global
-        df_scaled = pd.DataFrame(scaled_data, columns=data.columns, index=data.index)
+        predicted_prices = forecast_scaled_windows(window[np.newaxis], horizon=horizon, entry=entry)[0] # Previsões do único símbolo do lote
 
-        # Preparar os dados de entrada para predição usando os últimos 'time_steps' dias dos dados baixados
-        ultimos_dias_scaled = df_scaled[-time_steps:].values
-        if ultimos_dias_scaled.shape[0] < time_steps: # Verificação importante: se não houver dados suficientes
-            logging.warning(f"Não há dados suficientes para criar uma sequência de {time_steps} dias para predição (API). Dados disponíveis: {ultimos_dias_scaled.shape[0]} dias.")
-            return None # Retornar None se dados insuficientes
-
-        X_input = np.reshape(ultimos_dias_scaled, (1, ultimos_dias_scaled.shape[0], 1))
-        previsao_escalada = MODEL.predict(X_input) # Usando o MODEL global
-        previsao_desnormalizada = SCALER.inverse_transform(previsao_escalada) # Desnormalizando com o SCALER global
-        predicted_price = previsao_desnormalizada[0][0] # Extraindo o valor escalar da predição
-
-        logging.info(f'Predição para {symbol} realizada com sucesso (API). Preço previsto: {predicted_price}') # Log com preço previsto
-        return {'predicted_price': float(predicted_price)} # Retornando um dicionário JSON-serializável
+        log_request('Predição para %s realizada com sucesso (API). Preço previsto: %s', symbol, predicted_prices[0]) # Log com preço previsto
+        return format_forecast(predicted_prices) # Retornando um dicionário JSON-serializável
 
     except Exception as e:
         logging.error(f'Erro ao realizar a predição para {symbol} (API): {e}')
         raise RuntimeError(f'Erro ao realizar a predição para API: {e}')
 
 
+def predict_prices_batch_for_api(symbols, start_date, end_date, time_steps=60, horizon=1, max_workers=8):
+    """Realiza a predição do preço de fechamento de várias ações de uma só vez.
+
+    Os históricos são baixados em paralelo e todas as janelas válidas que usam o mesmo modelo passam
+    juntas por uma única normalização, um único forward pass e uma única desnormalização. Símbolos
+    com previsão pré-calculada (ver `src/forecast_store.py`) ou com resultado no cache de predições
+    (ver `src/prediction_cache.py`) não são baixados nem previstos.
+
+    Args:
+        symbols (list[str]): Símbolos das ações (ex: ['AAPL', 'MSFT']). Símbolos repetidos são ignorados.
+        start_date (str): Data de início para baixar os dados (YYYY-MM-DD).
+        end_date (str): Data de fim para baixar os dados (YYYY-MM-DD).
+        time_steps (int, optional): Tamanho da janela de tempo (sequência) usada pelo modelo LSTM. Padrão é 60.
+        horizon (int, optional): Número de dias à frente a prever para todos os símbolos. Padrão é 1.
+        max_workers (int, optional): Número máximo de downloads simultâneos. Padrão é 8.
+
+    Raises:
+        RuntimeError: Se o modelo ou scaler não estiverem carregados, ou se o forward pass falhar.
+
+    Returns:
+        dict: Resultado por símbolo, na ordem recebida. Cada valor é o dicionário de `format_forecast`
+              ou {'error': str} quando não foi possível prever aquele símbolo.
+    """
+    get_default_entry() # Falha cedo se o modelo padrão não estiver carregado
+
+    symbols = list(dict.fromkeys(symbols))
+    log_request('Realizando a predição em lote para %d ações de %s até %s (API).', len(symbols), start_date, end_date)
+
+    def fetch(symbol):
+        try:
+            return download_stock_data(symbol, start_date=start_date, end_date=end_date), None
+        except Exception as e:
+            logging.error(f'Erro ao baixar dados de {symbol} para predição em lote (API): {e}')
+            return None, f'Erro ao baixar os dados: {e}'
+
+    store = get_forecast_store()
+    cache = get_prediction_cache()
+    cache_keys = {} # símbolo -> (chave, live) dos símbolos que não estavam no cache
+    results = {}
+    groups = {} # id do modelo -> (modelo, janelas, símbolos)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(symbols) or 1))) as executor:
+        pending = []
+        for symbol, entry in zip(symbols, executor.map(resolve_model, symbols)):
+            stored = store.lookup(symbol, start_date, end_date, horizon, entry, time_steps) if store is not None else None
+            if stored is not None:
+                results[symbol] = format_forecast(stored)
+                continue
+            if cache is not None:
+                key, live = prediction_key(symbol, end_date, time_steps, entry, horizon)
+                cached = cache.get(key)
+                if cached is not None:
+                    results[symbol] = cached
+                    continue
+                cache_keys[symbol] = (key, live)
+            results[symbol] = None # Preenchido abaixo, preservando a ordem de entrada
+            pending.append((symbol, entry))
+
+        for (symbol, entry), (data, error) in zip(pending, executor.map(fetch, [symbol for symbol, _ in pending])):
+            if error is not None:
+                results[symbol] = {'error': error}
+                continue
+            ultimos_dias = _last_window(data, symbol, start_date, end_date, entry.time_steps or time_steps)
+            if ultimos_dias is None:
+                results[symbol] = {'error': f'Dados insuficientes para uma sequência de {entry.time_steps or time_steps} dias.'}
+                continue
+            _, windows, window_symbols = groups.setdefault(id(entry), (entry, [], []))
+            windows.append(ultimos_dias[:, 0])
+            window_symbols.append(symbol)
+
+    predicted_count = 0
+    for entry, windows, window_symbols in groups.values():
+        try:
+            with timed('scale'):
+                raw = np.stack(windows) # (batch, time_steps)
+                X_input = entry.scaler.transform(raw.reshape(-1, 1)).reshape(len(windows), -1, 1).astype(np.float32)
+            predicted = forecast_scaled_windows(X_input, horizon=horizon, entry=entry)
+        except Exception as e:
+            logging.error(f'Erro ao realizar a predição em lote (API): {e}')
+            raise RuntimeError(f'Erro ao realizar a predição em lote para API: {e}')
+        for symbol, prices in zip(window_symbols, predicted):
+            results[symbol] = format_forecast(prices)
+            if symbol in cache_keys:
+                key, live = cache_keys[symbol]
+                cache.put(key, results[symbol], live=live)
+        predicted_count += len(window_symbols)
+
+    log_request('Predição em lote concluída (API): %d de %d ações previstas, %d respondidas pelo armazenamento ou cache.',
+                predicted_count, len(symbols), len(symbols) - len(pending))
+    return results
+
+
 if __name__ == '__main__':
     configure_logging()
 
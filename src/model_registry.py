@@ -0,0 +1,407 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import joblib
+
+from src.data_handler import save_scaler
+from src.numpy_lstm import WEIGHTS_FILENAME, NumpyLSTMModel, export_weights
+from src.prediction_cache import invalidate_predictions
+
+# Diretório raiz do registro de modelos por símbolo (pode ser alterado pela variável de ambiente MODEL_REGISTRY_DIR)
+REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join('models', 'registry'))
+
+# Orçamento de memória do LRU de modelos carregados (padrão 512 MB)
+MAX_RESIDENT_BYTES = int(os.getenv('MODEL_REGISTRY_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Estimativa do custo fixo de um modelo Keras em memória além dos pesos (grafo, camadas, otimizador)
+MODEL_OVERHEAD_BYTES = int(os.getenv('MODEL_REGISTRY_OVERHEAD_BYTES', str(4 * 1024 * 1024)))
+
+# Tempo (s) durante o qual uma falha de carregamento é repetida sem tentar ler a versão de novo
+LOAD_FAILURE_TTL_SECONDS = float(os.getenv('MODEL_REGISTRY_FAILURE_TTL', '30'))
+
+# Motor de inferência: 'keras' (padrão) ou 'numpy' (forward pass em NumPy, sem TensorFlow na predição)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')
+
+MODEL_FILENAME = 'lstm_model.keras'
+SCALER_FILENAME = 'Scaler_model.pkl'
+METADATA_FILENAME = 'metadata.json'
+LATEST_FILENAME = 'LATEST'
+HYPERPARAMETERS_FILENAME = 'hyperparameters.json'
+
+# Configuração de treino usada quando não há uma escolhida pela busca de hiperparâmetros (ver src/hyperparameter_search.py)
+DEFAULT_HYPERPARAMETERS = {'units': 50, 'batch_size': 32, 'epochs': 100, 'time_steps': 60}
+
+
+class ModelEntry:
+    """Modelo e scaler carregados para um símbolo, com a versão e o custo estimado em memória."""
+
+    __slots__ = ('symbol', 'version', 'model', 'scaler', 'nbytes', 'rollout_fn', 'time_steps')
+
+    def __init__(self, symbol, version, model, scaler, nbytes=0, time_steps=None):
+        self.symbol = symbol
+        self.version = version
+        self.model = model
+        self.scaler = scaler
+        self.nbytes = nbytes
+        self.rollout_fn = None # Rollout compilado, construído no primeiro uso (ver model_predict)
+        self.time_steps = time_steps # Tamanho da janela com que o modelo foi treinado (None: o padrão do chamador)
+
+    def __repr__(self):
+        return f'ModelEntry(symbol={self.symbol!r}, version={self.version!r}, nbytes={self.nbytes})'
+
+
+def _symbol_dir(symbol, registry_dir=None):
+    safe_name = re.sub(r'[^A-Za-z0-9._-]', '_', symbol.upper())
+    return os.path.join(registry_dir or REGISTRY_DIR, safe_name)
+
+
+def estimate_model_bytes(model, scaler=None):
+    """Estima a memória ocupada por um modelo carregado (pesos mais um custo fixo) e seu scaler."""
+    weights_bytes = sum(weight.nbytes for weight in model.get_weights())
+    scaler_bytes = sum(getattr(value, 'nbytes', 0) for value in vars(scaler).values()) if scaler is not None else 0
+    overhead = 0 if isinstance(model, NumpyLSTMModel) else MODEL_OVERHEAD_BYTES # O motor NumPy guarda apenas os pesos
+    return weights_bytes + scaler_bytes + overhead
+
+
+def register_model(symbol, model, scaler, metadata=None, registry_dir=None):
+    """Salva uma nova versão do modelo e do scaler de um símbolo e a marca como a mais recente.
+
+    Args:
+        symbol (str): Símbolo da ação (ex: "AAPL").
+        model (keras.Model): Modelo treinado.
+        scaler (object): Scaler ajustado com os dados do símbolo.
+        metadata (dict, optional): Informações adicionais (período de treino, métricas, etc.).
+        registry_dir (str, optional): Diretório do registro. Padrão é `REGISTRY_DIR`.
+
+    Raises:
+        RuntimeError: Se ocorrer um erro ao salvar os artefatos.
+
+    Returns:
+        str: A versão registrada.
+    """
+    from src.lstm_model import save_model # Importado sob demanda: depende do TensorFlow
+
+    symbol_dir = _symbol_dir(symbol, registry_dir)
+    try:
+        os.makedirs(symbol_dir, exist_ok=True)
+        version = datetime.now().strftime('%Y%m%dT%H%M%S')
+        suffix = 1
+        while os.path.exists(os.path.join(symbol_dir, version)):
+            version = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{suffix}"
+            suffix += 1
+        version_dir = os.path.join(symbol_dir, version)
+        os.makedirs(version_dir)
+
+        logging.info(f'Registrando o modelo de {symbol} na versão {version}.')
+        save_model(model, model_dir=version_dir)
+        export_weights(model, os.path.join(version_dir, WEIGHTS_FILENAME), source_path=os.path.join(version_dir, MODEL_FILENAME)) # Pesos para o motor NumPy
+        save_scaler(scaler, path=os.path.join(version_dir, SCALER_FILENAME))
+
+        info = dict(metadata or {})
+        info.update({'symbol': symbol, 'version': version, 'created_at': datetime.now().isoformat(timespec='seconds')})
+        with open(os.path.join(version_dir, METADATA_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(info, f, indent=2, default=str)
+
+        # A troca do ponteiro é atômica: leitores veem a versão antiga ou a nova, nunca um estado parcial
+        tmp_latest = os.path.join(symbol_dir, f'{LATEST_FILENAME}.{os.getpid()}.tmp')
+        with open(tmp_latest, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_latest, os.path.join(symbol_dir, LATEST_FILENAME))
+
+        logging.info(f'Modelo de {symbol} registrado com sucesso na versão {version}.')
+        return version
+    except Exception as e:
+        logging.error(f'Erro ao registrar o modelo de {symbol}: {e}')
+        raise RuntimeError(f'Erro ao registrar o modelo de {symbol}: {e}')
+
+
+def save_default_model(model, scaler, hyperparameters, model_dir='models'):
+    """Salva o modelo, os pesos do motor NumPy, o scaler e os hiperparâmetros como o modelo padrão da API.
+
+    Os pesos em `lstm_model.npz` são reexportados do mesmo modelo, como em `register_model`: sem isso,
+    o motor NumPy continuaria servindo os pesos do treino anterior.
+
+    Args:
+        model (keras.Model): Modelo treinado.
+        scaler (object): Scaler ajustado com os dados do símbolo.
+        hyperparameters (dict): Configuração de treino (a API lê a janela do modelo padrão deste arquivo).
+        model_dir (str, optional): Diretório do modelo padrão. Padrão é 'models'.
+
+    Raises:
+        RuntimeError: Se ocorrer um erro ao salvar os artefatos.
+    """
+    from src.lstm_model import save_model # Importado sob demanda: depende do TensorFlow
+
+    try:
+        save_model(model, model_dir=model_dir)
+        export_weights(model, os.path.join(model_dir, WEIGHTS_FILENAME), source_path=os.path.join(model_dir, MODEL_FILENAME))
+        save_scaler(scaler, path=os.path.join(model_dir, SCALER_FILENAME))
+        save_hyperparameters(hyperparameters, model_dir=model_dir)
+    except Exception as e:
+        logging.error(f'Erro ao salvar o modelo padrão em {model_dir}: {e}')
+        raise RuntimeError(f'Erro ao salvar o modelo padrão: {e}')
+
+
+def list_symbols(registry_dir=None):
+    """Lista os símbolos com ao menos uma versão publicada (arquivo LATEST) no registro."""
+    registry_dir = registry_dir or REGISTRY_DIR
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(name for name in os.listdir(registry_dir) if os.path.isfile(os.path.join(registry_dir, name, LATEST_FILENAME)))
+
+
+def list_versions(symbol, registry_dir=None):
+    """Lista as versões registradas de um símbolo, da mais antiga para a mais recente."""
+    symbol_dir = _symbol_dir(symbol, registry_dir)
+    if not os.path.isdir(symbol_dir):
+        return []
+    return sorted(name for name in os.listdir(symbol_dir)
+                  if os.path.isfile(os.path.join(symbol_dir, name, METADATA_FILENAME)))
+
+
+def latest_version(symbol, registry_dir=None):
+    """Retorna a versão mais recente registrada para o símbolo, ou None se não houver."""
+    latest_path = os.path.join(_symbol_dir(symbol, registry_dir), LATEST_FILENAME)
+    try:
+        with open(latest_path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_metadata(symbol, version=None, registry_dir=None):
+    """Lê os metadados de uma versão (a mais recente, se `version` for None), ou None se não existir."""
+    version = version or latest_version(symbol, registry_dir)
+    if version is None:
+        return None
+    path = os.path.join(_symbol_dir(symbol, registry_dir), version, METADATA_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_entry(symbol, version, registry_dir=None, backend=None):
+    """Carrega do disco o modelo e o scaler de uma versão registrada.
+
+    Args:
+        backend (str, optional): 'keras' ou 'numpy'. Padrão é `INFERENCE_BACKEND`. Com 'numpy', versões
+                                 sem pesos exportados são carregadas com o Keras.
+
+    Raises:
+        RuntimeError: Se ocorrer um erro ao carregar os artefatos.
+    """
+    version_dir = os.path.join(_symbol_dir(symbol, registry_dir), version)
+    backend = backend or INFERENCE_BACKEND
+    try:
+        logging.info(f'Carregando o modelo de {symbol} (versão {version}, motor {backend}) do registro.')
+        weights_path = os.path.join(version_dir, WEIGHTS_FILENAME)
+        if backend == 'numpy' and os.path.exists(weights_path):
+            model = NumpyLSTMModel.load(weights_path)
+        else:
+            from tensorflow.keras.models import load_model # Importado sob demanda: o motor NumPy dispensa o TensorFlow
+            model = load_model(os.path.join(version_dir, MODEL_FILENAME), compile=False)
+        scaler = joblib.load(os.path.join(version_dir, SCALER_FILENAME))
+        metadata = read_metadata(symbol, version, registry_dir) or {}
+        return ModelEntry(symbol, version, model, scaler, estimate_model_bytes(model, scaler), time_steps=metadata.get('time_steps'))
+    except Exception as e:
+        logging.error(f'Erro ao carregar o modelo de {symbol} (versão {version}) do registro: {e}')
+        raise RuntimeError(f'Erro ao carregar o modelo de {symbol} do registro: {e}')
+
+
+def save_hyperparameters(config, symbol=None, registry_dir=None, model_dir='models'):
+    """Grava a configuração de treino escolhida para um símbolo (ou a padrão, se `symbol` for None).
+
+    A troca do arquivo é atômica, como a do ponteiro LATEST.
+
+    Args:
+        config (dict): Hiperparâmetros (units, batch_size, epochs, time_steps) e informações da busca.
+        symbol (str, optional): Símbolo da ação. Se None, grava em `model_dir` a configuração padrão.
+        registry_dir (str, optional): Diretório do registro. Padrão é `REGISTRY_DIR`.
+        model_dir (str, optional): Diretório do modelo padrão. Padrão é 'models'.
+
+    Returns:
+        str: Caminho do arquivo gravado.
+    """
+    directory = _symbol_dir(symbol, registry_dir) if symbol else model_dir
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, HYPERPARAMETERS_FILENAME)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    logging.info(f'Hiperparâmetros de {symbol or "modelo padrão"} gravados em {path}.')
+    return path
+
+
+def load_hyperparameters(symbol=None, registry_dir=None, model_dir='models'):
+    """Retorna a configuração de treino do símbolo: a do símbolo, a padrão gravada ou `DEFAULT_HYPERPARAMETERS`.
+
+    Returns:
+        dict: Hiperparâmetros com ao menos units, batch_size, epochs e time_steps.
+    """
+    paths = [os.path.join(_symbol_dir(symbol, registry_dir), HYPERPARAMETERS_FILENAME)] if symbol else []
+    paths.append(os.path.join(model_dir, HYPERPARAMETERS_FILENAME))
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            return dict(DEFAULT_HYPERPARAMETERS, **{key: saved[key] for key in DEFAULT_HYPERPARAMETERS if key in saved})
+        except FileNotFoundError:
+            continue
+    return dict(DEFAULT_HYPERPARAMETERS)
+
+
+class ModelRegistry:
+    """Registro de modelos por símbolo com carregamento sob demanda e LRU limitado por memória.
+
+    Os modelos são carregados no primeiro uso e mantidos em memória enquanto couberem em
+    `max_bytes`; ao exceder o orçamento, os menos usados recentemente são descartados.
+    A versão mais recente de cada símbolo é relida quando o arquivo LATEST muda, de modo que
+    novos modelos registrados passam a ser servidos sem reiniciar o processo.
+    Uma versão que falha ao carregar (ex: arquivo corrompido) não é relida a cada requisição:
+    o erro é repetido por `failure_ttl` segundos.
+    """
+
+    def __init__(self, registry_dir=None, max_bytes=MAX_RESIDENT_BYTES, failure_ttl=None):
+        self.registry_dir = registry_dir or REGISTRY_DIR
+        self.max_bytes = max_bytes
+        self.failure_ttl = LOAD_FAILURE_TTL_SECONDS if failure_ttl is None else failure_ttl
+        self._entries = OrderedDict() # (símbolo, versão) -> ModelEntry, do menos para o mais recente
+        self._latest = {} # símbolo -> (mtime do LATEST, versão)
+        self._failures = {} # (símbolo, versão) -> (expira_em, mensagem) das falhas de carregamento recentes
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        self.stats = {'hits': 0, 'loads': 0, 'evictions': 0, 'fallbacks': 0, 'load_failures': 0}
+
+    @property
+    def resident_bytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def _resolve_version(self, symbol):
+        """Resolve a versão mais recente do símbolo, relendo LATEST apenas quando ele muda."""
+        latest_path = os.path.join(_symbol_dir(symbol, self.registry_dir), LATEST_FILENAME)
+        try:
+            mtime = os.stat(latest_path).st_mtime_ns
+        except FileNotFoundError:
+            self._latest.pop(symbol, None)
+            return None
+        cached = self._latest.get(symbol)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        version = latest_version(symbol, self.registry_dir)
+        self._latest[symbol] = (mtime, version)
+        if cached is not None and cached[1] != version:
+            invalidate_predictions(symbol) # Nova versão publicada: as predições da anterior não serão mais servidas
+        return version
+
+    def get(self, symbol, version=None):
+        """Retorna o modelo do símbolo (na versão pedida ou na mais recente), carregando-o se necessário.
+
+        Args:
+            symbol (str): Símbolo da ação.
+            version (str, optional): Versão específica. Padrão é a mais recente.
+
+        Raises:
+            RuntimeError: Se a versão existir mas não puder ser carregada (ou tiver falhado há menos de `failure_ttl` segundos).
+
+        Returns:
+            ModelEntry: O modelo carregado, ou None se o símbolo não tiver modelo registrado.
+        """
+        symbol = symbol.upper()
+        version = version or self._resolve_version(symbol)
+        if version is None:
+            with self._lock:
+                self.stats['fallbacks'] += 1
+            return None
+
+        key = (symbol, version)
+        with self._lock:
+            entry = self._cached(key)
+            if entry is not None:
+                return entry
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        # Apenas uma thread carrega cada versão; as demais aguardam e reaproveitam o resultado (ou o erro)
+        with loading_lock:
+            try:
+                with self._lock:
+                    entry = self._cached(key)
+                    if entry is not None:
+                        return entry
+                try:
+                    entry = load_entry(symbol, version, self.registry_dir)
+                except Exception as e:
+                    with self._lock:
+                        self._failures[key] = (time.monotonic() + self.failure_ttl, str(e))
+                        self.stats['load_failures'] += 1
+                    raise
+                with self._lock:
+                    self._entries[key] = entry
+                    self.stats['loads'] += 1
+                    self._evict()
+            finally:
+                with self._lock: # Também após uma falha: o dicionário não cresce com versões quebradas
+                    if self._loading_locks.get(key) is loading_lock: # Não remove o lock de um carregamento posterior
+                        del self._loading_locks[key]
+        return entry
+
+    def _cached(self, key):
+        """Retorna o modelo já carregado, ou repete a falha recente de carregamento (chamada com `_lock`)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+        failure = self._failures.get(key)
+        if failure is not None:
+            if failure[0] > time.monotonic():
+                raise RuntimeError(failure[1])
+            del self._failures[key]
+        return None
+
+    def _evict(self):
+        """Descarta os modelos menos usados até caber no orçamento (mantém sempre o mais recente)."""
+        while len(self._entries) > 1 and self.resident_bytes > self.max_bytes:
+            (symbol, version), _ = self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+            logging.info(f'Modelo de {symbol} (versão {version}) descartado da memória (LRU).')
+
+    def invalidate(self, symbol=None):
+        """Remove da memória os modelos de um símbolo, ou todos se `symbol` for None."""
+        with self._lock:
+            if symbol is None:
+                self._entries.clear()
+                self._latest.clear()
+                self._failures.clear()
+            else:
+                symbol = symbol.upper()
+                for key in [key for key in self._entries if key[0] == symbol]:
+                    del self._entries[key]
+                for key in [key for key in self._failures if key[0] == symbol]:
+                    del self._failures[key]
+                self._latest.pop(symbol, None)
+        invalidate_predictions(symbol)
+
+    def get_stats(self):
+        """Retorna os contadores do registro e o uso de memória estimado."""
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), resident_bytes=self.resident_bytes, max_bytes=self.max_bytes)
+
+
+_REGISTRY = None
+
+
+def get_model_registry():
+    """Retorna o registro de modelos compartilhado pelo processo, criando-o no primeiro uso."""
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = ModelRegistry()
+    return _REGISTRY
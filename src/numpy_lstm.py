@@ -0,0 +1,383 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+# Nome do arquivo de pesos exportado, salvo ao lado do modelo .keras
+WEIGHTS_FILENAME = 'lstm_model.npz'
+
+# Pesos em precisão reduzida (ver `quantize_arrays`), exportados ao lado do arquivo em float32 para
+# medir a perda de acurácia da quantização (ver benchmarks/quantization.py). A API serve sempre o float32.
+QUANTIZED_WEIGHTS_FILENAMES = {'float16': 'lstm_model_float16.npz', 'int8': 'lstm_model_int8.npz'}
+
+
+def _sigmoid(x):
+    # Forma numericamente estável da sigmoide, equivalente à usada pelo Keras
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+def artifact_version(path):
+    """Versão de um artefato: os primeiros dígitos do SHA-256 do conteúdo.
+
+    Ao contrário da data de modificação, é a mesma em qualquer máquina e processo que tenha o mesmo arquivo.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def weights_filename(precision='float32'):
+    """Nome do arquivo de pesos do motor NumPy na precisão pedida ('float32', 'float16' ou 'int8')."""
+    if precision == 'float32':
+        return WEIGHTS_FILENAME
+    if precision not in QUANTIZED_WEIGHTS_FILENAMES:
+        raise ValueError(f"Precisão {precision} não suportada pelo motor NumPy.")
+    return QUANTIZED_WEIGHTS_FILENAMES[precision]
+
+
+def export_weights(model, path, precision='float32', source_path=None):
+    """Extrai os pesos de um modelo Keras LSTM→Dropout→LSTM→Dense e os salva em um arquivo .npz.
+
+    As camadas de Dropout não têm pesos e são a identidade na inferência, por isso são ignoradas.
+
+    Args:
+        model (keras.Model): Modelo treinado (ex: o criado por `create_model`).
+        path (str): Caminho do arquivo .npz de saída.
+        precision (str, optional): 'float32' (padrão), 'float16' ou 'int8' (ver `quantize_arrays`).
+        source_path (str, optional): Arquivo .keras de onde o modelo veio. Sua versão (`artifact_version`)
+                                     é gravada nos pesos e vira a `source_version` do motor carregado.
+
+    Raises:
+        RuntimeError: Se o modelo tiver camadas ou ativações não suportadas, ou se ocorrer um erro ao salvar.
+    """
+    try:
+        arrays = quantize_arrays(_extract_arrays(model), precision)
+        if source_path is not None:
+            arrays['source_version'] = np.array(artifact_version(source_path))
+        logging.info(f'Exportando os pesos do modelo ({precision}) para o motor NumPy em: {path}')
+        np.savez(path, **arrays)
+    except Exception as e:
+        logging.error(f'Erro ao exportar os pesos do modelo para {path}: {e}')
+        raise RuntimeError(f'Erro ao exportar os pesos do modelo: {e}')
+
+
+def _extract_arrays(model):
+    """Pesos de um modelo Keras LSTM→Dropout→LSTM→Dense no layout do arquivo .npz do motor NumPy.
+
+    Raises:
+        ValueError: Se o modelo tiver camadas ou ativações não suportadas.
+    """
+    arrays = {}
+    layer_types = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        if kind == 'Dropout':
+            continue
+        if kind == 'LSTM':
+            if config.get('activation') != 'tanh' or config.get('recurrent_activation') != 'sigmoid':
+                raise ValueError(f"Ativações não suportadas na camada {layer.name}.")
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            index = len(layer_types)
+            arrays[f'{index}_kernel'] = kernel.astype(np.float32)
+            arrays[f'{index}_recurrent_kernel'] = recurrent_kernel.astype(np.float32)
+            arrays[f'{index}_bias'] = bias.astype(np.float32)
+            layer_types.append('lstm_seq' if config.get('return_sequences') else 'lstm')
+        elif kind == 'Dense':
+            if config.get('activation') != 'linear':
+                raise ValueError(f"Ativação não suportada na camada {layer.name}.")
+            kernel, bias = layer.get_weights()
+            index = len(layer_types)
+            arrays[f'{index}_kernel'] = kernel.astype(np.float32)
+            arrays[f'{index}_bias'] = bias.astype(np.float32)
+            layer_types.append('dense')
+        else:
+            raise ValueError(f"Camada {kind} não suportada pelo motor NumPy.")
+
+    arrays['layer_types'] = np.array(layer_types)
+    return arrays
+
+
+def quantize_arrays(arrays, precision):
+    """Converte as matrizes de pesos (kernels) para precisão reduzida, pós-treino e sem dados de calibração.
+
+    Com 'float16', as matrizes são apenas convertidas. Com 'int8', cada coluna (uma saída de porta
+    ou do Dense) é quantizada simetricamente com a sua própria escala, gravada em `<nome>_scale`.
+    Os vieses continuam em float32: são poucos valores e somam direto nas ativações.
+
+    Args:
+        arrays (dict): Pesos no layout de `_extract_arrays`.
+        precision (str): 'float32' (sem conversão), 'float16' ou 'int8'.
+
+    Returns:
+        dict: Pesos no layout do arquivo .npz, com a precisão em 'precision'.
+    """
+    weights_filename(precision) # Valida a precisão
+    quantized = {'precision': np.array(precision)}
+    for name, value in arrays.items():
+        if precision == 'float32' or not name.endswith('kernel'):
+            quantized[name] = value
+        elif precision == 'float16':
+            quantized[name] = value.astype(np.float16)
+        else:
+            scale = np.abs(value).max(axis=0, keepdims=True) / 127
+            scale[scale == 0] = 1.0
+            quantized[name] = np.clip(np.round(value / scale), -127, 127).astype(np.int8)
+            quantized[f'{name}_scale'] = scale.astype(np.float32)
+    return quantized
+
+
+class NumpyLSTMModel:
+    """Forward pass em NumPy puro da pilha LSTM→Dropout→LSTM→Dense criada por `create_model`.
+
+    Expõe `predict`, `predict_on_batch` e `get_weights` com a mesma semântica usada pela API,
+    de modo que pode substituir o modelo Keras sem importar o TensorFlow.
+    """
+
+    def __init__(self, layers):
+        """
+        Args:
+            layers (list[tuple]): Camadas em ordem, como (tipo, pesos...) onde tipo é 'lstm_seq',
+                                  'lstm' ou 'dense'.
+        """
+        self.layers = layers
+        self.source_version = None # Versão do .keras de onde os pesos foram exportados (ver `export_weights`)
+
+    @classmethod
+    def load(cls, path):
+        """Carrega um arquivo .npz gerado por `export_weights`.
+
+        Args:
+            path (str): Caminho do arquivo .npz.
+
+        Raises:
+            RuntimeError: Se ocorrer um erro ao carregar os pesos.
+        """
+        try:
+            with np.load(path) as data:
+                model = cls._from_arrays(data)
+                if 'source_version' in data:
+                    model.source_version = str(data['source_version'])
+                return model
+        except Exception as e:
+            logging.error(f'Erro ao carregar os pesos do motor NumPy de {path}: {e}')
+            raise RuntimeError(f'Erro ao carregar os pesos do motor NumPy: {e}')
+
+    @classmethod
+    def from_keras(cls, model):
+        """Cria o motor NumPy diretamente de um modelo Keras carregado, sem passar pelo arquivo .npz.
+
+        Raises:
+            RuntimeError: Se o modelo tiver camadas ou ativações não suportadas.
+        """
+        try:
+            return cls._from_arrays(_extract_arrays(model))
+        except Exception as e:
+            logging.error(f'Erro ao converter o modelo Keras para o motor NumPy: {e}')
+            raise RuntimeError(f'Erro ao converter o modelo para o motor NumPy: {e}')
+
+    @classmethod
+    def _from_arrays(cls, data):
+        precision = str(data['precision']) if 'precision' in data else 'float32'
+        layer_types = [str(kind) for kind in data['layer_types']]
+
+        def weight(name):
+            if f'{name}_scale' in data:
+                return (data[name], data[f'{name}_scale']) # int8: valores e escala por coluna
+            return data[name]
+
+        layers = []
+        for index, kind in enumerate(layer_types):
+            if kind == 'dense':
+                layers.append((kind, weight(f'{index}_kernel'), data[f'{index}_bias']))
+            else:
+                units = data[f'{index}_recurrent_kernel'].shape[0]
+                layers.append((kind,) + tuple(cls._reorder_gates(weight(f'{index}_{name}'), units)
+                                              for name in ('kernel', 'recurrent_kernel', 'bias')))
+        if precision != 'float32':
+            return QuantizedLSTMModel(layers, precision)
+        return cls(layers)
+
+    def get_weights(self):
+        return [weight for layer in self.layers for weight in layer[1:]]
+
+    @staticmethod
+    def _reorder_gates(weight, units):
+        """Reordena as portas do Keras (i, f, c, o) para (i, f, o, c), deixando as sigmoides contíguas."""
+        if isinstance(weight, tuple): # int8: reordena os valores e as escalas das colunas
+            return tuple(NumpyLSTMModel._reorder_gates(part, units) for part in weight)
+        return np.concatenate([weight[..., :2 * units], weight[..., 3 * units:], weight[..., 2 * units:3 * units]], axis=-1)
+
+    @staticmethod
+    def _lstm(x, kernel, recurrent_kernel, bias, return_sequences):
+        """Executa uma camada LSTM (portas já na ordem i, f, o, c) sobre x (batch, T, features)."""
+        batch_size, time_steps, _ = x.shape
+        units = recurrent_kernel.shape[0]
+        # A projeção da entrada não depende do estado: é calculada para todos os passos de uma vez,
+        # já no layout (T, batch, 4 * units) para que cada passo leia um bloco contíguo
+        x_proj = np.ascontiguousarray((x @ kernel + bias).transpose(1, 0, 2))
+        h = np.zeros((batch_size, units), dtype=np.float32)
+        c = np.zeros((batch_size, units), dtype=np.float32)
+        z = np.empty((batch_size, 4 * units), dtype=np.float32)
+        outputs = np.empty((batch_size, time_steps, units), dtype=np.float32) if return_sequences else None
+        for t in range(time_steps):
+            np.matmul(h, recurrent_kernel, out=z)
+            z += x_proj[t]
+            gates = _sigmoid(z[:, :3 * units]) # i, f, o em uma única operação
+            c *= gates[:, units:2 * units]
+            c += gates[:, :units] * np.tanh(z[:, 3 * units:])
+            h = gates[:, 2 * units:] * np.tanh(c)
+            if return_sequences:
+                outputs[:, t, :] = h
+        return outputs if return_sequences else h
+
+    def predict_on_batch(self, X):
+        """Executa o forward pass sobre um lote (batch, time_steps, features) e retorna (batch, 1)."""
+        x = np.asarray(X, dtype=np.float32)
+        for layer in self.layers:
+            kind = layer[0]
+            if kind == 'dense':
+                x = x @ layer[1] + layer[2]
+            else:
+                x = self._lstm(x, layer[1], layer[2], layer[3], return_sequences=(kind == 'lstm_seq'))
+        return x
+
+    def predict(self, X, verbose=0):
+        return self.predict_on_batch(X)
+
+    def initial_state(self, batch_size):
+        """Estado inicial (zeros) das camadas LSTM: uma lista de (h, c) com formato (batch, units)."""
+        return [(np.zeros((batch_size, layer[2].shape[0]), dtype=np.float32),
+                 np.zeros((batch_size, layer[2].shape[0]), dtype=np.float32))
+                for layer in self.layers if layer[0] != 'dense']
+
+    def step(self, x, state):
+        """Avança a pilha de camadas em um único passo de tempo.
+
+        Executar `step` sobre cada passo de uma janela, a partir de `initial_state`, produz a mesma
+        saída de `predict_on_batch` sobre a janela inteira.
+
+        Args:
+            x (numpy.ndarray): Entrada do passo com formato (batch, features).
+            state (list[tuple]): Estado (h, c) de cada camada LSTM, como o de `initial_state`.
+
+        Returns:
+            tuple: (saída do modelo após o passo, com formato (batch, 1), novo estado).
+        """
+        x = np.asarray(x, dtype=np.float32)
+        new_state = []
+        for layer in self.layers:
+            if layer[0] == 'dense':
+                x = x @ layer[1] + layer[2]
+                continue
+            _, kernel, recurrent_kernel, bias = layer
+            h, c = state[len(new_state)]
+            units = recurrent_kernel.shape[0]
+            z = x @ kernel + bias
+            z += h @ recurrent_kernel
+            gates = _sigmoid(z[:, :3 * units]) # i, f, o
+            c = c * gates[:, units:2 * units] + gates[:, :units] * np.tanh(z[:, 3 * units:])
+            x = gates[:, 2 * units:] * np.tanh(c) # h da camada é a entrada da próxima
+            new_state.append((x, c))
+        return x, new_state
+
+    def rollout(self, X, horizon):
+        """Previsão autorregressiva de `horizon` passos para um lote de janelas.
+
+        Returns:
+            numpy.ndarray: Previsões normalizadas com formato (batch, horizon).
+        """
+        window = np.array(X, dtype=np.float32)
+        predictions = np.empty((window.shape[0], horizon), dtype=np.float32)
+        for step in range(horizon):
+            next_value = self.predict_on_batch(window) # (batch, 1)
+            predictions[:, step] = next_value[:, 0]
+            window = np.concatenate([window[:, 1:, :], next_value[:, :, np.newaxis]], axis=1)
+        return predictions
+
+
+class QuantizedLSTMModel(NumpyLSTMModel):
+    """Motor NumPy carregado de pesos em precisão reduzida ('float16' ou 'int8'), para medir a perda de acurácia.
+
+    Os pesos são convertidos para float32 uma única vez, no carregamento, e as contas são as do
+    motor em float32: o NumPy não tem multiplicação de matrizes int8 acelerada, então o custo por
+    predição e a memória residente são os mesmos do float32. Só a perda de precisão da
+    quantização continua nos pesos carregados; por isso a API não serve estes pesos.
+    """
+
+    def __init__(self, quantized_layers, precision):
+        """
+        Args:
+            quantized_layers (list[tuple]): Camadas como em `NumpyLSTMModel`, com os kernels em
+                                            float16 ou como (valores int8, escala por coluna).
+            precision (str): 'float16' ou 'int8'.
+        """
+        super().__init__([(layer[0],) + tuple(self._dequantize(weight) for weight in layer[1:]) for layer in quantized_layers])
+        self.precision = precision
+
+    @staticmethod
+    def _dequantize(weight):
+        if isinstance(weight, tuple):
+            values, scale = weight
+            return values.astype(np.float32) * scale
+        return weight.astype(np.float32)
+
+
+def load_numpy_model(model_dir, precision='float32'):
+    """Carrega o motor NumPy a partir dos pesos exportados em `model_dir`.
+
+    Args:
+        model_dir (str): Diretório dos pesos exportados.
+        precision (str, optional): 'float32' (padrão, o servido pela API), 'float16' ou 'int8'.
+
+    Raises:
+        RuntimeError: Se o arquivo de pesos não existir ou não puder ser carregado.
+    """
+    path = os.path.join(model_dir, weights_filename(precision))
+    if not os.path.exists(path):
+        raise RuntimeError(f'Pesos do motor NumPy não encontrados em {path}. Exporte-os com `python -m src.numpy_lstm export {model_dir} {precision}`.')
+    return NumpyLSTMModel.load(path)
+
+
+def check_parity(keras_model, numpy_model, X):
+    """Compara as saídas do modelo Keras e do motor NumPy sobre o mesmo lote de janelas.
+
+    Returns:
+        float: A maior diferença absoluta entre as duas saídas.
+    """
+    expected = np.asarray(keras_model.predict_on_batch(X))
+    actual = numpy_model.predict_on_batch(X)
+    return float(np.max(np.abs(expected - actual)))
+
+
+if __name__ == '__main__':
+    import argparse
+    from src.logger import configure_logging
+    from tensorflow.keras.models import load_model
+
+    parser = argparse.ArgumentParser(description='Confere a paridade do motor NumPy com o Keras e exporta os pesos.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    check_parser = subparsers.add_parser('check', help='Compara os pesos já exportados com o modelo Keras (não grava nada)')
+    check_parser.add_argument('model_dir', nargs='?', default='models')
+    check_parser.add_argument('precisions', nargs='*', default=['float32'])
+    export_parser = subparsers.add_parser('export', help='Exporta (e sobrescreve) os pesos do modelo Keras e confere a paridade')
+    export_parser.add_argument('model_dir', nargs='?', default='models')
+    export_parser.add_argument('precisions', nargs='*', default=[], help='Precisões reduzidas a exportar além do float32 (float16, int8)')
+    args = parser.parse_args()
+
+    configure_logging()
+    keras_model = load_model(os.path.join(args.model_dir, 'lstm_model.keras'), compile=False)
+    X = np.random.default_rng(0).random((256, keras_model.input_shape[1], 1), dtype=np.float32)
+    if args.command == 'export':
+        precisions = ['float32'] + [precision for precision in args.precisions if precision != 'float32']
+    else:
+        precisions = args.precisions
+    for precision in precisions:
+        path = os.path.join(args.model_dir, weights_filename(precision))
+        if args.command == 'export':
+            export_weights(keras_model, path, precision=precision, source_path=os.path.join(args.model_dir, 'lstm_model.keras'))
+        max_diff = check_parity(keras_model, load_numpy_model(args.model_dir, precision), X)
+        print(f'Pesos ({precision}) em {path} ({os.path.getsize(path) / 1024:.1f} KB). Diferença máxima para o Keras: {max_diff:.2e}')
@@ -0,0 +1,212 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from src.logger import configure_logging
+from src.data_handler import download_stock_data
+from src.forecast_store import FORECAST_STORE_PATH, write_store
+from src.model_predict import _last_window, forecast_scaled_windows, load_model_for_api, load_scaler_for_api, resolve_model
+from src.model_registry import list_symbols
+
+# Símbolos calculados pelo job, separados por vírgula (ver também `--symbols` e `--symbols-file`)
+PRECOMPUTE_SYMBOLS = os.getenv('PRECOMPUTE_SYMBOLS', '')
+
+# Dias previstos por símbolo; requisições com horizonte até este valor são respondidas pelo armazenamento
+PRECOMPUTE_HORIZON = int(os.getenv('PRECOMPUTE_HORIZON', '5'))
+
+# Janelas por forward pass
+PRECOMPUTE_BATCH_SIZE = int(os.getenv('PRECOMPUTE_BATCH_SIZE', '1024'))
+
+# Downloads simultâneos
+PRECOMPUTE_WORKERS = int(os.getenv('PRECOMPUTE_WORKERS', '16'))
+
+# Horário (HH:MM) e fuso do cálculo diário no modo `--schedule`: depois do fechamento do pregão
+PRECOMPUTE_AT = os.getenv('PRECOMPUTE_AT', '16:30')
+PRECOMPUTE_TIMEZONE = os.getenv('PRECOMPUTE_TIMEZONE', 'America/New_York')
+
+# Janela de entrada padrão (em pregões), a mesma da API
+TIME_STEPS = 60
+
+
+def precompute_forecasts(symbols, end_date=None, horizon=None, batch_size=None, max_workers=None, time_steps=TIME_STEPS, path=None):
+    """Calcula as previsões dos símbolos e grava o armazenamento lido pela API.
+
+    Os históricos são baixados em paralelo; as janelas que usam o mesmo modelo são normalizadas,
+    previstas e desnormalizadas em lotes de `batch_size`. Cada previsão é gravada com o último
+    pregão usado e a versão do modelo, para que a API só a use quando calcularia o mesmo resultado.
+    O modelo padrão precisa estar carregado (`load_model_for_api` / `load_scaler_for_api`).
+
+    Args:
+        symbols (list[str]): Símbolos das ações. Símbolos repetidos são ignorados.
+        end_date (str, optional): Data de fim do download (YYYY-MM-DD), exclusiva. Padrão é amanhã, ou seja,
+                                  inclui o pregão de hoje (o job roda depois do fechamento).
+        horizon (int, optional): Dias previstos por símbolo. Padrão é PRECOMPUTE_HORIZON.
+        batch_size (int, optional): Janelas por forward pass. Padrão é PRECOMPUTE_BATCH_SIZE.
+        max_workers (int, optional): Downloads simultâneos. Padrão é PRECOMPUTE_WORKERS.
+        time_steps (int, optional): Tamanho da janela, se o modelo não definir o seu. Padrão é 60.
+        path (str, optional): Arquivo do armazenamento. Padrão é FORECAST_STORE_PATH.
+
+    Raises:
+        RuntimeError: Se o modelo padrão não estiver carregado, ou se o forward pass ou a gravação falharem.
+
+    Returns:
+        dict: Resumo do cálculo (símbolos pedidos e gravados, erros por símbolo, duração de cada etapa).
+    """
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    horizon = horizon or PRECOMPUTE_HORIZON
+    batch_size = batch_size or PRECOMPUTE_BATCH_SIZE
+    end_date = end_date or (date.today() + timedelta(days=1)).isoformat()
+    started = time.perf_counter()
+    logging.info(f'Calculando previsões de {len(symbols)} símbolos até {end_date} (horizonte {horizon}).')
+
+    entries = [resolve_model(symbol) for symbol in symbols]
+    longest = max([entry.time_steps or time_steps for entry in entries], default=time_steps)
+    start_date = (datetime.strptime(end_date, '%Y-%m-%d').date() - timedelta(days=longest * 2 + 30)).isoformat() # Folga para fins de semana e feriados
+
+    def fetch(symbol):
+        try:
+            return download_stock_data(symbol, start_date=start_date, end_date=end_date), None
+        except Exception as e:
+            logging.error(f'Erro ao baixar dados de {symbol} para o cálculo das previsões: {e}')
+            return None, f'Erro ao baixar os dados: {e}'
+
+    errors = {}
+    groups = {} # id do modelo -> (modelo, janelas, [(símbolo, primeiro pregão da janela, último pregão)])
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers or PRECOMPUTE_WORKERS, len(symbols) or 1))) as executor:
+        for symbol, entry, (data, error) in zip(symbols, entries, executor.map(fetch, symbols)):
+            if error is not None:
+                errors[symbol] = error
+                continue
+            ultimos_dias = _last_window(data, symbol, start_date, end_date, entry.time_steps or time_steps)
+            if ultimos_dias is None:
+                errors[symbol] = f'Dados insuficientes para uma sequência de {entry.time_steps or time_steps} dias.'
+                continue
+            _, windows, keys = groups.setdefault(id(entry), (entry, [], []))
+            windows.append(ultimos_dias[:, 0])
+            keys.append((symbol, data.index[-len(ultimos_dias)].date().isoformat(), data.index[-1].date().isoformat()))
+    download_seconds = time.perf_counter() - started
+
+    rows = []
+    for entry, windows, keys in groups.values():
+        entry_time_steps = entry.time_steps or time_steps
+        raw = np.stack(windows) # (símbolos, time_steps)
+        for start in range(0, len(raw), batch_size):
+            chunk = raw[start:start + batch_size]
+            try:
+                X_input = entry.scaler.transform(chunk.reshape(-1, 1)).reshape(len(chunk), -1, 1).astype(np.float32)
+                predicted = forecast_scaled_windows(X_input, horizon=horizon, entry=entry)
+            except Exception as e:
+                logging.error(f'Erro ao calcular as previsões do modelo {entry.symbol}@{entry.version}: {e}')
+                raise RuntimeError(f'Erro ao calcular as previsões pré-calculadas: {e}')
+            for (symbol, first_bar, last_bar), prices in zip(keys[start:start + batch_size], predicted):
+                rows.append((symbol, first_bar, last_bar, f'{entry.symbol}@{entry.version}', entry_time_steps, prices))
+    predict_seconds = time.perf_counter() - started - download_seconds
+
+    write_store(rows, horizon, path=path)
+    summary = {
+        'requested': len(symbols),
+        'stored': len(rows),
+        'errors': errors,
+        'end_date': end_date,
+        'horizon': horizon,
+        'download_seconds': download_seconds,
+        'predict_seconds': predict_seconds,
+        'total_seconds': time.perf_counter() - started,
+        'path': path or FORECAST_STORE_PATH,
+    }
+    logging.info(f"Previsões de {len(rows)} de {len(symbols)} símbolos gravadas em {summary['path']} "
+                 f"(download {download_seconds:.1f}s, predição {predict_seconds:.2f}s).")
+    return summary
+
+
+def next_run_time(at=None, timezone=None, now=None):
+    """Retorna o próximo horário do cálculo diário: dia útil (segunda a sexta) às `at`, no fuso `timezone`.
+
+    Args:
+        at (str, optional): Horário no formato HH:MM. Padrão é PRECOMPUTE_AT.
+        timezone (str, optional): Fuso horário IANA (ex: 'America/New_York'). Padrão é PRECOMPUTE_TIMEZONE.
+        now (datetime, optional): Momento de referência, com fuso. Padrão é agora.
+
+    Returns:
+        datetime: Próxima execução, com fuso.
+    """
+    from zoneinfo import ZoneInfo
+
+    tz = ZoneInfo(timezone or PRECOMPUTE_TIMEZONE)
+    hour, minute = (int(part) for part in (at or PRECOMPUTE_AT).split(':'))
+    now = (now or datetime.now(tz)).astimezone(tz)
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    while run_at <= now or run_at.weekday() >= 5: # Já passou hoje, ou sábado/domingo
+        run_at = (run_at + timedelta(days=1)).replace(hour=hour, minute=minute)
+    return run_at
+
+
+def run_schedule(symbols_fn, at=None, timezone=None, model_dir='models', **kwargs):
+    """Executa `precompute_forecasts` todo dia útil depois do fechamento, até o processo ser encerrado.
+
+    O modelo padrão é recarregado antes de cada cálculo, para que as previsões usem a mesma versão
+    que a API terá carregado depois de um novo treino.
+
+    Args:
+        symbols_fn (callable): Retorna a lista de símbolos a cada execução (ex: relê o arquivo de símbolos).
+        at (str, optional): Ver `next_run_time`.
+        timezone (str, optional): Ver `next_run_time`.
+        model_dir (str, optional): Diretório do modelo padrão. Padrão é 'models'.
+        **kwargs: Argumentos repassados para `precompute_forecasts`.
+    """
+    while True:
+        run_at = next_run_time(at, timezone)
+        logging.info(f'Próximo cálculo das previsões em {run_at.isoformat()}.')
+        time.sleep(max(0.0, (run_at - datetime.now(run_at.tzinfo)).total_seconds()))
+        try:
+            load_scaler_for_api(model_dir)
+            load_model_for_api(model_dir)
+            precompute_forecasts(symbols_fn(), **kwargs)
+        except Exception as e:
+            logging.error(f'Erro no cálculo agendado das previsões: {e}') # Tenta de novo no próximo dia útil
+
+
+def _read_symbols(args):
+    """Símbolos da linha de comando, do arquivo (um por linha), de PRECOMPUTE_SYMBOLS ou, por fim, os do registro de modelos."""
+    if args.symbols:
+        return args.symbols
+    if args.symbols_file:
+        with open(args.symbols_file, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    if PRECOMPUTE_SYMBOLS:
+        return [symbol.strip() for symbol in PRECOMPUTE_SYMBOLS.split(',') if symbol.strip()]
+    return list_symbols()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calcula as previsões de uma lista de símbolos e grava o armazenamento usado pelo /predict.')
+    parser.add_argument('--symbols', nargs='+', help='Símbolos (padrão: --symbols-file, PRECOMPUTE_SYMBOLS ou os símbolos do registro)')
+    parser.add_argument('--symbols-file', help='Arquivo com um símbolo por linha')
+    parser.add_argument('--end-date', help='Fim do download (YYYY-MM-DD), exclusivo. Padrão é amanhã')
+    parser.add_argument('--horizon', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--output', default=None, help='Arquivo do armazenamento. Padrão é FORECAST_STORE_PATH')
+    parser.add_argument('--schedule', action='store_true', help='Fica em execução e calcula todo dia útil em --at')
+    parser.add_argument('--at', default=None, help='Horário do cálculo diário (HH:MM). Padrão é PRECOMPUTE_AT')
+    parser.add_argument('--timezone', default=None, help='Fuso do horário. Padrão é PRECOMPUTE_TIMEZONE')
+    args = parser.parse_args()
+
+    configure_logging()
+    options = dict(horizon=args.horizon, batch_size=args.batch_size, max_workers=args.workers, path=args.output)
+    if args.schedule:
+        run_schedule(lambda: _read_symbols(args), at=args.at, timezone=args.timezone, model_dir=args.model_dir, **options)
+    else:
+        load_scaler_for_api(args.model_dir)
+        load_model_for_api(args.model_dir)
+        summary = precompute_forecasts(_read_symbols(args), end_date=args.end_date, **options)
+        for symbol, error in summary['errors'].items():
+            print(f'{symbol}: {error}')
+        print(f"{summary['stored']} de {summary['requested']} símbolos gravados em {summary['path']} "
+              f"(download {summary['download_seconds']:.1f}s, predição {summary['predict_seconds']:.2f}s)")
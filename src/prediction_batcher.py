@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+from src.model_predict import forecast_scaled_windows
+
+# Configuração padrão do micro-batching (pode ser alterada por variáveis de ambiente)
+MAX_BATCH_SIZE = int(os.getenv('PREDICT_BATCH_MAX_SIZE', '64'))
+MAX_WAIT_MS = float(os.getenv('PREDICT_BATCH_WAIT_MS', '5'))
+
+# Lotes (modelo, faixa de horizonte) executados ao mesmo tempo no executor
+MAX_CONCURRENT_GROUPS = int(os.getenv('PREDICT_BATCH_CONCURRENCY', '2'))
+
+
+def _horizon_bucket(horizon):
+    """Faixa do horizonte para o agrupamento: a menor potência de dois maior ou igual a `horizon`."""
+    return 1 << max(0, int(horizon) - 1).bit_length()
+
+
+class PredictionBatcher:
+    """Agrupa requisições de predição concorrentes em um único forward pass do modelo.
+
+    Cada chamada a `submit` enfileira uma janela normalizada e o horizonte pedido. Um worker
+    assíncrono espera até `max_wait_ms` (ou até juntar `max_batch_size` janelas), empilha as
+    janelas e executa `predict_fn` fora do event loop uma única vez por modelo e faixa de horizonte
+    (potências de dois: 1, 2, 4, 8, ...), com o maior horizonte da faixa, entregando a cada chamador
+    apenas os dias que ele pediu. Cada grupo roda em uma task própria, com até
+    `max_concurrent_groups` grupos ao mesmo tempo no executor, e o worker volta a coletar
+    requisições sem esperar o fim dos grupos: uma requisição de 1 dia que chega durante o
+    rollout de 250 dias de outra é executada no lote seguinte, sem esperar esse rollout terminar.
+    Só quando todas as vagas estão ocupadas o worker espera, e a fila forma lotes maiores.
+
+    Enquanto um lote é executado, as novas requisições continuam sendo enfileiradas e formam
+    o próximo lote, de modo que o tamanho dos lotes cresce naturalmente com a carga.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, executor=None,
+                 max_concurrent_groups=MAX_CONCURRENT_GROUPS):
+        """
+        Args:
+            predict_fn (callable): Função `predict_fn(X, horizon, entry)` que recebe um array
+                                   (batch, time_steps, 1) e o modelo (`ModelEntry`) e retorna
+                                   um array (batch, horizon).
+            max_batch_size (int, optional): Número máximo de janelas por lote.
+            max_wait_ms (float, optional): Tempo máximo (ms) de espera para completar um lote.
+            executor (concurrent.futures.Executor, optional): Executor para o forward pass.
+                                                             Padrão é o executor do event loop.
+            max_concurrent_groups (int, optional): Número máximo de lotes executados ao mesmo tempo.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self.max_concurrent_groups = max(1, int(max_concurrent_groups))
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._semaphore = None
+        self._groups = set() # Tasks dos lotes em execução
+        self.stats = {'requests': 0, 'batches': 0, 'max_batch': 0}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_groups)
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, window, horizon=1, entry=None):
+        """Enfileira uma janela e aguarda o resultado do lote em que ela for executada.
+
+        Args:
+            window (numpy.ndarray): Janela normalizada com formato (time_steps, 1).
+            horizon (int, optional): Número de dias à frente a prever. Padrão é 1.
+            entry (ModelEntry, optional): Modelo a usar. Padrão é o modelo padrão da API.
+
+        Returns:
+            numpy.ndarray: As `horizon` previsões correspondentes a esta janela.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((window, horizon, entry, future))
+        return await future
+
+    async def _collect(self):
+        """Aguarda a primeira requisição e junta as seguintes até encher o lote ou esgotar o prazo."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            except asyncio.CancelledError: # `stop` durante a coleta: as requisições já retiradas da fila não seriam respondidas
+                self._fail(batch)
+                raise
+        # Aproveita o que já estiver enfileirado sem esperar mais
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            batch = [item for item in batch if not item[3].cancelled()]
+            if not batch:
+                continue
+
+            # Janelas de modelos diferentes não podem compartilhar o forward pass, e horizontes muito
+            # diferentes não devem compartilhar o rollout (o mais curto esperaria o mais longo)
+            groups = {}
+            for item in batch:
+                groups.setdefault((_horizon_bucket(item[1]), id(item[2])), []).append(item)
+
+            self.stats['requests'] += len(batch)
+            pending = [groups[bucket] for bucket in sorted(groups, key=lambda bucket: bucket[0])] # Faixas curtas primeiro
+            while pending:
+                try:
+                    await self._semaphore.acquire() # Com todas as vagas ocupadas, a fila acumula e forma um lote maior
+                except asyncio.CancelledError: # `stop`: os lotes ainda não iniciados não serão executados
+                    self._fail([item for group in pending for item in group])
+                    raise
+                task = self._loop.create_task(self._run_group(pending.pop(0)))
+                self._groups.add(task)
+                task.add_done_callback(self._groups.discard)
+
+    @staticmethod
+    def _fail(items):
+        for _, _, _, future in items:
+            if not future.done():
+                future.set_exception(RuntimeError('Batcher de predição encerrado.'))
+
+    async def _run_group(self, group):
+        """Executa um lote em uma task própria e libera a vaga ocupada pelo worker em `_run`."""
+        try:
+            await self._predict_group(group)
+        finally:
+            self._semaphore.release()
+
+    async def _predict_group(self, group):
+        """Executa um lote de janelas que usam o mesmo modelo e a mesma faixa de horizonte e entrega os resultados."""
+        self.stats['batches'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(group))
+        try:
+            X = np.stack([window for window, _, _, _ in group])
+            horizon = max(horizon for _, horizon, _, _ in group)
+            results = await self._loop.run_in_executor(self.executor, self.predict_fn, X, horizon, group[0][2])
+        except Exception as e:
+            logging.error(f'Erro ao executar lote de {len(group)} predições: {e}')
+            for _, _, _, future in group:
+                if not future.done():
+                    future.set_exception(RuntimeError(f'Erro ao realizar a predição em lote: {e}'))
+            return
+
+        for (_, horizon, _, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result[:horizon])
+
+    async def stop(self):
+        """Encerra o worker, concluindo os lotes em execução e falhando as requisições que ainda estiverem na fila."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            await asyncio.gather(*self._groups, return_exceptions=True)
+            while not self._queue.empty():
+                self._fail([self._queue.get_nowait()])
+            self._worker = None
+
+
+_BATCHER = None
+
+
+def get_prediction_batcher():
+    """Retorna o batcher de predição compartilhado pela API, criando-o no primeiro uso."""
+    global _BATCHER
+    if _BATCHER is None:
+        _BATCHER = PredictionBatcher(forecast_scaled_windows)
+        logging.info(f'Batcher de predição criado (lote máximo: {_BATCHER.max_batch_size}, espera: {MAX_WAIT_MS} ms, '
+                     f'lotes simultâneos: {_BATCHER.max_concurrent_groups}).')
+    return _BATCHER
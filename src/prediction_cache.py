@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+# Configuração do cache de resultados de predição (variáveis de ambiente)
+CACHE_ENABLED = os.getenv('PREDICTION_CACHE_ENABLED', '1') != '0'
+MAX_ENTRIES = int(os.getenv('PREDICTION_CACHE_MAX_ENTRIES', '10000'))
+TTL_SECONDS = float(os.getenv('PREDICTION_CACHE_TTL_SECONDS', '86400')) # Janelas que terminam em pregões já encerrados
+LIVE_TTL_SECONDS = float(os.getenv('PREDICTION_CACHE_LIVE_TTL_SECONDS', '60')) # Janelas que incluem o pregão de hoje (ainda mudam)
+CACHE_DB = os.getenv('PREDICTION_CACHE_DB') # Arquivo SQLite compartilhado entre processos (opcional)
+
+
+def effective_last_bar(end_date, today=None):
+    """Retorna o último pregão possível em um download que termina em `end_date` (exclusivo).
+
+    Duas datas de fim com o mesmo último pregão produzem a mesma janela de entrada. Feriados não são
+    considerados: no pior caso, duas chaves diferentes guardam o mesmo resultado.
+
+    Args:
+        end_date (str): Data de fim do download (YYYY-MM-DD), exclusiva.
+        today (datetime.date, optional): Data de hoje. Padrão é `date.today()`.
+
+    Returns:
+        tuple: (data do último pregão em ISO, True se for o pregão de hoje, cujo fechamento ainda pode mudar).
+    """
+    today = today or date.today()
+    last_bar = min(datetime.strptime(end_date, '%Y-%m-%d').date(), today + timedelta(days=1)) - timedelta(days=1)
+    while last_bar.weekday() >= 5: # Sábado ou domingo
+        last_bar -= timedelta(days=1)
+    return last_bar.isoformat(), last_bar >= today
+
+
+def prediction_key(symbol, end_date, time_steps, entry, horizon=1):
+    """Monta a chave do cache: (símbolo, último pregão, time_steps, modelo/versão, horizonte).
+
+    Args:
+        symbol (str): Símbolo da ação.
+        end_date (str): Data de fim do download (YYYY-MM-DD).
+        time_steps (int): Tamanho da janela de entrada.
+        entry (ModelEntry): Modelo usado; sua versão identifica também o scaler.
+        horizon (int, optional): Número de dias previstos. Padrão é 1.
+
+    Returns:
+        tuple: (chave, live), onde `live` indica que a janela inclui o pregão de hoje.
+    """
+    last_bar, live = effective_last_bar(end_date)
+    return (symbol.upper(), last_bar, int(time_steps), f'{entry.symbol}@{entry.version}', int(horizon)), live
+
+
+class PredictionCache:
+    """Cache de resultados de predição com TTL, limite de entradas (LRU) e de-duplicação de misses.
+
+    As entradas ficam em memória e, se `db_path` for informado, também em um arquivo SQLite local,
+    compartilhado entre os processos da API.
+
+    Args:
+        max_entries (int, optional): Número máximo de entradas em memória.
+        ttl_seconds (float, optional): Validade de resultados de janelas encerradas.
+        live_ttl_seconds (float, optional): Validade de resultados de janelas que incluem o pregão de hoje.
+        db_path (str, optional): Arquivo SQLite compartilhado. Padrão é nenhum (só memória).
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, live_ttl_seconds=None, db_path=None):
+        self.max_entries = max_entries or MAX_ENTRIES
+        self.ttl_seconds = TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.live_ttl_seconds = LIVE_TTL_SECONDS if live_ttl_seconds is None else live_ttl_seconds
+        self._entries = OrderedDict() # chave -> (expira_em, resultado), do menos para o mais recente
+        self._inflight = {} # chave -> asyncio.Future da predição em andamento
+        self._lock = threading.Lock()
+        self._db = self._open_db(db_path) if db_path else None
+        self.stats = {'hits': 0, 'store_hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def _open_db(db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        db.execute('PRAGMA journal_mode=WAL') # Leitores não bloqueiam o escritor entre processos
+        db.execute('CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, model TEXT, value TEXT, expires_at REAL)')
+        return db
+
+    @staticmethod
+    def _db_key(key):
+        return '|'.join(str(part) for part in key)
+
+    def get(self, key):
+        """Retorna o resultado em cache para a chave, ou None se não existir ou tiver expirado."""
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                if cached[0] > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return cached[1]
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute('SELECT value, expires_at FROM predictions WHERE key = ? AND expires_at > ?',
+                                       (self._db_key(key), now)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._store(key, value, row[1])
+                    self.stats['store_hits'] += 1
+                    return value
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, value, live=False):
+        """Guarda o resultado de uma predição.
+
+        Args:
+            key (tuple): Chave de `prediction_key`.
+            value (dict): Resultado JSON-serializável (ex: o de `format_forecast`).
+            live (bool, optional): Se True, usa a validade curta de janelas que incluem o pregão de hoje.
+        """
+        expires_at = time.time() + (self.live_ttl_seconds if live else self.ttl_seconds)
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)',
+                                 (self._db_key(key), key[3], json.dumps(value), expires_at))
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    async def _call(self, fn, *args):
+        """Executa uma operação do cache; com o arquivo SQLite, fora do event loop (a leitura e a escrita bloqueiam)."""
+        if self._db is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _compute_and_store(self, key, compute, live):
+        value = await compute()
+        await self._call(self.put, key, value, live)
+        return value
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception() # Marca a exceção como consumida quando todos os waiters foram cancelados
+
+    async def get_or_compute(self, key, compute, live=False):
+        """Retorna o resultado em cache ou o calcula uma única vez, mesmo com misses concorrentes.
+
+        O cálculo roda em uma task própria, e todas as requisições com a mesma chave, inclusive a que
+        o iniciou, aguardam essa task por meio de `asyncio.shield`: o cancelamento de uma delas (ex:
+        um cliente que desconectou) não cancela o cálculo nem falha as demais. Erros não são
+        guardados: são propagados para todas as requisições que aguardavam.
+
+        Args:
+            key (tuple): Chave de `prediction_key`.
+            compute (callable): Função assíncrona sem argumentos que calcula o resultado.
+            live (bool, optional): Ver `put`.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            cached = await self._call(self.get, key)
+            if cached is not None:
+                return cached
+            task = self._inflight.get(key) # Outra requisição pode ter iniciado o cálculo durante a leitura
+            if task is None:
+                task = asyncio.ensure_future(self._compute_and_store(key, compute, live))
+                self._inflight[key] = task
+                task.add_done_callback(lambda done: self._finish(key, done))
+                return await asyncio.shield(task)
+        self.stats['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    def invalidate(self, model_symbol=None):
+        """Descarta os resultados em cache.
+
+        Args:
+            model_symbol (str, optional): Descarta só os resultados do modelo deste símbolo (`ModelEntry.symbol`,
+                                          'default' para o modelo padrão). Padrão é descartar tudo.
+        """
+        prefix = None if model_symbol is None else f'{model_symbol}@'
+        with self._lock:
+            if prefix is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[3].startswith(prefix)]:
+                    del self._entries[key]
+            if self._db is not None:
+                if prefix is None:
+                    self._db.execute('DELETE FROM predictions')
+                else:
+                    self._db.execute('DELETE FROM predictions WHERE model LIKE ?', (prefix + '%',))
+            self.stats['invalidations'] += 1
+        logging.info(f'Cache de predições invalidado ({model_symbol or "todos os modelos"}).')
+
+    def get_stats(self):
+        """Retorna os contadores do cache, o número de entradas e a taxa de acerto."""
+        with self._lock:
+            hits = self.stats['hits'] + self.stats['store_hits'] + self.stats['coalesced']
+            lookups = hits + self.stats['misses']
+            return dict(self.stats, entries=len(self._entries), inflight=len(self._inflight),
+                        hit_rate=hits / lookups if lookups else 0.0)
+
+
+_PREDICTION_CACHE = None
+
+
+def get_prediction_cache():
+    """Retorna o cache de predições do processo, criando-o na primeira chamada (None se desligado)."""
+    global _PREDICTION_CACHE
+    if not CACHE_ENABLED:
+        return None
+    if _PREDICTION_CACHE is None:
+        _PREDICTION_CACHE = PredictionCache(db_path=CACHE_DB)
+    return _PREDICTION_CACHE
+
+
+def invalidate_predictions(model_symbol=None):
+    """Descarta os resultados em cache de um modelo (ou de todos), se o cache já estiver em uso."""
+    if _PREDICTION_CACHE is not None:
+        _PREDICTION_CACHE.invalidate(model_symbol)
@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from src.logger import log_request
+
+# Diretório padrão do cache local de históricos (pode ser alterado pela variável de ambiente PRICE_CACHE_DIR)
+CACHE_DIR = os.getenv('PRICE_CACHE_DIR', os.path.join('data', 'cache'))
+
+# Formato em disco: um array estruturado por símbolo (memory-mapped na leitura)
+_RECORD_DTYPE = np.dtype([('date', 'datetime64[D]'), ('close', 'float64')])
+
+_STATS_LOCK = threading.Lock()
+_STATS = {
+    'hits': 0,            # Requisições atendidas inteiramente pelo cache
+    'partial_hits': 0,    # Requisições que usaram o cache e buscaram apenas as lacunas
+    'misses': 0,          # Requisições sem nenhum dado em cache para o símbolo
+    'network_fetches': 0, # Chamadas à função de download (rede ou substituta)
+    'rows_fetched': 0,    # Linhas obtidas pela função de download
+    'rows_served': 0,     # Linhas devolvidas aos chamadores
+}
+
+_SYMBOL_LOCKS = {}
+_SYMBOL_LOCKS_GUARD = threading.Lock()
+
+
+def _symbol_lock(symbol):
+    """Retorna o lock exclusivo do símbolo, criando-o se necessário."""
+    with _SYMBOL_LOCKS_GUARD:
+        lock = _SYMBOL_LOCKS.get(symbol)
+        if lock is None:
+            lock = _SYMBOL_LOCKS[symbol] = threading.Lock()
+        return lock
+
+
+def _increment(**counters):
+    with _STATS_LOCK:
+        for name, value in counters.items():
+            _STATS[name] += value
+
+
+def _cache_paths(symbol, cache_dir=None):
+    """Retorna os caminhos (dados, metadados) do símbolo, com o nome sanitizado para o sistema de arquivos."""
+    safe_name = re.sub(r'[^A-Za-z0-9._-]', '_', symbol.upper())
+    base = os.path.join(cache_dir or CACHE_DIR, safe_name)
+    return f'{base}.npy', f'{base}.json'
+
+
+def _to_day(value):
+    import pandas as pd # Importado sob demanda, como em `data_handler`
+    return np.datetime64(pd.to_datetime(value).date(), 'D')
+
+
+def get_cache_stats():
+    """Retorna uma cópia das estatísticas do cache de históricos.
+
+    Returns:
+        dict: Contadores de hits, hits parciais, misses, downloads e linhas servidas,
+              além da taxa de acerto (`hit_rate`).
+    """
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+    total = stats['hits'] + stats['partial_hits'] + stats['misses']
+    stats['hit_rate'] = (stats['hits'] / total) if total else 0.0
+    return stats
+
+
+def reset_cache_stats():
+    """Zera as estatísticas do cache de históricos."""
+    with _STATS_LOCK:
+        for name in _STATS:
+            _STATS[name] = 0
+
+
+def clear_cache(symbol=None, cache_dir=None):
+    """Remove do disco o histórico em cache de um símbolo, ou de todos se `symbol` for None."""
+    directory = cache_dir or CACHE_DIR
+    if symbol is not None:
+        paths = _cache_paths(symbol, cache_dir)
+    elif os.path.isdir(directory):
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(('.npy', '.json'))]
+    else:
+        paths = []
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def read_history(symbol, cache_dir=None):
+    """Lê o histórico em cache de um símbolo, mapeando o arquivo em memória.
+
+    Args:
+        symbol (str): Símbolo da ação.
+        cache_dir (str, optional): Diretório do cache. Padrão é `CACHE_DIR`.
+
+    Returns:
+        tuple: (registros, início_coberto, fim_coberto) onde `registros` é um array estruturado
+               com os campos `date` e `close`, e o intervalo coberto é semiaberto [início, fim).
+               Retorna None se não houver cache válido para o símbolo.
+    """
+    data_path, meta_path = _cache_paths(symbol, cache_dir)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        records = np.load(data_path, mmap_mode='r')
+        if records.dtype != _RECORD_DTYPE or len(records) != meta['rows']:
+            logging.warning(f'Cache de {symbol} inconsistente. Ignorando arquivos em cache.')
+            return None
+        return records, np.datetime64(meta['covered_start'], 'D'), np.datetime64(meta['covered_end'], 'D')
+    except Exception as e:
+        logging.warning(f'Erro ao ler o cache de {symbol}: {e}. Ignorando arquivos em cache.')
+        return None
+
+
+def write_history(symbol, records, covered_start, covered_end, cache_dir=None):
+    """Grava de forma atômica o histórico de um símbolo no cache.
+
+    Os dados são gravados antes dos metadados; como a leitura confere o número de linhas,
+    uma gravação interrompida nunca é lida como cache válido.
+
+    Args:
+        symbol (str): Símbolo da ação.
+        records (numpy.ndarray): Array estruturado (`date`, `close`) ordenado por data.
+        covered_start (numpy.datetime64): Início do intervalo coberto (inclusivo).
+        covered_end (numpy.datetime64): Fim do intervalo coberto (exclusivo).
+        cache_dir (str, optional): Diretório do cache. Padrão é `CACHE_DIR`.
+    """
+    data_path, meta_path = _cache_paths(symbol, cache_dir)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+    tmp_data_path = f'{data_path}.{os.getpid()}.tmp'
+    with open(tmp_data_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(records, dtype=_RECORD_DTYPE))
+    os.replace(tmp_data_path, data_path)
+
+    meta = {
+        'symbol': symbol,
+        'rows': int(len(records)),
+        'covered_start': str(covered_start),
+        'covered_end': str(covered_end),
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    tmp_meta_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta_path, meta_path)
+
+
+def _frame_to_records(data):
+    """Converte um DataFrame com coluna 'Close' em array estruturado, descartando valores ausentes."""
+    import pandas as pd
+    if data is None or data.empty:
+        return np.empty(0, dtype=_RECORD_DTYPE)
+    close = data['Close'].dropna()
+    records = np.empty(len(close), dtype=_RECORD_DTYPE)
+    records['date'] = pd.to_datetime(close.index).values.astype('datetime64[D]')
+    records['close'] = close.values.astype('float64')
+    return records
+
+
+def _records_to_frame(records):
+    """Converte um array estruturado do cache em DataFrame no mesmo formato de `download_stock_data`."""
+    import pandas as pd
+    index = pd.DatetimeIndex(np.asarray(records['date']).astype('datetime64[ns]'), name='Date')
+    return pd.DataFrame({'Close': np.array(records['close'])}, index=index)
+
+
+def _merge_records(cached, fetched):
+    """Une registros em cache e recém-baixados, priorizando os baixados em datas repetidas."""
+    merged = np.concatenate([fetched, np.asarray(cached)])
+    # np.unique devolve as datas ordenadas e o índice da primeira ocorrência (a baixada, se houver)
+    _, first_idx = np.unique(merged['date'], return_index=True)
+    return merged[first_idx]
+
+
+def get_cached_history(symbol, start_date, end_date, fetch_fn, cache_dir=None):
+    """Retorna o histórico de fechamento de `symbol` no intervalo [start_date, end_date),
+    lendo do cache local e baixando apenas as lacunas ainda não cobertas.
+
+    A cobertura do cache é mantida como um único intervalo contíguo: uma requisição fora dele
+    baixa também o trecho entre a requisição e o cache. Barras a partir de hoje são devolvidas,
+    mas não persistidas, pois o fechamento do dia ainda pode mudar. Dias úteis que o provedor não
+    devolveu (lacuna vazia ou final faltando) não entram na cobertura e são buscados de novo.
+
+    Args:
+        symbol (str): Símbolo da ação (ex: "AAPL").
+        start_date (str): Data inicial (YYYY-MM-DD), inclusiva.
+        end_date (str): Data final (YYYY-MM-DD), exclusiva.
+        fetch_fn (callable): Função `fetch_fn(symbol, start_date, end_date)` que baixa o intervalo
+                             pedido e retorna um DataFrame com a coluna 'Close'.
+        cache_dir (str, optional): Diretório do cache. Padrão é `CACHE_DIR`.
+
+    Returns:
+        pandas.DataFrame: DataFrame com a coluna 'Close' indexado por data.
+    """
+    start = _to_day(start_date)
+    end = _to_day(end_date)
+    today = np.datetime64(datetime.today().date(), 'D')
+
+    with _symbol_lock(symbol.upper()):
+        cached = read_history(symbol, cache_dir)
+        if cached is None:
+            cached_records = np.empty(0, dtype=_RECORD_DTYPE)
+            covered_start = covered_end = None
+            gaps = [(start, end)]
+        else:
+            cached_records, covered_start, covered_end = cached
+            gaps = []
+            if start < covered_start:
+                gaps.append((start, covered_start))
+            if end > covered_end:
+                gaps.append((covered_end, end))
+
+        if cached is None:
+            _increment(misses=1)
+        elif gaps:
+            _increment(partial_hits=1)
+        else:
+            _increment(hits=1)
+
+        fetched_parts = []
+        new_start, new_end = covered_start, covered_end
+        for gap_start, gap_end in gaps:
+            log_request('Cache de %s: buscando lacuna %s - %s.', symbol, gap_start, gap_end)
+            fetched = _frame_to_records(fetch_fn(symbol, str(gap_start), str(gap_end)))
+            _increment(network_fetches=1, rows_fetched=len(fetched))
+            fetched_parts.append(fetched)
+
+            persist_end = min(gap_end, today)
+            if persist_end <= gap_start:
+                continue
+            # Só dias sem pregão (fins de semana) podem ficar cobertos sem barras: uma resposta vazia ou
+            # incompleta do provedor não é "memorizada" como ausência de pregões e volta a ser buscada
+            if len(fetched) == 0:
+                if np.busday_count(gap_start, persist_end) > 0:
+                    logging.warning(f'Cache de {symbol}: lacuna {gap_start} - {gap_end} retornou vazia. Cobertura não será ampliada.')
+                    continue
+            elif covered_end is None or gap_start >= covered_end:
+                confirmed_end = fetched['date'].max() + np.timedelta64(1, 'D')
+                if np.busday_count(confirmed_end, persist_end) > 0:
+                    log_request('Cache de %s: lacuna %s - %s sem barras após %s. Cobertura limitada.', symbol, gap_start, gap_end, confirmed_end)
+                    persist_end = confirmed_end
+            # Só amplia a cobertura se o trecho baixado encosta no intervalo já coberto
+            if new_start is None or (gap_start <= new_end and persist_end >= new_start):
+                new_start = gap_start if new_start is None else min(new_start, gap_start)
+                new_end = persist_end if new_end is None else max(new_end, persist_end)
+
+        if fetched_parts:
+            fetched_all = np.concatenate(fetched_parts)
+            merged = _merge_records(cached_records, fetched_all)
+            if new_start is not None:
+                persisted = merged[(merged['date'] >= new_start) & (merged['date'] < new_end)]
+                if (new_start, new_end) != (covered_start, covered_end) or len(persisted) != len(cached_records):
+                    write_history(symbol, persisted, new_start, new_end, cache_dir)
+        else:
+            merged = cached_records
+
+        dates = merged['date']
+        result = merged[(dates >= start) & (dates < end)]
+        _increment(rows_served=len(result))
+        return _records_to_frame(result)
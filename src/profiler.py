@@ -0,0 +1,122 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from src import metrics
+
+# Opt-in: requisições mais lentas que isso (em ms) têm o perfil de amostragem gravado. Vazio ou 0 desliga.
+SLOW_REQUEST_MS = float(os.getenv('PROFILE_SLOW_REQUESTS_MS', '0') or 0)
+SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join('logs', 'profiles'))
+MAX_STACK_DEPTH = 64
+MAX_SAMPLES = 100_000 # Amostras guardadas de todas as threads (as mais antigas são descartadas)
+
+
+def _collapse(frame):
+    """Pilha da thread no formato 'colapsado' (raiz;...;folha), lido por flamegraph.pl e speedscope."""
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+class SlowRequestProfiler:
+    """Profiler de amostragem para requisições lentas.
+
+    Enquanto houver requisições em andamento, uma thread registra a pilha de todas as threads do
+    processo a cada `interval_ms` (event loop, threadpool, fetcher, ...). Quando uma requisição
+    termina acima de `threshold_ms`, as amostras do seu intervalo são agregadas e gravadas em um
+    arquivo no formato colapsado; as demais são apenas descartadas. Sem requisições em andamento,
+    a thread fica parada.
+
+    Args:
+        threshold_ms (float): Duração a partir da qual a requisição é considerada lenta.
+        interval_ms (float, optional): Intervalo entre amostras. Padrão é `SAMPLE_INTERVAL_MS`.
+        output_dir (str, optional): Diretório dos perfis gravados. Padrão é `PROFILE_DIR`.
+    """
+
+    def __init__(self, threshold_ms, interval_ms=None, output_dir=None):
+        self.threshold_ms = threshold_ms
+        self.interval = (interval_ms or SAMPLE_INTERVAL_MS) / 1000
+        self.output_dir = output_dir or PROFILE_DIR
+        self._samples = deque(maxlen=MAX_SAMPLES) # (instante, nome da thread, pilha colapsada)
+        self._active = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._condition:
+                while self._active == 0:
+                    self._condition.wait()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._samples.append((now, names.get(thread_id, str(thread_id)), _collapse(frame)))
+            time.sleep(self.interval)
+
+    def begin(self):
+        """Marca o início de uma requisição e retorna o instante usado em `end`."""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+            self._active += 1
+            self._condition.notify()
+        return time.perf_counter()
+
+    def end(self, started, label):
+        """Marca o fim de uma requisição; se ela foi lenta, grava o seu perfil.
+
+        Args:
+            started (float): Valor retornado por `begin`.
+            label (str): Identificação da requisição no nome do arquivo (ex: 'GET /predict').
+
+        Returns:
+            str: Caminho do perfil gravado, ou None se a requisição não foi lenta.
+        """
+        finished = time.perf_counter()
+        with self._condition:
+            self._active -= 1
+        elapsed_ms = (finished - started) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return None
+
+        stacks = Counter(f'{thread};{stack}' for moment, thread, stack in list(self._samples) if started <= moment <= finished)
+        safe_label = re.sub(r'[^A-Za-z0-9._-]+', '_', label).strip('_')
+        path = os.path.join(self.output_dir, f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{safe_label}_{elapsed_ms:.0f}ms.txt")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+        except OSError as e:
+            logging.error(f'Erro ao gravar o perfil da requisição lenta {label}: {e}')
+            return None
+        metrics.increment('slow_requests_profiled_total')
+        logging.warning(f'Requisição lenta: {label} levou {elapsed_ms:.0f} ms. Perfil ({sum(stacks.values())} amostras) em {path}.')
+        return path
+
+
+_PROFILER = None
+_PROFILER_LOCK = threading.Lock()
+
+
+def get_slow_request_profiler():
+    """Retorna o profiler de requisições lentas do processo, ou None se PROFILE_SLOW_REQUESTS_MS não estiver configurado."""
+    global _PROFILER
+    if SLOW_REQUEST_MS <= 0:
+        return None
+    with _PROFILER_LOCK:
+        if _PROFILER is None:
+            _PROFILER = SlowRequestProfiler(SLOW_REQUEST_MS)
+        return _PROFILER
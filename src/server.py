@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import time
+
+from src.logger import configure_logging, stop_logging
+
+# Número de workers. Padrão: um por núcleo
+WORKERS = int(os.getenv('SERVER_WORKERS', '0')) or os.cpu_count() or 1
+
+# Tempo que um worker substituído ou encerrado tem para concluir as requisições em andamento
+GRACEFUL_TIMEOUT = float(os.getenv('SERVER_GRACEFUL_TIMEOUT', '30'))
+
+# Tempo em que um worker substituído deixa de aceitar conexões e fecha as abertas (`Connection: close`)
+# antes do desligamento gracioso. Deve passar do keep-alive do uvicorn (5 s), para que nenhum cliente
+# reaproveite uma conexão ociosa no instante em que ela é fechada
+DRAIN_SECONDS = float(os.getenv('SERVER_DRAIN_SECONDS', '6'))
+
+# Tempo máximo para um worker novo ficar pronto
+READY_TIMEOUT = float(os.getenv('SERVER_READY_TIMEOUT', '120'))
+
+# Intervalo (s) da verificação de novos artefatos de modelo para recarga automática. 0 desliga (recarga só por SIGHUP)
+WATCH_INTERVAL = float(os.getenv('SERVER_WATCH_INTERVAL', '0'))
+
+# Se '1', os modelos publicados no registro também são carregados pelo processo principal
+PRELOAD_REGISTRY = os.getenv('SERVER_PRELOAD_REGISTRY', '0') == '1'
+
+MODEL_DIR = 'models'
+
+
+class _DrainingApp:
+    """Envolve a aplicação ASGI e, durante a drenagem, responde com `Connection: close`."""
+
+    def __init__(self, app):
+        self.app = app
+        self.draining = False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        async def send_closing(message):
+            if self.draining and message['type'] == 'http.response.start':
+                message = dict(message, headers=list(message.get('headers', [])) + [(b'connection', b'close')])
+            await send(message)
+
+        return await self.app(scope, receive, send_closing)
+
+
+def _run_worker(listen_socket, ready_fd, graceful_timeout):
+    """Executa a API em um worker criado por fork, avisando o processo principal quando estiver pronta.
+
+    SIGUSR1 inicia a drenagem (o worker para de aceitar conexões e fecha as abertas na próxima
+    resposta) e SIGTERM, o desligamento gracioso do uvicorn.
+    """
+    import uvicorn
+    from app import app
+
+    signal.signal(signal.SIGHUP, signal.SIG_IGN) # A recarga é coordenada pelo processo principal
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL) # Handlers herdados do processo principal (o uvicorn instala os seus)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    draining_app = _DrainingApp(app)
+    config = uvicorn.Config(draining_app, lifespan='on', log_config=None, timeout_graceful_shutdown=graceful_timeout)
+    server = uvicorn.Server(config)
+
+    def drain():
+        draining_app.draining = True
+        for listener in server.servers:
+            listener.close() # Para de aceitar conexões; as já abertas continuam sendo atendidas
+        logging.info(f'Worker {os.getpid()} drenando conexões.')
+
+    async def serve():
+        task = asyncio.create_task(server.serve(sockets=[listen_socket]))
+        while not server.started and not task.done():
+            await asyncio.sleep(0.05)
+        if server.started:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, drain)
+        os.write(ready_fd, b'1' if server.started else b'0')
+        os.close(ready_fd)
+        await task
+
+    asyncio.run(serve())
+
+
+class PreforkServer:
+    """Servidor com vários workers que compartilham o modelo carregado pelo processo principal.
+
+    O processo principal abre o socket, carrega e aquece o modelo (e, opcionalmente, os modelos do
+    registro) uma única vez e cria os workers por fork. Os pesos ficam em páginas de memória
+    compartilhadas (copy-on-write) entre todos os workers: com o motor NumPy, a inferência só lê os
+    pesos, e `gc.freeze` evita que a coleta de lixo escreva nos objetos herdados. A memória total
+    cresce com o que cada worker aloca por requisição, não com o tamanho do modelo.
+
+    A recarga (SIGHUP, ou novos artefatos com `watch_interval`) é feita sem derrubar requisições: o
+    processo principal carrega os modelos novos, cria um worker novo de cada vez e, quando ele fica
+    pronto, drena um worker antigo: ele para de aceitar conexões e fecha as abertas na próxima
+    resposta (`Connection: close`); depois de `DRAIN_SECONDS`, recebe o desligamento gracioso, que
+    espera as requisições em andamento. Como todos aceitam conexões no mesmo socket, as novas
+    conexões vão para os workers ativos. Se a carga ou um worker novo falhar, os antigos seguem
+    servindo. Workers que morrem inesperadamente são recriados.
+
+    O pré-carregamento exige o motor NumPy (INFERENCE_BACKEND=numpy): o runtime do TensorFlow não
+    pode ser herdado por fork. Com o Keras, cada worker carrega o seu modelo no startup, como em
+    `uvicorn --workers`, mantendo a supervisão e a recarga sem derrubar requisições.
+
+    Args:
+        host (str, optional): Endereço de escuta. Padrão é '0.0.0.0'.
+        port (int, optional): Porta. Padrão é 8000.
+        workers (int, optional): Número de workers. Padrão é `WORKERS`.
+        preload (bool, optional): Carrega o modelo no processo principal. Padrão: True com o motor NumPy.
+        preload_registry (bool, optional): Carrega também os modelos publicados no registro. Padrão é `PRELOAD_REGISTRY`.
+        graceful_timeout (float, optional): Prazo do desligamento gracioso. Padrão é `GRACEFUL_TIMEOUT`.
+        watch_interval (float, optional): Intervalo da verificação de novos artefatos. Padrão é `WATCH_INTERVAL`.
+    """
+
+    def __init__(self, host='0.0.0.0', port=8000, workers=None, preload=None, preload_registry=None,
+                 graceful_timeout=None, watch_interval=None):
+        from src.model_registry import INFERENCE_BACKEND
+
+        self.host = host
+        self.port = port
+        self.workers = workers or WORKERS
+        self.preload = INFERENCE_BACKEND == 'numpy' if preload is None else preload
+        if self.preload and INFERENCE_BACKEND != 'numpy':
+            logging.warning('Pré-carregamento desligado: o modelo Keras não pode ser compartilhado por fork. Use INFERENCE_BACKEND=numpy.')
+            self.preload = False
+        self.preload_registry = PRELOAD_REGISTRY if preload_registry is None else preload_registry
+        self.graceful_timeout = GRACEFUL_TIMEOUT if graceful_timeout is None else graceful_timeout
+        self.watch_interval = WATCH_INTERVAL if watch_interval is None else watch_interval
+        self._socket = None
+        self._children = set() # pids dos workers ativos
+        self._retiring = {} # pid -> instante do SIGTERM (workers drenando) ou None (já em desligamento)
+        self._stopping = False
+        self._reload_requested = False
+        self._signature = None
+
+    def _bind(self):
+        # Com o protocolo explícito, o asyncio liga TCP_NODELAY nas conexões aceitas; sem ele (proto 0), as
+        # respostas em duas escritas (cabeçalhos e corpo) esperam o ACK atrasado do cliente (~40 ms) no keep-alive
+        listen_socket = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.bind((self.host, self.port))
+        listen_socket.listen(2048)
+        listen_socket.set_inheritable(True)
+        return listen_socket
+
+    def _load_models(self):
+        """Carrega os modelos no processo principal, para que os workers criados depois os herdem."""
+        if not self.preload:
+            return
+        import app as app_module
+        from src.model_registry import get_model_registry, list_symbols
+
+        gc.unfreeze()
+        app_module.preload()
+        if self.preload_registry:
+            registry = get_model_registry()
+            registry.invalidate()
+            for symbol in list_symbols(registry.registry_dir):
+                registry.get(symbol)
+            logging.info(f"Modelos do registro pré-carregados: {registry.get_stats()['entries']} ({registry.resident_bytes / 1024:.0f} KB).")
+        gc.collect()
+        gc.freeze() # Objetos herdados fora da coleta de lixo: os workers não escrevem nas páginas compartilhadas
+
+    def _models_signature(self):
+        """Data de modificação dos artefatos servidos; muda quando um modelo novo é salvo ou publicado."""
+        from src.model_registry import list_symbols, LATEST_FILENAME, REGISTRY_DIR
+
+        paths = [os.path.join(MODEL_DIR, name) for name in sorted(os.listdir(MODEL_DIR))
+                 if name.endswith(('.keras', '.npz', '.pkl'))] if os.path.isdir(MODEL_DIR) else []
+        if self.preload_registry:
+            paths += [os.path.join(REGISTRY_DIR, symbol, LATEST_FILENAME) for symbol in list_symbols()]
+        signature = []
+        for path in paths:
+            try:
+                signature.append((path, os.stat(path).st_mtime_ns))
+            except FileNotFoundError:
+                continue
+        return tuple(signature)
+
+    def _spawn(self):
+        """Cria um worker e espera que ele fique pronto. Retorna o pid, ou None se ele não ficar pronto."""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                _run_worker(self._socket, write_fd, self.graceful_timeout)
+            except BaseException as e:
+                logging.error(f'Erro no worker {os.getpid()}: {e}')
+                code = 1
+            finally:
+                stop_logging() # os._exit não executa os handlers de saída: grava os registros pendentes antes
+                os._exit(code)
+
+        os.close(write_fd)
+        self._children.add(pid)
+        try:
+            readable, _, _ = select.select([read_fd], [], [], READY_TIMEOUT)
+            ready = bool(readable) and os.read(read_fd, 1) == b'1'
+        finally:
+            os.close(read_fd)
+        if not ready:
+            logging.error(f'O worker {pid} não ficou pronto em {READY_TIMEOUT:.0f} s.')
+            self._retire(pid, force=True)
+            return None
+        logging.info(f'Worker {pid} pronto.')
+        return pid
+
+    def _retire(self, pid, force=False, drain=False):
+        """Encerra um worker: drenagem seguida de SIGTERM (ver `_advance_retiring`), SIGTERM ou SIGKILL."""
+        self._children.discard(pid)
+        if drain:
+            sig, self._retiring[pid] = signal.SIGUSR1, time.monotonic() + DRAIN_SECONDS
+        else:
+            sig, self._retiring[pid] = signal.SIGKILL if force else signal.SIGTERM, None
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            self._retiring.pop(pid, None)
+
+    def _advance_retiring(self):
+        """Inicia o desligamento gracioso dos workers cuja drenagem terminou."""
+        now = time.monotonic()
+        for pid, terminate_at in list(self._retiring.items()):
+            if terminate_at is not None and now >= terminate_at:
+                self._retire(pid)
+
+    def _reap(self):
+        """Recolhe os workers encerrados e recria os que morreram inesperadamente."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self._retiring:
+                del self._retiring[pid]
+                continue
+            if pid in self._children:
+                self._children.discard(pid)
+                if not self._stopping:
+                    logging.warning(f'Worker {pid} terminou inesperadamente (status {status}); criando outro.')
+                    self._spawn()
+
+    def reload(self):
+        """Recarrega os modelos e substitui os workers um a um, sem derrubar requisições em andamento.
+
+        Returns:
+            bool: True se todos os workers foram substituídos.
+        """
+        logging.info('Recarregando os modelos e substituindo os workers.')
+        try:
+            self._load_models()
+        except RuntimeError as e:
+            logging.error(f'Erro ao recarregar os modelos; os workers atuais continuam servindo: {e}')
+            return False
+        self._signature = self._models_signature()
+        for old_pid in list(self._children):
+            if self._spawn() is None:
+                logging.error('Recarga interrompida: o worker novo não ficou pronto; os workers restantes continuam servindo.')
+                return False
+            self._retire(old_pid, drain=True)
+        logging.info(f'Recarga concluída: {len(self._children)} workers com os modelos novos.')
+        return True
+
+    def _request_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _shutdown(self):
+        """Encerra todos os workers com desligamento gracioso (SIGKILL após o prazo)."""
+        logging.info(f'Encerrando {len(self._children)} workers.')
+        for pid in list(self._children) + list(self._retiring):
+            self._retire(pid)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._retiring and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._retiring):
+            self._retire(pid, force=True)
+        self._reap()
+        self._socket.close()
+
+    def run(self):
+        """Abre o socket, carrega os modelos, cria os workers e os supervisiona até SIGTERM/SIGINT.
+
+        Raises:
+            RuntimeError: Se o modelo não puder ser carregado ou o primeiro worker não ficar pronto.
+        """
+        self._socket = self._bind()
+        logging.info(f'Servindo em {self.host}:{self.port} com {self.workers} workers (modelo pré-carregado: {self.preload}).')
+        self._load_models()
+        self._signature = self._models_signature()
+        for _ in range(self.workers):
+            if self._spawn() is None and not self._children:
+                self._socket.close()
+                raise RuntimeError('O primeiro worker não ficou pronto.')
+
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        next_check = time.monotonic() + self.watch_interval
+        while not self._stopping:
+            self._reap()
+            self._advance_retiring()
+            if self._reload_requested:
+                self._reload_requested = False
+                self.reload()
+            elif self.watch_interval and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.watch_interval
+                if self._models_signature() != self._signature:
+                    self.reload()
+            time.sleep(0.2)
+        self._shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a API com vários workers que compartilham o modelo pré-carregado.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-preload', action='store_true', help='Cada worker carrega o seu modelo no startup.')
+    parser.add_argument('--preload-registry', action='store_true', help='Pré-carrega também os modelos publicados no registro.')
+    parser.add_argument('--watch-interval', type=float, default=None, help='Recarrega automaticamente quando os artefatos mudam.')
+    args = parser.parse_args()
+
+    configure_logging('server')
+    PreforkServer(args.host, args.port, args.workers, preload=False if args.no_preload else None,
+                  preload_registry=args.preload_registry or None, watch_interval=args.watch_interval).run()
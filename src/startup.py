@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Marco zero do relatório de inicialização: a importação deste módulo (o primeiro import do app.py)
+STARTED_AT = time.perf_counter()
+
+_LOCK = threading.Lock()
+_PHASES = {} # fase -> duração em segundos, na ordem em que foram executadas
+_STATE = {'ready': False, 'error': None, 'ready_after_seconds': None}
+
+
+@contextmanager
+def startup_phase(name):
+    """Mede a duração de uma fase da inicialização (importação, carga de modelo, aquecimento, ...).
+
+    Args:
+        name (str): Nome da fase no relatório (ex: 'import:routes', 'load:model').
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _LOCK:
+            _PHASES[name] = elapsed
+        logging.info(f'Inicialização: fase {name} concluída em {elapsed:.3f} s.')
+
+
+def mark_ready():
+    """Marca a aplicação como pronta para receber requisições."""
+    with _LOCK:
+        _STATE['ready'] = True
+        _STATE['error'] = None
+        _STATE['ready_after_seconds'] = time.perf_counter() - STARTED_AT
+    logging.info(f"Inicialização concluída em {_STATE['ready_after_seconds']:.3f} s.")
+
+
+def mark_failed(error):
+    """Registra a falha da inicialização; a aplicação permanece não pronta."""
+    with _LOCK:
+        _STATE['ready'] = False
+        _STATE['error'] = str(error)
+
+
+def is_ready():
+    return _STATE['ready']
+
+
+def get_startup_report():
+    """Retorna o relatório de inicialização.
+
+    Returns:
+        dict: Estado de prontidão, erro (se houver), duração de cada fase e o tempo total até a
+              aplicação ficar pronta, contado a partir da importação deste módulo.
+    """
+    with _LOCK:
+        return {
+            'ready': _STATE['ready'],
+            'error': _STATE['error'],
+            'ready_after_seconds': _STATE['ready_after_seconds'],
+            'phases': dict(_PHASES),
+        }
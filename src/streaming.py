@@ -0,0 +1,414 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.data_handler import download_stock_data
+from src.metrics import increment, timed
+from src.model_predict import format_forecast, resolve_model
+from src.numpy_lstm import NumpyLSTMModel
+
+# A cada quantos pregões o estado de um símbolo é recalculado do zero sobre a janela mais recente
+# (0 desliga). Mantém o estado no regime em que o modelo foi treinado (janelas de TIME_STEPS pregões
+# a partir do estado zero) com custo amortizado de um passo extra por pregão.
+RESYNC_BARS = int(os.getenv('STREAMING_RESYNC_BARS', '60'))
+
+# Eventos pendentes por cliente conectado; um cliente lento perde os mais antigos
+LISTENER_QUEUE_SIZE = int(os.getenv('STREAMING_QUEUE_SIZE', '1000'))
+
+
+class _SymbolStream:
+    """Estado de um símbolo acompanhado: estado da LSTM, últimos fechamentos e última previsão."""
+
+    __slots__ = ('symbol', 'entry', 'state', 'window', 'position', 'last_date', 'since_resync', 'resync_offset', 'forecast')
+
+    def __init__(self, symbol, entry, closes, last_date, resync_offset):
+        self.symbol = symbol
+        self.entry = entry
+        self.state = None # [(h, c)] de cada camada LSTM, com formato (units,)
+        self.window = np.array(closes, dtype=np.float64) # Buffer circular dos últimos fechamentos (não normalizados)
+        self.position = 0 # Índice do fechamento mais antigo no buffer
+        self.last_date = last_date
+        self.since_resync = 0
+        self.resync_offset = resync_offset # Aplicado no primeiro recálculo (ver `StreamingForecaster._resync`)
+        self.forecast = None
+
+    def push(self, close):
+        self.window[self.position] = close
+        self.position = (self.position + 1) % len(self.window)
+        self.since_resync += 1
+
+    def ordered_window(self):
+        return np.concatenate([self.window[self.position:], self.window[:self.position]])
+
+
+class StreamingForecaster:
+    """Previsões incrementais para uma lista de símbolos acompanhados, um pregão por vez.
+
+    Cada símbolo guarda o estado (h, c) das camadas LSTM depois do último fechamento recebido. Um
+    novo pregão avança esse estado em um único passo (O(1) por pregão, em vez de rodar a janela de
+    `time_steps` pregões de novo), e os símbolos que usam o mesmo modelo avançam juntos, em um único
+    passo vetorizado. Os eventos de previsão são entregues aos clientes conectados (ver `listen`).
+
+    O estado inicial, e o de cada recálculo periódico (ver RESYNC_BARS), vem da janela completa a
+    partir do estado zero: nesses pregões a previsão é a mesma de `predict_price_for_api`. Entre eles
+    o estado carrega também o histórico anterior à janela, e a previsão pode diferir levemente.
+
+    Args:
+        time_steps (int, optional): Tamanho da janela do modelo. Padrão é 60.
+        horizon (int, optional): Número de dias previstos a cada pregão. Padrão é 1.
+        resync_bars (int, optional): Ver RESYNC_BARS.
+    """
+
+    def __init__(self, time_steps=60, horizon=1, resync_bars=None):
+        self.time_steps = time_steps
+        self.horizon = horizon
+        self.resync_bars = RESYNC_BARS if resync_bars is None else resync_bars
+        self._streams = {} # símbolo -> _SymbolStream
+        self._engines = {} # id do modelo -> (modelo, NumpyLSTMModel)
+        self._listeners = set() # (loop, fila, símbolos ou None)
+        self._lock = threading.RLock()
+        self.stats = {'bars': 0, 'steps': 0, 'resyncs': 0, 'stale_bars': 0, 'events': 0, 'dropped_events': 0}
+
+    def _engine(self, entry):
+        """Motor NumPy do modelo (o próprio, ou convertido uma vez a partir do modelo Keras)."""
+        if isinstance(entry.model, NumpyLSTMModel):
+            return entry.model
+        cached = self._engines.get(id(entry.model))
+        if cached is None or cached[0] is not entry.model:
+            cached = self._engines[id(entry.model)] = (entry.model, NumpyLSTMModel.from_keras(entry.model))
+        return cached[1]
+
+    def subscribe(self, symbols, start_date=None, end_date=None, max_workers=8):
+        """Passa a acompanhar os símbolos: baixa a janela inicial, inicializa o estado e publica a primeira previsão.
+
+        Args:
+            symbols (list[str]): Símbolos das ações. Símbolos já acompanhados são reinicializados.
+            start_date (str, optional): Início do download inicial (YYYY-MM-DD). Padrão é o suficiente
+                                        para uma janela completa antes de `end_date`.
+            end_date (str, optional): Fim do download inicial (YYYY-MM-DD). Padrão é hoje.
+            max_workers (int, optional): Downloads simultâneos. Padrão é 8.
+
+        Returns:
+            dict: Evento de previsão por símbolo, ou {'error': str} quando não foi possível acompanhá-lo.
+        """
+        import pandas as pd # Importado sob demanda, como em `data_handler`
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        end = pd.Timestamp(end_date) if end_date else pd.Timestamp.today().normalize() + pd.Timedelta(days=1)
+        end_date = end.strftime('%Y-%m-%d')
+
+        def prepare(symbol):
+            try:
+                entry = resolve_model(symbol)
+                time_steps = entry.time_steps or self.time_steps # Janela com que o modelo foi treinado
+                start = start_date or (end - pd.tseries.offsets.BDay(int(time_steps * 1.5) + 10)).strftime('%Y-%m-%d')
+                data = download_stock_data(symbol, start_date=start, end_date=end_date)
+                if data is None or len(data) < time_steps:
+                    return symbol, None, f'Dados insuficientes para uma sequência de {time_steps} dias.'
+                closes = data['Close'].to_numpy(dtype=np.float64)[-time_steps:]
+                offset = zlib.crc32(symbol.encode()) % self.resync_bars if self.resync_bars else 0 # Espalha os recálculos entre os pregões
+                return symbol, _SymbolStream(symbol, entry, closes, data.index[-1], offset), None
+            except Exception as e:
+                logging.error(f'Erro ao iniciar o acompanhamento de {symbol}: {e}')
+                return symbol, None, str(e)
+
+        results = {}
+        ready = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(symbols) or 1))) as executor:
+            for symbol, stream, error in executor.map(prepare, symbols):
+                if error is not None:
+                    results[symbol] = {'error': error}
+                else:
+                    ready.append(stream)
+
+        with self._lock:
+            for stream in ready:
+                self._streams[stream.symbol] = stream
+            events = self._resync(ready)
+        results.update(events)
+        logging.info(f'Acompanhamento iniciado para {len(ready)} de {len(symbols)} símbolos ({len(self._streams)} no total).')
+        return {symbol: results[symbol] for symbol in symbols}
+
+    def unsubscribe(self, symbols):
+        """Deixa de acompanhar os símbolos. Retorna os que estavam sendo acompanhados."""
+        with self._lock:
+            return [symbol.upper() for symbol in symbols if self._streams.pop(symbol.upper(), None) is not None]
+
+    def push_bars(self, bars):
+        """Recebe novos pregões e atualiza as previsões dos símbolos.
+
+        Os pregões de cada símbolo são aplicados em ordem de data; pregões com data igual ou anterior à
+        do último já recebido são ignorados. Em cada rodada, todos os símbolos que usam o mesmo modelo
+        avançam juntos em um único passo vetorizado.
+
+        Args:
+            bars (list[tuple]): Pregões como (símbolo, data, fechamento).
+
+        Returns:
+            dict: Último evento de previsão por símbolo atualizado, ou {'error': str} para símbolos não acompanhados.
+        """
+        import pandas as pd
+        results = {}
+        pending = {} # símbolo -> [(data, fechamento)] em ordem
+        with self._lock:
+            tracked = {symbol.upper() for symbol, _, _ in bars} & self._streams.keys()
+        # Fora do lock: carregar um modelo do registro lê o disco e não deve bloquear os demais símbolos
+        entries = {symbol: resolve_model(symbol) for symbol in tracked}
+        with self._lock:
+            for symbol, bar_date, close in bars:
+                symbol = symbol.upper()
+                if symbol not in self._streams:
+                    results[symbol] = {'error': 'Símbolo não acompanhado. Inscreva-o antes de enviar pregões.'}
+                    continue
+                pending.setdefault(symbol, []).append((pd.Timestamp(bar_date), float(close)))
+            for symbol_bars in pending.values():
+                symbol_bars.sort(key=lambda bar: bar[0])
+
+            round_index = 0
+            while True:
+                # Uma rodada aplica o próximo pregão de cada símbolo: O(1) por símbolo
+                step_streams, resync_streams = [], []
+                for symbol, symbol_bars in pending.items():
+                    if round_index >= len(symbol_bars):
+                        continue
+                    stream = self._streams[symbol]
+                    bar_date, close = symbol_bars[round_index]
+                    if bar_date <= stream.last_date:
+                        self.stats['stale_bars'] += 1
+                        continue
+                    entry = entries.get(symbol, stream.entry) # Inscrito durante a resolução: mantém o modelo da inscrição
+                    if (entry.time_steps or self.time_steps) != len(stream.window):
+                        results[symbol] = {'error': 'O novo modelo do símbolo usa outra janela. Inscreva-o novamente.'}
+                        continue
+                    stream.push(close)
+                    stream.last_date = bar_date
+                    self.stats['bars'] += 1
+                    if entry is not stream.entry or (self.resync_bars and stream.since_resync >= self.resync_bars):
+                        stream.entry = entry # Modelo novo: o estado anterior não vale para ele
+                        resync_streams.append(stream)
+                    else:
+                        step_streams.append(stream)
+                if not step_streams and not resync_streams:
+                    if all(round_index >= len(symbol_bars) for symbol_bars in pending.values()):
+                        break
+                    round_index += 1
+                    continue
+                results.update(self._step(step_streams))
+                results.update(self._resync(resync_streams))
+                round_index += 1
+        return results
+
+    def refresh(self, end_date=None, max_workers=8):
+        """Baixa os pregões posteriores ao último recebido de cada símbolo e os aplica com `push_bars`.
+
+        Útil para manter a lista atualizada sem uma fonte externa de pregões (ex: chamada periódica).
+
+        Args:
+            end_date (str, optional): Fim do download (YYYY-MM-DD). Padrão é hoje.
+            max_workers (int, optional): Downloads simultâneos. Padrão é 8.
+        """
+        import pandas as pd
+        with self._lock:
+            last_dates = {symbol: stream.last_date for symbol, stream in self._streams.items()}
+        end_date = end_date or (pd.Timestamp.today().normalize() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+        def fetch(item):
+            symbol, last_date = item
+            start = (last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            try:
+                data = download_stock_data(symbol, start_date=start, end_date=end_date)
+            except Exception as e:
+                logging.error(f'Erro ao baixar novos pregões de {symbol}: {e}')
+                return []
+            if data is None or data.empty:
+                return []
+            return [(symbol, bar_date, close) for bar_date, close in zip(data.index, data['Close'].to_numpy(dtype=np.float64))]
+
+        bars = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(last_dates) or 1))) as executor:
+            for symbol_bars in executor.map(fetch, last_dates.items()):
+                bars.extend(symbol_bars)
+        return self.push_bars(bars)
+
+    def _groups(self, streams):
+        groups = {}
+        for stream in streams:
+            groups.setdefault(id(stream.entry), (stream.entry, []))[1].append(stream)
+        return groups.values()
+
+    def _step(self, streams):
+        """Avança em um passo o estado dos símbolos a partir do último fechamento recebido."""
+        events = {}
+        if not streams:
+            return events
+        with timed('stream_step'):
+            for entry, group in self._groups(streams):
+                engine = self._engine(entry)
+                state = [(np.stack([stream.state[layer][0] for stream in group]), np.stack([stream.state[layer][1] for stream in group]))
+                         for layer in range(len(group[0].state))]
+                closes = np.array([[stream.window[stream.position - 1]] for stream in group]) # Fechamento mais recente
+                output, state = engine.step(entry.scaler.transform(closes), state)
+                events.update(self._finish(entry, engine, group, output, state))
+                self.stats['steps'] += len(group)
+        return events
+
+    def _resync(self, streams):
+        """Recalcula do zero o estado dos símbolos sobre a janela completa de fechamentos."""
+        events = {}
+        if not streams:
+            return events
+        with timed('stream_resync'):
+            for entry, group in self._groups(streams):
+                engine = self._engine(entry)
+                windows = entry.scaler.transform(np.stack([stream.ordered_window() for stream in group]).reshape(-1, 1)).reshape(len(group), -1)
+                state = engine.initial_state(len(group))
+                for t in range(windows.shape[1]):
+                    output, state = engine.step(windows[:, t:t + 1], state)
+                for stream in group:
+                    # Na inscrição, o deslocamento do símbolo: símbolos inscritos juntos não recalculam no mesmo pregão
+                    stream.since_resync, stream.resync_offset = stream.resync_offset, 0
+                events.update(self._finish(entry, engine, group, output, state))
+                self.stats['resyncs'] += len(group)
+        return events
+
+    def _finish(self, entry, engine, group, output, state):
+        """Guarda o novo estado, calcula as previsões do horizonte e publica os eventos."""
+        for index, stream in enumerate(group):
+            stream.state = [(h[index], c[index]) for h, c in state]
+
+        predicted = np.empty((len(group), self.horizon), dtype=np.float32)
+        predicted[:, 0] = output[:, 0]
+        rollout_state = state
+        for step in range(1, self.horizon): # Dias seguintes: a previsão anterior vira a entrada, a partir de uma cópia do estado
+            output, rollout_state = engine.step(output, rollout_state)
+            predicted[:, step] = output[:, 0]
+        prices = entry.scaler.inverse_transform(predicted.reshape(-1, 1)).reshape(len(group), self.horizon)
+
+        events = {}
+        for stream, symbol_prices in zip(group, prices):
+            event = dict(format_forecast(symbol_prices), symbol=stream.symbol, date=stream.last_date.date().isoformat(),
+                         close=float(stream.window[stream.position - 1]), model=f'{entry.symbol}@{entry.version}')
+            stream.forecast = event
+            events[stream.symbol] = event
+            self._publish(event)
+        increment('stream_events_total', len(events))
+        return events
+
+    def _publish(self, event):
+        self.stats['events'] += 1
+        for loop, queue, symbols in list(self._listeners):
+            if symbols is None or event['symbol'] in symbols:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+
+    def _offer(self, queue, event):
+        if queue.full(): # Cliente lento: descarta o evento mais antigo em vez de bloquear os demais
+            queue.get_nowait()
+            self.stats['dropped_events'] += 1
+        queue.put_nowait(event)
+
+    async def listen(self, symbols=None, heartbeat_seconds=15.0):
+        """Gera os eventos de previsão à medida que são publicados (ex: para um endpoint SSE).
+
+        Começa pela última previsão de cada símbolo pedido. Se nenhum evento chegar em
+        `heartbeat_seconds`, gera None (para o chamador manter a conexão viva).
+
+        Args:
+            symbols (list[str], optional): Símbolos de interesse. Padrão é todos.
+            heartbeat_seconds (float, optional): Intervalo máximo sem eventos. Padrão é 15 segundos.
+        """
+        symbols = frozenset(symbol.upper() for symbol in symbols) if symbols else None
+        queue = asyncio.Queue(maxsize=LISTENER_QUEUE_SIZE)
+        listener = (asyncio.get_running_loop(), queue, symbols)
+        with self._lock:
+            self._listeners.add(listener)
+            snapshot = [stream.forecast for symbol, stream in self._streams.items()
+                        if stream.forecast is not None and (symbols is None or symbol in symbols)]
+        try:
+            for event in snapshot:
+                yield event
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._listeners.discard(listener)
+
+    def get_forecasts(self, symbols=None):
+        """Retorna a última previsão de cada símbolo acompanhado (ou dos pedidos)."""
+        with self._lock:
+            wanted = [symbol.upper() for symbol in symbols] if symbols else list(self._streams)
+            return {symbol: self._streams[symbol].forecast for symbol in wanted if symbol in self._streams}
+
+    def get_stats(self):
+        """Retorna os contadores do acompanhamento, o número de símbolos e de clientes conectados."""
+        with self._lock:
+            return dict(self.stats, symbols=len(self._streams), listeners=len(self._listeners))
+
+
+_FORECASTER = None
+_FORECASTER_LOCK = threading.Lock()
+
+
+def get_streaming_forecaster():
+    """Retorna o acompanhamento de previsões do processo, criando-o na primeira chamada."""
+    global _FORECASTER
+    with _FORECASTER_LOCK:
+        if _FORECASTER is None:
+            _FORECASTER = StreamingForecaster()
+        return _FORECASTER
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import pandas as pd
+    from src.data_fetcher import stub_history
+    from src.data_handler import set_fetch_function
+    from src.logger import configure_logging
+    from src.model_predict import forecast_scaled_windows, load_model_for_api, load_scaler_for_api
+
+    parser = argparse.ArgumentParser(description='Compara o custo por pregão do acompanhamento incremental com o da janela completa (dados sintéticos).')
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--bars', type=int, default=120)
+    args = parser.parse_args()
+
+    configure_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+    set_fetch_function(lambda symbol, start, end, **kwargs: stub_history(symbol, start, end))
+    load_scaler_for_api()
+    load_model_for_api(backend='numpy')
+
+    symbols = [f'S{i:04d}' for i in range(args.symbols)]
+    history = {symbol: stub_history(symbol, '2023-01-01', '2025-01-01')['Close'] for symbol in symbols}
+    dates = history[symbols[0]].index
+    split = len(dates) - args.bars
+
+    forecaster = StreamingForecaster()
+    forecaster.subscribe(symbols, end_date=(dates[split - 1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+
+    closes = np.stack([history[symbol].to_numpy() for symbol in symbols], axis=1) # (pregões, símbolos)
+    rounds = [list(zip(symbols, [bar_date] * len(symbols), closes[index])) for index, bar_date in enumerate(dates) if index >= split]
+    started = time.perf_counter()
+    for bars in rounds:
+        events = forecaster.push_bars(bars)
+    stream_seconds = (time.perf_counter() - started) / args.bars
+
+    # Referência: a janela completa de cada símbolo normalizada e prevista em um único lote
+    entry = resolve_model(symbols[0])
+    started = time.perf_counter()
+    windows = np.stack([history[symbol].to_numpy()[-forecaster.time_steps:] for symbol in symbols])
+    X_input = entry.scaler.transform(windows.reshape(-1, 1)).reshape(len(symbols), -1, 1).astype(np.float32)
+    full = forecast_scaled_windows(X_input, entry=entry)[:, 0]
+    full_seconds = time.perf_counter() - started
+
+    diff = max(abs(events[symbol]['predicted_price'] - price) / price for symbol, price in zip(symbols, full))
+    print(f'{args.symbols} símbolos: {stream_seconds * 1000:.1f} ms por pregão no modo incremental '
+          f'(com recálculos a cada {forecaster.resync_bars} pregões) contra {full_seconds * 1000:.1f} ms com a janela completa. '
+          f'Maior diferença relativa da previsão no último pregão: {diff:.4%}.')
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Os testes importam os módulos como `src.*`, a partir da raiz do repositório
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
@@ -0,0 +1,14 @@
+"""Importar a API não carrega bibliotecas pesadas: pandas e TensorFlow são importados sob demanda."""
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_app_import_does_not_load_pandas_or_tensorflow():
+    code = 'import sys, app; print(sorted(name for name in ("pandas", "tensorflow", "sklearn") if name in sys.modules))'
+    env = dict(os.environ, INFERENCE_BACKEND='numpy', USE_MODEL_REGISTRY='0', PYTHONPATH=ROOT_DIR)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '[]'
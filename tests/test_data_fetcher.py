@@ -0,0 +1,141 @@
+"""Camada assíncrona de download: retentativa com backoff em rate limit, fallback entre provedores e token bucket."""
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from src import data_fetcher
+from src.data_fetcher import AsyncDataFetcher, ProviderError, RateLimitError, StubProvider, TokenBucket, YahooProvider, stub_history
+
+START_DATE, END_DATE = '2024-01-01', '2024-03-01'
+
+
+class FlakyProvider(StubProvider):
+    """Provedor local que falha nas primeiras `failures` chamadas com a exceção dada."""
+
+    def __init__(self, failures, error=RateLimitError, name='flaky', **kwargs):
+        super().__init__(latency=0, rate_limit_probability=0, **kwargs)
+        self.name = name
+        self.failures = failures
+        self.error = error
+
+    async def fetch(self, client, symbol, start_date, end_date):
+        if self.calls < self.failures:
+            self.calls += 1
+            raise self.error(f'{self.name}: falha simulada.')
+        return await super().fetch(client, symbol, start_date, end_date)
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class FakeClient:
+    """Cliente HTTP local: devolve as respostas dadas, em ordem."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    async def get(self, url, **kwargs):
+        self.requests += 1
+        return self.responses.pop(0)
+
+
+def _chart_payload(dates, closes):
+    timestamps = [int(pd.Timestamp(day, tz='UTC').timestamp()) for day in dates]
+    return {'chart': {'result': [{'timestamp': timestamps, 'meta': {'gmtoffset': 0},
+                                  'indicators': {'quote': [{'close': closes}]}}], 'error': None}}
+
+
+def _fetch(fetcher, symbol='AAPL', **kwargs):
+    return asyncio.run(fetcher.fetch(symbol, START_DATE, END_DATE, **kwargs))
+
+
+def test_http_429_is_retried_with_backoff():
+    fetcher = AsyncDataFetcher(providers=[YahooProvider()], max_retries=3, backoff_base=0.05)
+    fetcher._client = FakeClient([FakeResponse(429), FakeResponse(429),
+                                  FakeResponse(200, _chart_payload(['2024-01-02', '2024-01-03'], [10.0, 11.0]))])
+    started = time.perf_counter()
+    data = _fetch(fetcher)
+    elapsed = time.perf_counter() - started
+
+    assert list(data['Close']) == [10.0, 11.0]
+    assert fetcher._client.requests == 3
+    assert (fetcher.stats['rate_limited'], fetcher.stats['retries'], fetcher.stats['fallbacks']) == (2, 2, 0)
+    assert elapsed >= 0.5 * (0.05 + 0.1) # Esperas de 0.05 e 0.1 s, com jitter de até metade
+
+
+def test_backoff_is_capped_and_retries_are_bounded():
+    provider = FlakyProvider(failures=10)
+    fetcher = AsyncDataFetcher(providers=[provider], max_retries=3, backoff_base=30)
+    started = time.perf_counter()
+    with pytest.raises(RuntimeError, match='flaky'):
+        _fetch(fetcher, backoff_max=0.01)
+    assert time.perf_counter() - started < 1 # Sem o teto, a espera seria de 30 e 60 s
+    assert provider.calls == 3
+    assert (fetcher.stats['rate_limited'], fetcher.stats['retries'], fetcher.stats['failures']) == (3, 2, 1)
+
+
+@pytest.mark.parametrize('error', [RateLimitError, ProviderError])
+def test_falls_back_to_next_provider(error):
+    primary, fallback = FlakyProvider(failures=10, error=error), StubProvider(latency=0, rate_limit_probability=0)
+    fetcher = AsyncDataFetcher(providers=[primary, fallback], max_retries=2, backoff_base=0)
+    pd.testing.assert_frame_equal(_fetch(fetcher), stub_history('AAPL', START_DATE, END_DATE))
+    assert primary.calls == (2 if error is RateLimitError else 1) # Só rate limit é retentado no mesmo provedor
+    assert fallback.calls == 1
+    assert fetcher.stats['fallbacks'] == 1 and fetcher.stats['failures'] == 0
+
+
+def test_empty_response_falls_back_to_next_provider():
+    fetcher = AsyncDataFetcher(providers=[YahooProvider(), StubProvider(latency=0, rate_limit_probability=0)])
+    fetcher._client = FakeClient([FakeResponse(404)])
+    pd.testing.assert_frame_equal(_fetch(fetcher), stub_history('AAPL', START_DATE, END_DATE))
+    assert fetcher.stats['fallbacks'] == 1
+
+
+def test_sync_entry_point_falls_back_to_stub(monkeypatch):
+    monkeypatch.setattr(data_fetcher, 'DATA_PROVIDERS', 'alphavantage,stub')
+    monkeypatch.delenv('ALPHA_KEY', raising=False) # Alpha Vantage sem chave falha sem ir à rede
+    data_fetcher.close_data_fetcher()
+    try:
+        data = data_fetcher.fetch_with_async_providers('AAPL', START_DATE, END_DATE)
+        fetcher, _ = data_fetcher.get_data_fetcher()
+        assert [provider.name for provider in fetcher.providers] == ['alphavantage', 'stub']
+        assert fetcher.stats['fallbacks'] == 1
+    finally:
+        data_fetcher.close_data_fetcher()
+    pd.testing.assert_frame_equal(data, stub_history('AAPL', START_DATE, END_DATE))
+
+
+def test_token_bucket_limits_rate_after_burst():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=5)
+        started = time.monotonic()
+        times = []
+        for _ in range(10):
+            await bucket.acquire()
+            times.append(time.monotonic() - started)
+        return times
+
+    times = asyncio.run(scenario())
+    assert times[4] < 0.05 # A rajada inicial não espera
+    assert times[-1] >= (10 - 5) / 50 * 0.9 # As demais saem a 50 por segundo
+
+
+def test_provider_rate_limits_concurrent_fetches():
+    provider = StubProvider(latency=0, rate_limit_probability=0, rate=20)
+    fetcher = AsyncDataFetcher(providers=[provider], max_concurrency=8)
+    started = time.perf_counter()
+    results = asyncio.run(fetcher.fetch_many([f'S{i}' for i in range(6)], START_DATE, END_DATE))
+    elapsed = time.perf_counter() - started
+
+    assert all(isinstance(result, pd.DataFrame) and not result.empty for result in results.values())
+    assert provider.calls == 6
+    assert elapsed >= (6 - provider.burst) / 20 * 0.9 # Apesar da concorrência de 8, no máximo 20 por segundo
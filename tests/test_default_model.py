@@ -0,0 +1,82 @@
+"""Retreino do modelo padrão (`set_default`): os pesos e a versão do motor NumPy acompanham o novo `.keras`."""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from src import data_handler, model_building, model_predict, model_registry
+from src.forecast_store import ForecastStore, write_store
+from src.numpy_lstm import artifact_version
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+END_DATE = '2021-06-01'
+
+
+def _synthetic_history(symbol, start_date, end_date, **kwargs):
+    index = pd.bdate_range(start_date, end_date, inclusive='left')
+    prices = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, len(index)))
+    return pd.DataFrame({'Close': prices}, index=index)
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    """Cópia do modelo padrão em um diretório temporário, com um treino curto e sem rede."""
+    models = tmp_path / 'models'
+    models.mkdir()
+    for name in ('lstm_model.keras', 'lstm_model.npz', 'Scaler_model.pkl'):
+        shutil.copy(f'{ROOT_DIR}/models/{name}', models / name)
+    (models / 'hyperparameters.json').write_text(json.dumps({'units': 8, 'batch_size': 64, 'epochs': 1, 'time_steps': 60}))
+    monkeypatch.chdir(tmp_path) # `main` grava o modelo padrão e os checkpoints em models/
+    monkeypatch.setattr(model_registry, 'REGISTRY_DIR', str(models / 'registry'))
+    monkeypatch.setattr(data_handler, '_FETCH_FUNCTION', _synthetic_history)
+    monkeypatch.setattr(data_handler, 'PRICE_CACHE_ENABLED', False)
+    for name in ('MODEL', 'SCALER', '_DEFAULT_ENTRY', '_DEFAULT_TIME_STEPS'): # Estado global da API, restaurado ao fim
+        monkeypatch.setattr(model_predict, name, getattr(model_predict, name))
+    monkeypatch.setattr(model_predict, '_DEFAULT_VERSIONS', dict(model_predict._DEFAULT_VERSIONS))
+    return str(models)
+
+
+def _load_default(model_dir, backend):
+    model_predict.load_scaler_for_api(model_dir)
+    model_predict.load_model_for_api(model_dir, backend=backend)
+    return model_predict.get_default_entry()
+
+
+def test_set_default_reexports_numpy_weights(model_dir):
+    windows = np.random.default_rng(1).random((8, 60, 1), dtype=np.float32)
+    before = _load_default(model_dir, 'numpy')
+    before_version, before_output = before.version, before.model.predict_on_batch(windows)
+    store_path = f'{model_dir}/forecasts.npz'
+    write_store([('AAPL', '2021-02-01', '2021-05-28', f'default@{before_version}', 60, np.ones(5))], 5, path=store_path)
+
+    model_building.main('TEST', set_default=True, start_date='2020-01-01', end_date=END_DATE)
+
+    after = _load_default(model_dir, 'numpy')
+    assert after.version != before_version
+    assert after.model.source_version == artifact_version(f'{model_dir}/lstm_model.keras')
+    assert not np.allclose(after.model.predict_on_batch(windows), before_output)
+    keras_entry = _load_default(model_dir, 'keras')
+    assert keras_entry.version == after.version # Os dois motores do mesmo treino compartilham a versão
+    np.testing.assert_allclose(after.model.predict_on_batch(windows), keras_entry.model.predict_on_batch(windows), atol=1e-5)
+
+    store = ForecastStore(path=store_path, check_seconds=0) # Previsões do treino anterior não são servidas
+    assert store.lookup('AAPL', '2021-01-01', END_DATE, 5, after) is None
+    assert store.stats['model_mismatches'] == 1
+
+
+def test_stale_numpy_weights_keep_their_version(model_dir):
+    from tensorflow.keras.models import load_model
+
+    before = _load_default(model_dir, 'numpy')
+    keras_model = load_model(f'{model_dir}/lstm_model.keras', compile=False)
+    keras_model.layers[-1].set_weights([weight + 1 for weight in keras_model.layers[-1].get_weights()])
+    keras_model.save(f'{model_dir}/lstm_model.keras') # Novo .keras sem reexportar os pesos do motor NumPy
+
+    after = _load_default(model_dir, 'numpy')
+    assert after.version == before.version
+    assert _load_default(model_dir, 'keras').version != before.version
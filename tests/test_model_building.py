@@ -0,0 +1,10 @@
+"""Repasse das opções do CLI para a atualização incremental em `train_universe`."""
+from src import model_building
+
+
+def test_incremental_train_symbol_passes_epochs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(model_building, 'update', lambda symbol, **kwargs: calls.append((symbol, kwargs)) or {'status': 'updated'})
+    result = model_building._train_symbol('AAPL', '2020-01-01', '2025-01-02', 'rodada', incremental=True, epochs=12)
+    assert result == {'status': 'updated'}
+    assert calls == [('AAPL', {'end_date': '2025-01-02', 'epochs': 12, 'run_id': 'rodada'})]
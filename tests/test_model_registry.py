@@ -0,0 +1,123 @@
+"""Carregamento sob demanda do `ModelRegistry`: locks por versão e falhas de carregamento."""
+import threading
+
+import pytest
+
+from src import model_registry
+from src.model_registry import ModelEntry, ModelRegistry
+
+
+@pytest.fixture
+def registry_dir(tmp_path):
+    symbol_dir = tmp_path / 'AAPL'
+    symbol_dir.mkdir()
+    (symbol_dir / model_registry.LATEST_FILENAME).write_text('v1')
+    return str(tmp_path)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+    outcome = {'fail': True}
+
+    def load_entry(symbol, version, registry_dir=None):
+        calls.append((symbol, version))
+        if outcome['fail']:
+            raise RuntimeError(f'Erro ao carregar o modelo de {symbol} do registro: arquivo corrompido')
+        return ModelEntry(symbol, version, model=None, scaler=None)
+
+    monkeypatch.setattr(model_registry, 'load_entry', load_entry)
+    return calls, outcome
+
+
+def test_load_failure_is_cached_and_lock_released(registry_dir, loads):
+    calls, _ = loads
+    registry = ModelRegistry(registry_dir=registry_dir, failure_ttl=60)
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match='arquivo corrompido'):
+            registry.get('AAPL')
+    assert len(calls) == 1
+    assert registry._loading_locks == {}
+    assert registry.stats['load_failures'] == 1
+
+
+def test_load_failure_expires(registry_dir, loads):
+    calls, outcome = loads
+    registry = ModelRegistry(registry_dir=registry_dir, failure_ttl=0)
+    with pytest.raises(RuntimeError):
+        registry.get('AAPL')
+    outcome['fail'] = False
+    entry = registry.get('AAPL')
+    assert entry.version == 'v1'
+    assert registry.get('AAPL') is entry
+    assert len(calls) == 2
+    assert registry._loading_locks == {}
+
+
+def test_invalidate_clears_load_failures(registry_dir, loads):
+    calls, outcome = loads
+    registry = ModelRegistry(registry_dir=registry_dir, failure_ttl=60)
+    with pytest.raises(RuntimeError):
+        registry.get('AAPL')
+    outcome['fail'] = False
+    registry.invalidate('AAPL')
+    assert registry.get('AAPL').version == 'v1'
+    assert len(calls) == 2
+
+
+class _RecordingLocks(dict):
+    """Dicionário de locks de carregamento que avisa quando uma thread pede o lock de uma versão."""
+
+    def __init__(self):
+        super().__init__()
+        self.requested = threading.Semaphore(0)
+
+    def setdefault(self, key, default=None):
+        lock = super().setdefault(key, default)
+        self.requested.release()
+        return lock
+
+
+def test_waiter_does_not_drop_lock_of_later_load(registry_dir, monkeypatch):
+    entered = {call: threading.Event() for call in (1, 2, 3)}
+    gates = {call: threading.Event() for call in (1, 2, 3)}
+    calls = []
+
+    def load_entry(symbol, version, registry_dir=None):
+        calls.append(version)
+        call = len(calls)
+        entered[call].set()
+        gates[call].wait(5)
+        if call == 1:
+            raise RuntimeError('arquivo corrompido')
+        return ModelEntry(symbol, version, model=None, scaler=None)
+
+    monkeypatch.setattr(model_registry, 'load_entry', load_entry)
+    registry = ModelRegistry(registry_dir=registry_dir, failure_ttl=0)
+    registry._loading_locks = locks = _RecordingLocks()
+
+    def get():
+        try:
+            registry.get('AAPL')
+        except RuntimeError:
+            pass
+
+    first, waiter, later = (threading.Thread(target=get) for _ in range(3))
+    first.start()
+    assert entered[1].wait(5)
+    waiter.start() # Aguarda o lock do primeiro carregamento
+    assert locks.requested.acquire(timeout=5) and locks.requested.acquire(timeout=5)
+    gates[1].set() # O primeiro falha e remove seu lock; o que aguardava carrega de novo
+    first.join(5)
+    assert entered[2].wait(5)
+    later.start() # Cria um novo lock e carrega em paralelo
+    assert entered[3].wait(5)
+    later_lock = locks[('AAPL', 'v1')]
+
+    gates[2].set()
+    waiter.join(5)
+    assert locks.get(('AAPL', 'v1')) is later_lock
+    gates[3].set()
+    later.join(5)
+    assert locks == {}
+    assert len(calls) == 3
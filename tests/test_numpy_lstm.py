@@ -0,0 +1,54 @@
+"""Paridade do motor NumPy (`src/numpy_lstm.py`) com o modelo Keras salvo em `models/`."""
+import os
+
+import numpy as np
+import pytest
+
+from src.numpy_lstm import NumpyLSTMModel, export_weights, load_numpy_model
+
+pytest.importorskip('tensorflow')
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+ATOL = 1e-5 # Diferenças medidas: ~3e-7 no forward pass e ~5e-7 no rollout
+
+
+@pytest.fixture(scope='module')
+def keras_model():
+    from tensorflow.keras.models import load_model
+    return load_model(os.path.join(MODEL_DIR, 'lstm_model.keras'), compile=False)
+
+
+@pytest.fixture(scope='module')
+def windows(keras_model):
+    return np.random.default_rng(0).random((32, keras_model.input_shape[1], 1), dtype=np.float32)
+
+
+def test_predict_on_batch_matches_keras(keras_model, windows):
+    expected = np.asarray(keras_model.predict_on_batch(windows))
+    for model in (load_numpy_model(MODEL_DIR, 'float32'), NumpyLSTMModel.from_keras(keras_model)):
+        np.testing.assert_allclose(model.predict_on_batch(windows), expected, atol=ATOL)
+
+
+def test_rollout_matches_keras(keras_model, windows):
+    from src.model_predict import _build_rollout_fn
+
+    horizon = 10
+    expected = _build_rollout_fn(keras_model)(windows, np.int32(horizon)).numpy()
+    actual = load_numpy_model(MODEL_DIR, 'float32').rollout(windows, horizon)
+    assert actual.shape == (len(windows), horizon)
+    np.testing.assert_allclose(actual, expected, atol=ATOL)
+
+
+def test_step_matches_predict_on_batch(windows):
+    model = load_numpy_model(MODEL_DIR, 'float32')
+    state = model.initial_state(len(windows))
+    for t in range(windows.shape[1]):
+        output, state = model.step(windows[:, t, :], state)
+    np.testing.assert_allclose(output, model.predict_on_batch(windows), atol=ATOL)
+
+
+def test_export_round_trip(keras_model, windows, tmp_path):
+    path = tmp_path / 'lstm_model.npz' # Não toca nos pesos versionados em models/
+    export_weights(keras_model, str(path))
+    np.testing.assert_array_equal(NumpyLSTMModel.load(str(path)).predict_on_batch(windows),
+                                  NumpyLSTMModel.from_keras(keras_model).predict_on_batch(windows))
@@ -0,0 +1,84 @@
+"""Agrupamento do `PredictionBatcher` por modelo e faixa de horizonte."""
+import asyncio
+import time
+
+import numpy as np
+
+from src.prediction_batcher import PredictionBatcher, _horizon_bucket
+
+
+def test_horizon_bucket():
+    assert [_horizon_bucket(h) for h in (1, 2, 3, 4, 5, 8, 9, 250)] == [1, 2, 4, 4, 8, 8, 16, 256]
+
+
+def test_short_horizons_do_not_wait_for_long_rollouts():
+    calls = []
+
+    def predict_fn(X, horizon, entry):
+        calls.append((len(X), horizon))
+        time.sleep(0.001 * horizon) # Rollout proporcional ao horizonte
+        return np.tile(np.arange(horizon, dtype=np.float64), (len(X), 1)) + X[:, -1, :]
+
+    async def scenario():
+        batcher = PredictionBatcher(predict_fn, max_wait_ms=20)
+        finished = {}
+
+        async def request(value, horizon):
+            result = await batcher.submit(np.full((60, 1), value), horizon)
+            finished[(value, horizon)] = time.monotonic()
+            return result
+
+        results = await asyncio.gather(request(0.0, 200), request(1.0, 1), request(2.0, 3), request(3.0, 4))
+        await batcher.stop()
+        return results, finished
+
+    results, finished = asyncio.run(scenario())
+    assert sorted(calls) == [(1, 1), (1, 200), (2, 4)]
+    assert [len(result) for result in results] == [200, 1, 3, 4]
+    np.testing.assert_allclose(results[2], [2.0, 3.0, 4.0])
+    assert finished[(1.0, 1)] < finished[(0.0, 200)]
+    assert finished[(2.0, 3)] < finished[(0.0, 200)]
+
+
+def test_short_request_arriving_during_long_rollout_finishes_first():
+    def predict_fn(X, horizon, entry):
+        time.sleep(0.5 if horizon > 100 else 0.001) # Rollout longo e lento
+        return np.zeros((len(X), horizon))
+
+    async def scenario():
+        batcher = PredictionBatcher(predict_fn, max_wait_ms=1, max_concurrent_groups=2)
+        finished = []
+
+        async def request(horizon):
+            await batcher.submit(np.zeros((60, 1)), horizon)
+            finished.append(horizon)
+
+        long_request = asyncio.ensure_future(request(250))
+        await asyncio.sleep(0.1) # O rollout de 250 dias já está no executor
+        started = time.monotonic()
+        await request(1)
+        short_seconds = time.monotonic() - started
+        await long_request
+        await batcher.stop()
+        return finished, short_seconds
+
+    finished, short_seconds = asyncio.run(scenario())
+    assert finished == [1, 250]
+    assert short_seconds < 0.2
+
+
+def test_stop_delivers_running_groups():
+    def predict_fn(X, horizon, entry):
+        time.sleep(0.05)
+        return np.ones((len(X), horizon))
+
+    async def scenario():
+        batcher = PredictionBatcher(predict_fn, max_wait_ms=1, max_concurrent_groups=1)
+        pending = [asyncio.ensure_future(batcher.submit(np.zeros((60, 1)), horizon)) for horizon in (1, 2, 8)]
+        await asyncio.sleep(0.02)
+        await batcher.stop()
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert len(results) == 3
+    assert all(isinstance(result, (np.ndarray, RuntimeError)) for result in results)
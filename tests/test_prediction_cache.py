@@ -0,0 +1,52 @@
+"""Coalescência de `PredictionCache.get_or_compute`: cancelamento do primeiro chamador e erros do cálculo."""
+import asyncio
+
+import pytest
+
+from src.prediction_cache import PredictionCache
+
+KEY = ('AAPL', '2025-01-02', 60, 'default@abc123', 5)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path):
+    return PredictionCache(db_path=str(tmp_path / 'cache.db') if request.param == 'sqlite' else None)
+
+
+def test_owner_cancel_does_not_fail_waiters(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {'prices': [1.0]}
+
+    async def scenario():
+        owner = asyncio.ensure_future(cache.get_or_compute(KEY, compute))
+        await asyncio.sleep(0.02)
+        waiters = [asyncio.ensure_future(cache.get_or_compute(KEY, compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        results = await asyncio.gather(*waiters)
+        return owner, results
+
+    owner, results = asyncio.run(scenario())
+    assert owner.cancelled()
+    assert results == [{'prices': [1.0]}] * 3
+    assert len(calls) == 1
+    assert cache.get(KEY) == {'prices': [1.0]}
+    assert cache.get_stats()['coalesced'] == 3
+
+
+def test_compute_error_reaches_every_caller(cache):
+    async def compute():
+        await asyncio.sleep(0.02)
+        raise ValueError('falhou')
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_compute(KEY, compute) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cache._inflight == {}
+    assert cache.get(KEY) is None
@@ -0,0 +1,77 @@
+"""Cache local de históricos: acertos, preenchimento de lacunas e respostas vazias ou incompletas do provedor."""
+import pandas as pd
+import pytest
+
+from src import data_handler, price_cache
+from src.data_fetcher import stub_history
+
+
+class FakeProvider:
+    """Fonte local no lugar da rede: registra as chamadas e pode devolver respostas ruins uma vez."""
+
+    def __init__(self):
+        self.calls = []
+        self.responses = [] # Transformações aplicadas (uma por chamada) antes do histórico normal
+
+    def __call__(self, symbol, start_date, end_date, **kwargs):
+        self.calls.append((start_date, end_date))
+        data = stub_history(symbol, start_date, end_date)
+        return self.responses.pop(0)(data) if self.responses else data
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(data_handler, 'PRICE_CACHE_ENABLED', True)
+    monkeypatch.setattr(data_handler, '_FETCH_FUNCTION', data_handler._FETCH_FUNCTION) # Restaurada ao fim
+    provider = FakeProvider()
+    data_handler.set_fetch_function(provider)
+    price_cache.reset_cache_stats()
+    yield provider
+    price_cache.reset_cache_stats()
+
+
+def _download(start_date, end_date):
+    data = data_handler.download_stock_data('AAPL', start_date, end_date)
+    pd.testing.assert_frame_equal(data, stub_history('AAPL', start_date, end_date), check_freq=False)
+    return data
+
+
+def test_repeated_request_is_a_cache_hit(provider):
+    _download('2023-01-01', '2023-03-01')
+    _download('2023-01-01', '2023-03-01')
+    _download('2023-01-15', '2023-02-15') # Dentro do intervalo coberto
+    assert provider.calls == [('2023-01-01', '2023-03-01')]
+    stats = price_cache.get_cache_stats()
+    assert (stats['misses'], stats['hits'], stats['network_fetches']) == (1, 2, 1)
+
+
+def test_only_missing_gaps_are_fetched(provider):
+    _download('2023-01-01', '2023-03-01')
+    _download('2022-11-01', '2023-05-01')
+    assert provider.calls[1:] == [('2022-11-01', '2023-01-01'), ('2023-03-01', '2023-05-01')]
+    _download('2022-11-01', '2023-05-01')
+    assert len(provider.calls) == 3
+    assert price_cache.get_cache_stats()['partial_hits'] == 1
+
+
+def test_empty_response_is_not_cached_as_covered(provider):
+    _download('2023-01-01', '2023-03-01')
+    provider.responses.append(lambda data: data.iloc[:0]) # Falha transitória numa lacuna de dias úteis
+    assert data_handler.download_stock_data('AAPL', '2023-01-01', '2023-03-06').index[-1] == pd.Timestamp('2023-02-28')
+    _download('2023-01-01', '2023-03-06')
+    assert provider.calls[1:] == [('2023-03-01', '2023-03-06')] * 2
+
+
+def test_incomplete_response_is_fetched_again(provider):
+    provider.responses.append(lambda data: data.iloc[:-2]) # Provedor ainda sem as duas últimas barras
+    data_handler.download_stock_data('AAPL', '2023-01-01', '2023-03-01')
+    _download('2023-01-01', '2023-03-01')
+    assert provider.calls == [('2023-01-01', '2023-03-01'), ('2023-02-25', '2023-03-01')]
+
+
+def test_empty_weekend_gap_is_covered(provider):
+    _download('2023-01-01', '2023-03-04')
+    _download('2023-01-01', '2023-03-06') # Sábado e domingo: vazio não é falha
+    _download('2023-01-01', '2023-03-06')
+    assert provider.calls == [('2023-01-01', '2023-03-04'), ('2023-03-04', '2023-03-06')]
@@ -0,0 +1,103 @@
+"""Acompanhamento incremental: passo por pregão contra o forward pass completo e recálculos espalhados."""
+import os
+import threading
+
+import joblib
+import numpy as np
+import pytest
+
+from src import data_handler, streaming
+from src.data_fetcher import stub_history
+from src.model_registry import ModelEntry
+from src.numpy_lstm import NumpyLSTMModel
+from src.streaming import StreamingForecaster
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIME_STEPS = 20 # Janela curta: o motor aceita qualquer tamanho e o teste fica rápido
+SUBSCRIBE_END = '2024-01-02'
+
+
+@pytest.fixture
+def entry(monkeypatch):
+    entry = ModelEntry('default', 'teste', NumpyLSTMModel.load(os.path.join(ROOT_DIR, 'models', 'lstm_model.npz')),
+                       joblib.load(os.path.join(ROOT_DIR, 'models', 'Scaler_model.pkl')), time_steps=TIME_STEPS)
+    monkeypatch.setattr(streaming, 'resolve_model', lambda symbol: entry)
+    monkeypatch.setattr(data_handler, '_FETCH_FUNCTION', lambda symbol, start, end, **kwargs: stub_history(symbol, start, end))
+    monkeypatch.setattr(data_handler, 'PRICE_CACHE_ENABLED', False)
+    return entry
+
+
+def _bars(symbols, count):
+    """Os `count` pregões seguintes à inscrição, em rodadas (uma lista de pregões por data)."""
+    history = {symbol: stub_history(symbol, SUBSCRIBE_END, '2024-06-01')['Close'].iloc[:count] for symbol in symbols}
+    dates = history[symbols[0]].index
+    return [[(symbol, bar_date, history[symbol].iloc[index]) for symbol in symbols] for index, bar_date in enumerate(dates)]
+
+
+def _forward(entry, closes):
+    """Previsão de 1 dia do forward pass completo sobre os fechamentos, a partir do estado zero."""
+    X = entry.scaler.transform(np.asarray(closes, dtype=np.float64).reshape(-1, 1)).reshape(1, -1, 1).astype(np.float32)
+    return float(entry.scaler.inverse_transform(entry.model.predict_on_batch(X))[0, 0])
+
+
+def test_step_matches_full_forward_pass(entry):
+    forecaster = StreamingForecaster(time_steps=TIME_STEPS, resync_bars=0)
+    initial = forecaster.subscribe(['AAPL'], end_date=SUBSCRIBE_END)['AAPL']
+    closes = list(stub_history('AAPL', '2023-01-01', SUBSCRIBE_END)['Close'].iloc[-TIME_STEPS:])
+    assert initial['predicted_price'] == pytest.approx(_forward(entry, closes), rel=1e-5)
+
+    for bars in _bars(['AAPL'], 5): # Sem recálculos: o estado carrega todo o histórico desde a inscrição
+        event = forecaster.push_bars(bars)['AAPL']
+        closes.append(bars[0][2])
+        assert event['predicted_price'] == pytest.approx(_forward(entry, closes), rel=1e-5)
+    assert forecaster.stats['steps'] == 5
+
+
+def test_resync_uses_latest_window(entry):
+    forecaster = StreamingForecaster(time_steps=TIME_STEPS, resync_bars=1) # Recalcula a cada pregão
+    forecaster.subscribe(['AAPL'], end_date=SUBSCRIBE_END)
+    closes = list(stub_history('AAPL', '2023-01-01', SUBSCRIBE_END)['Close'].iloc[-TIME_STEPS:])
+    for bars in _bars(['AAPL'], 3):
+        event = forecaster.push_bars(bars)['AAPL']
+        closes = closes[1:] + [bars[0][2]]
+        assert event['predicted_price'] == pytest.approx(_forward(entry, closes), rel=1e-5)
+
+
+def test_resyncs_are_spread_across_bars(entry):
+    symbols = [f'S{i:03d}' for i in range(200)]
+    resync_bars = 10
+    forecaster = StreamingForecaster(time_steps=TIME_STEPS, resync_bars=resync_bars)
+    forecaster.subscribe(symbols, end_date=SUBSCRIBE_END)
+    initial = forecaster.stats['resyncs']
+
+    per_bar = []
+    for bars in _bars(symbols, 2 * resync_bars):
+        before = forecaster.stats['resyncs']
+        forecaster.push_bars(bars)
+        per_bar.append(forecaster.stats['resyncs'] - before)
+    assert initial == len(symbols)
+    assert sum(per_bar) == 2 * len(symbols) # Cada símbolo recalcula uma vez a cada `resync_bars` pregões
+    assert max(per_bar) < len(symbols) / 2 # E não todos no mesmo pregão
+
+
+def test_push_bars_resolves_models_outside_the_lock(entry, monkeypatch):
+    forecaster = StreamingForecaster(time_steps=TIME_STEPS, resync_bars=0)
+    forecaster.subscribe(['AAPL', 'MSFT'], end_date=SUBSCRIBE_END)
+    calls = []
+
+    def try_lock(acquired):
+        acquired.append(forecaster._lock.acquire(timeout=1))
+        if acquired[-1]:
+            forecaster._lock.release()
+
+    def resolve_model(symbol): # Outra thread (ex: outro símbolo) consegue o lock enquanto o modelo é carregado
+        acquired = []
+        thread = threading.Thread(target=try_lock, args=(acquired,))
+        thread.start()
+        thread.join()
+        calls.append((symbol, acquired[0]))
+        return entry
+
+    monkeypatch.setattr(streaming, 'resolve_model', resolve_model)
+    forecaster.push_bars([bar for bars in _bars(['AAPL', 'MSFT'], 3) for bar in bars])
+    assert sorted(calls) == [('AAPL', True), ('MSFT', True)] # Uma vez por símbolo, sem o lock
@@ -0,0 +1,71 @@
+"""Equivalência entre `build_windows` (vetorizada) e o laço original `_create_sequences_loop`."""
+import numpy as np
+import pytest
+
+from src.data_handler import build_windows
+
+TIME_STEPS = 60
+
+
+def _create_sequences_loop(data, time_steps):
+    """Implementação original (laço em Python) da criação de sequências, usada como referência."""
+    X, y = [], []
+    for i in range(time_steps, len(data)):
+        X.append(data[i-time_steps:i, 0])
+        y.append(data[i, 0])
+    return np.array(X), np.array(y)
+
+
+def _series(length, dtype, columns=1):
+    return np.random.default_rng(length).normal(100, 10, (length, columns)).astype(dtype)
+
+
+@pytest.mark.parametrize('input_dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('output_dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('length', [0, 1, TIME_STEPS - 1, TIME_STEPS, TIME_STEPS + 1, TIME_STEPS + 2, 500])
+@pytest.mark.parametrize('materialize', [False, True])
+def test_build_windows_matches_loop(length, input_dtype, output_dtype, materialize):
+    series = _series(length, input_dtype)
+    X_loop, y_loop = _create_sequences_loop(series, TIME_STEPS)
+    X, y = build_windows(series, TIME_STEPS, dtype=output_dtype, materialize=materialize)
+
+    expected_count = max(0, length - TIME_STEPS)
+    assert X.shape == (expected_count, TIME_STEPS, 1)
+    assert y.shape == (expected_count,)
+    assert X.dtype == output_dtype and y.dtype == output_dtype
+    if expected_count:
+        np.testing.assert_array_equal(X[:, :, 0], X_loop.astype(output_dtype))
+        np.testing.assert_array_equal(y, y_loop.astype(output_dtype))
+    else:
+        assert len(X_loop) == 0 and len(y_loop) == 0
+    if materialize:
+        assert X.flags['C_CONTIGUOUS']
+
+
+def test_build_windows_uses_first_column_and_1d_input():
+    series = _series(200, np.float64, columns=3)
+    X_loop, y_loop = _create_sequences_loop(series, TIME_STEPS)
+    for values in (series, series[:, 0]):
+        X, y = build_windows(values, TIME_STEPS, dtype=np.float64)
+        np.testing.assert_array_equal(X[:, :, 0], X_loop)
+        np.testing.assert_array_equal(y, y_loop)
+
+
+def test_windows_are_views_unless_materialized():
+    series = _series(200, np.float32)
+    X, _ = build_windows(series, TIME_STEPS)
+    assert not X.flags['OWNDATA'] and X.base is not None
+
+
+def test_streaming_memmap_path_without_extension(tmp_path):
+    pytest.importorskip('tensorflow')
+    import pandas as pd
+    from src.data_handler import preprocess_data_streaming
+
+    series = _series(400, np.float32)
+    _, test_dataset = preprocess_data_streaming(pd.DataFrame(series), TIME_STEPS, batch_size=64, memmap_path=str(tmp_path / 'series'))
+    assert (tmp_path / 'series.npy').exists() # A mesma extensão na gravação e na leitura
+    X, y = (np.concatenate(parts) for parts in zip(*[(X.numpy(), y.numpy()) for X, y in test_dataset]))
+    X_loop, y_loop = _create_sequences_loop(series[int(len(series) * 0.8):], TIME_STEPS)
+    np.testing.assert_array_equal(X[:, :, 0], X_loop)
+    np.testing.assert_array_equal(y.ravel(), y_loop)